@@ -0,0 +1,137 @@
+import pandas as pd
+import numpy as np
+from Joule_file_index import filter_file_index
+from Joule_profiler import profile_stage
+from plotting_and_fitting_helpers import get_mean_trend, get_time_to_threshold
+
+CELCIUS_TO_KELVIN = 273.15
+#Boltzmann constant in eV/K
+KB_EV = 8.617*10**-5
+#Relative capacities (%) the time to reach is found for
+ARRHENIUS_THRESHOLDS = [97.5, 95, 92.5, 90]
+
+
+@profile_stage("get_arrhenius_prediction", rows_fun=lambda args, output: len(output[1]))
+def get_arrhenius_prediction(file_index, sum_path=None, cell_type=None, soc=None, fit_temps=[45, 60], extrap_temp=24,
+                             thresholds=ARRHENIUS_THRESHOLDS, metric="RPT0.2C_2_D_capacity", time_grid=None,
+                             store_path=None):
+    """
+    This function predicts the capacity degradation at extrap_temp from the higher temperatures in
+    fit_temps for every (cell_type, SOC) group in the file index at once. It is the batched version
+    of get_predicted_temperature in the figure 2 notebook.
+
+    For each group and temperature the mean relative capacity trend is taken with get_mean_trend on
+    a time grid shared by all groups, giving a group x temperature x time array of capacity loss.
+    ln(capacity loss) vs 1/T is then fit at every group and time together with a closed form
+    least squares fit and extrapolated to extrap_temp, like the notebook does one group at a time.
+
+    The time to reach each relative capacity in thresholds is also found on the mean trends with
+    get_time_to_threshold, giving a group x temperature x threshold array. ln(rate) = ln(1/time)
+    vs 1/T is fit for every group and threshold, which gives an activation energy and the
+    predicted time to reach the threshold at extrap_temp.
+
+    Fits need 2 or more temperatures with data, otherwise the prediction is NaN. Unlike the notebook
+    no exception is raised so one group without enough data does not stop the others.
+
+    Args:
+    @file_index(pd.DataFrame): File index from Joule_file_index.build_file_index or load_file_index.
+        The summary files are loaded from its sum_file_path column
+    @sum_path(str): Not needed since the summary files are found through file_index, kept so
+        calls that pass it still work
+    @cell_type(str or list): Cell_type(s) to predict. None uses all.
+    @soc(int or list): SOC(s) to predict. None uses all.
+    @fit_temps([int]): the temperatures to fit the arrhenius slope to
+    @extrap_temp(int): The temperature to predict using the arrhenius slope fit on fit_temps
+    @thresholds([float]): relative capacities (%) to find the time to reach
+    @metric(str): capacity metric to use
+    @time_grid(np.array): Time points in weeks to predict at. If None 1000 points from 1 week
+        (all capacities are 100 at 0) to the longest test in the groups are used.
+    @store_path(str): Folder of the summary data store to read the cells from instead of the
+        summary files, see plotting_and_fitting_helpers.iter_sum_columns
+
+    Returns:
+    @time_array(np.array): Time array in weeks
+    @predicted_cap_dict(dict): (cell_type, soc) to the predicted capacity(%) array at extrap_temp
+        corresponding to time_array
+    @threshold_df(pd.DataFrame): a row per cell_type, SOC and threshold with the time in weeks to
+        reach it at each fit temperature, the arrhenius slope and intercept, the activation
+        energy(eV) and the predicted time(weeks) at extrap_temp
+    """
+    fit_index = filter_file_index(file_index, cell_type=cell_type, soc=soc, temperature=list(fit_temps), has_sum=True)
+    group_list = list(fit_index[["Cell_type", "SOC"]].drop_duplicates().itertuples(index=False, name=None))
+    fit_temps = np.array(fit_temps)
+    thresholds = np.array(thresholds, dtype=float)
+
+    if time_grid is None:
+        test_length = (pd.to_datetime(fit_index["sum_end_date"])-pd.to_datetime(fit_index["sum_start_date"])).dt.days/7
+        time_grid = np.linspace(1, max(test_length.max(), 1), 1000) if len(fit_index)>0 else np.linspace(1, 1, 1000)
+    time_array = np.asarray(time_grid, dtype=float)
+
+    #group x temperature x time array of the mean relative capacity. Missing temperatures stay nan
+    mean_cap_array = np.full((len(group_list), len(fit_temps), len(time_array)), np.nan)
+    for group_idx, (group_cell_type, group_soc) in enumerate(group_list):
+        group_index = fit_index[(fit_index["Cell_type"]==group_cell_type) & (fit_index["SOC"]==group_soc)]
+        for temp_idx, temp in enumerate(fit_temps):
+            temp_index = group_index[group_index["Temperature"]==temp]
+            if len(temp_index)==0:
+                continue
+            sum_obj_list = ["{}_sum.json".format(x) for x in temp_index["Cell_id"]]
+            mean_cap_array[group_idx, temp_idx, :] = get_mean_trend(sum_obj_list, sum_path, metric, True,
+                                                                    time_grid=time_array, file_index=fit_index,
+                                                                    store_path=store_path)[0]
+
+    inverse_T_array = 1/(fit_temps+CELCIUS_TO_KELVIN)
+    inverse_T_extrap = 1/(extrap_temp+CELCIUS_TO_KELVIN)
+
+    #Fit ln(capacity loss) vs 1/T at every group and time. ln of losses <=0 is not finite and is left out
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_cap_loss_array = np.log(100-mean_cap_array)
+    slope_array, intercept_array = _fit_lines(inverse_T_array, log_cap_loss_array, axis=1)
+    predicted_cap_array = 100-np.exp(slope_array*inverse_T_extrap+intercept_array)
+    predicted_cap_dict = {group: predicted_cap_array[group_idx] for group_idx, group in enumerate(group_list)}
+
+    #Fit ln(1/time to reach threshold) vs 1/T at every group and threshold
+    time_to_threshold_array = get_time_to_threshold(time_array, mean_cap_array, thresholds)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_rate_array = np.log(1/time_to_threshold_array)
+    rate_slope_array, rate_intercept_array = _fit_lines(inverse_T_array, log_rate_array, axis=1)
+
+    threshold_dict = {"Cell_type": np.repeat([group[0] for group in group_list], len(thresholds)),
+                      "SOC": np.repeat([group[1] for group in group_list], len(thresholds)),
+                      "threshold(%)": np.tile(thresholds, len(group_list))}
+    for temp_idx, temp in enumerate(fit_temps):
+        threshold_dict["time_{}C(weeks)".format(temp)] = time_to_threshold_array[:, temp_idx, :].ravel()
+    threshold_dict["num_temps"] = np.sum(np.isfinite(log_rate_array), axis=1).ravel()
+    threshold_dict["slope"] = rate_slope_array.ravel()
+    threshold_dict["intercept"] = rate_intercept_array.ravel()
+    threshold_dict["activation_energy(eV)"] = -rate_slope_array.ravel()*KB_EV
+    with np.errstate(over="ignore"):
+        threshold_dict["time_{}C_predicted(weeks)".format(extrap_temp)] = np.exp(-(rate_slope_array*inverse_T_extrap+rate_intercept_array)).ravel()
+    threshold_df = pd.DataFrame(threshold_dict)
+
+    return time_array, predicted_cap_dict, threshold_df
+
+def _fit_lines(x_array, y_array, axis):
+    """
+    Least squares fit of y = slope*x + intercept along axis of y_array for every other index at
+    once. Values of y that are not finite are left out of their fit and fits with less than 2
+    points are nan. Gives the same result as np.polyfit(x, y, 1) on the finite points.
+    """
+    shape = [1]*y_array.ndim
+    shape[axis] = len(x_array)
+    x_array = np.reshape(x_array, shape)
+    mask = np.isfinite(y_array)
+    y_array = np.where(mask, y_array, 0)
+    x_masked = np.where(mask, x_array, 0)
+
+    num_points = mask.sum(axis=axis)
+    #Center x on its mean in each fit so the sums do not lose precision (1/T values are all close)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = x_masked.sum(axis=axis, keepdims=True)/np.expand_dims(num_points, axis)
+        y_mean = y_array.sum(axis=axis, keepdims=True)/np.expand_dims(num_points, axis)
+        x_centered = np.where(mask, x_array-x_mean, 0)
+        slope = np.sum(x_centered*(y_array-y_mean), axis=axis)/np.sum(x_centered**2, axis=axis)
+        intercept = np.squeeze(y_mean, axis)-slope*np.squeeze(x_mean, axis)
+    slope[num_points<2] = np.nan
+    intercept[num_points<2] = np.nan
+    return slope, intercept
@@ -0,0 +1,189 @@
+import pandas as pd
+import numpy as np
+import os
+import sys
+import json
+import time
+import subprocess
+import tracemalloc
+from datetime import datetime
+from Joule_raw_data_builder import load_raw_obj
+from Joule_sum_data_builder import load_sum_obj, generate_sum_data_cell_id
+from Joule_synthetic_data import write_synthetic_dataset
+from Joule_result_cache import result_cache, temporary_result_cache
+from plotting_and_fitting_helpers import local_reg_adjust_window, get_mean_trend, load_t_x_fit_data, fit_t_x_batch
+
+#Modules timed by benchmark_import_time, the ones worker processes and short scripts import
+IMPORT_BENCHMARK_MODULES = ["plotting_and_fitting_helpers", "Joule_bootstrap", "Joule_profiler", "Joule_result_cache",
+                            "Joule_raw_data_builder", "Joule_sum_data_builder"]
+#Slow to import dependencies reported by benchmark_import_time when a module loads them
+HEAVY_DEPENDENCIES = ["pandas", "scipy", "sklearn", "tqdm", "pyarrow"]
+
+
+def benchmark_stage(stage_name, fun, fun_args_list, rows_fun=None, bytes_fun=None, use_result_cache=False):
+    """
+    Times fun over every set of arguments in fun_args_list and records the peak Python/NumPy memory
+    allocated while doing so with tracemalloc. Tracing memory slows the stage down a little, so
+    the wall time is measured in a separate run without it.
+
+    The smoothing and eol helpers keep their results in the process wide cache of
+    Joule_result_cache, so the second run (and any stage run after another stage that smoothed
+    the same cells) would only measure cache hits. The cache is turned off while benchmarking
+    unless use_result_cache is True, in which case each run gets its own empty in memory cache.
+    Either way the process wide cache is left as it was.
+
+    Args:
+    @stage_name(str): name of the stage in the results
+    @fun(function): function to benchmark
+    @fun_args_list(list[tuple]): positional arguments of each call of fun
+    @rows_fun(function): takes the output of fun and returns the number of rows processed
+    @bytes_fun(function): takes the arguments of fun and returns the number of bytes read
+    @use_result_cache(Boolean): True to benchmark with the result cache on
+
+    Returns:
+    @stage_dict(dict): stage, calls, wall_time_s, rows, rows_per_s, bytes_read, mb_per_s and peak_memory_mb
+    """
+    get_stage_cache = lambda: result_cache() if use_result_cache else None
+    rows = 0
+    bytes_read = 0
+    with temporary_result_cache(get_stage_cache()):
+        start_time = time.perf_counter()
+        for fun_args in fun_args_list:
+            output = fun(*fun_args)
+            if rows_fun is not None:
+                rows += rows_fun(output)
+            if bytes_fun is not None:
+                bytes_read += bytes_fun(*fun_args)
+        wall_time = time.perf_counter()-start_time
+
+    with temporary_result_cache(get_stage_cache()):
+        tracemalloc.start()
+        for fun_args in fun_args_list:
+            fun(*fun_args)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {"stage": stage_name, "calls": len(fun_args_list), "wall_time_s": wall_time, "rows": rows,
+            "rows_per_s": rows/wall_time if wall_time>0 else np.nan, "bytes_read": bytes_read,
+            "mb_per_s": bytes_read/1e6/wall_time if wall_time>0 else np.nan, "peak_memory_mb": peak_memory/1e6}
+
+def run_benchmark_suite(work_path, num_cells=4, num_diags=20, points_per_step=100, cell_type="Panasonic NCR18650B",
+                        seed=0, results_file_path=None):
+    """
+    This function writes a synthetic dataset with Joule_synthetic_data in to work_path and
+    benchmarks each stage of the structuring_code pipeline on it: loading raw objects, featurizing
+    them in to summary data, loading summary objects, smoothing, taking the mean trend and fitting
+    the t^x model. The same arguments always give the same dataset so results can be compared
+    between versions of the code.
+
+    Args:
+    @work_path(str): folder to write the synthetic dataset to
+    @num_cells(int): number of synthetic cells
+    @num_diags(int): number of diagnostics of each cell
+    @points_per_step(int): data points in each CC step of the raw data
+    @cell_type(str): cell type of the synthetic cells
+    @seed(int): random seed of the synthetic dataset
+    @results_file_path(str): csv to append the results to, with the time and dataset size, so
+        regressions can be tracked. None does not save the results
+
+    Returns:
+    @results_df(pd.DataFrame): one row per stage, see benchmark_stage
+    """
+    work_path = os.path.join(work_path, "")
+    raw_path = work_path+"raw_data/"
+    sum_path = work_path+"sum_data/"
+    cell_id_df = write_synthetic_dataset(work_path, num_cells=num_cells, num_diags=num_diags, cell_type=cell_type,
+                                         points_per_step=points_per_step, corrupt_fraction=1e-4, seed=seed)
+    cell_id_list = list(cell_id_df["Cell_id"])
+    raw_file_list = [(raw_path+"{}_raw.json".format(cell_id),) for cell_id in cell_id_list]
+    sum_file_list = [(sum_path+"{}_sum.json".format(cell_id),) for cell_id in cell_id_list]
+    sum_obj_list = ["{}_sum.json".format(cell_id) for cell_id in cell_id_list]
+    file_size = lambda file_path: os.path.getsize(file_path)
+
+    results = []
+    results.append(benchmark_stage("load_raw_obj", load_raw_obj, raw_file_list,
+                                   rows_fun=lambda obj: len(obj.raw_data), bytes_fun=file_size))
+    results.append(benchmark_stage("generate_sum_data_cell_id", generate_sum_data_cell_id,
+                                   [(cell_id, raw_path, cell_type) for cell_id in cell_id_list],
+                                   rows_fun=lambda obj: len(obj.summary_data),
+                                   bytes_fun=lambda cell_id, *_: file_size(raw_path+"{}_raw.json".format(cell_id))))
+    results.append(benchmark_stage("load_sum_obj", load_sum_obj, sum_file_list,
+                                   rows_fun=lambda obj: len(obj.summary_data), bytes_fun=file_size))
+
+    cap_metric = "RPT0.2C_2_D_capacity"
+    smooth_args_list = []
+    for (file_path,) in sum_file_list:
+        df = load_sum_obj(file_path).summary_data
+        smooth_args_list.append((np.array(df["Calendar_DateTime(days)"])/7, np.array(df[cap_metric])))
+    results.append(benchmark_stage("local_reg_adjust_window", local_reg_adjust_window, smooth_args_list,
+                                   rows_fun=lambda output: len(output)))
+    results.append(benchmark_stage("get_mean_trend", get_mean_trend, [(sum_obj_list, sum_path, cap_metric, True)],
+                                   rows_fun=lambda output: len(output[0])))
+
+    fit_data = load_t_x_fit_data(sum_obj_list, sum_path, metric_type="cap", cap_metric=cap_metric)
+    results.append(benchmark_stage("fit_t_x_batch", fit_t_x_batch, [fit_data+("cap",)],
+                                   rows_fun=lambda fit_df: len(fit_df)))
+
+    results_df = pd.DataFrame(results)
+    if results_file_path is not None:
+        saved_df = results_df.copy()
+        saved_df.insert(0, "run_time", datetime.now().isoformat(timespec="seconds"))
+        saved_df.insert(1, "num_cells", num_cells)
+        saved_df.insert(2, "num_diags", num_diags)
+        saved_df.insert(3, "points_per_step", points_per_step)
+        saved_df.to_csv(results_file_path, mode="a", index=False, header=not os.path.exists(results_file_path))
+    return results_df
+
+def benchmark_import_time(module_list=IMPORT_BENCHMARK_MODULES, num_repeats=5, code_path=None, results_file_path=None):
+    """
+    Times how long each module takes to import in a new Python process, which is what a spawned
+    process pool worker or a short script pays before doing any work. Every import is done
+    num_repeats times in its own process so nothing is already imported, and the median is kept.
+
+    import_time_s is the time of the import statement only and process_time_s the time from
+    starting the process until it exits, including starting the interpreter. heavy_dependencies
+    lists which of HEAVY_DEPENDENCIES the import loaded.
+
+    Args:
+    @module_list(list[str]): modules to import
+    @num_repeats(int): new processes started for each module
+    @code_path(str): folder the modules are imported from. None uses the folder of this file, 
+        another checkout of structuring_code can be given to compare versions
+    @results_file_path(str): csv to append the results to with the time they were taken. None 
+        does not save the results
+
+    Returns:
+    @import_df(pd.DataFrame): one row per module with import_time_s, process_time_s and heavy_dependencies
+    """
+    if code_path is None:
+        code_path = os.path.dirname(os.path.abspath(__file__))
+    script = ("import sys, time, json\n"
+              "sys.path.insert(0, {!r})\n"
+              "start_time = time.perf_counter()\n"
+              "import {{}}\n"
+              "import_time = time.perf_counter()-start_time\n"
+              "print(json.dumps([import_time, [x for x in {!r} if x in sys.modules]]))").format(code_path, HEAVY_DEPENDENCIES)
+
+    results = []
+    for module in module_list:
+        import_time_list = []
+        process_time_list = []
+        for _ in range(num_repeats):
+            start_time = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", script.format(module)], capture_output=True, text=True,
+                                    cwd=code_path)
+            process_time_list.append(time.perf_counter()-start_time)
+            if output.returncode!=0:
+                raise Exception("Importing {} failed: {}".format(module, output.stderr.strip().splitlines()[-1]))
+            import_time, heavy_dependencies = json.loads(output.stdout.strip().splitlines()[-1])
+            import_time_list.append(import_time)
+        results.append({"module": module, "repeats": num_repeats, "import_time_s": np.median(import_time_list),
+                        "process_time_s": np.median(process_time_list),
+                        "heavy_dependencies": ",".join(heavy_dependencies)})
+
+    import_df = pd.DataFrame(results)
+    if results_file_path is not None:
+        saved_df = import_df.copy()
+        saved_df.insert(0, "run_time", datetime.now().isoformat(timespec="seconds"))
+        saved_df.to_csv(results_file_path, mode="a", index=False, header=not os.path.exists(results_file_path))
+    return import_df
@@ -0,0 +1,214 @@
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from Joule_profiler import profile_stage
+from plotting_and_fitting_helpers import get_interp_metric_matrix
+#pandas is imported in the functions that return dataframes so resampling worker processes start fast
+
+#Columns of Joule_cell_id.csv that nominally identical cells share
+BOOTSTRAP_GROUP_COLS = ["Test_id", "Lot"]
+#Resamples done by one worker call
+BOOTSTRAP_CHUNK_SIZE = 1000
+
+
+def bootstrap_mean_std(value_matrix, num_resamples=1000, seed=None, num_workers=1, chunk_size=BOOTSTRAP_CHUNK_SIZE):
+    """
+    Bootstraps the mean and std across the rows (cells) of value_matrix at every column (time
+    point or fit parameter). Each resample draws the cells with replacement, which is done for a
+    whole chunk of resamples at once as a (resample, cell) matrix of how many times each cell was
+    drawn. The resampled sums are then matrix products of it with value_matrix, so no resampled
+    copies of the data are made. nan values are left out like np.nanmean and np.nanstd do.
+
+    Resamples are split in chunks of chunk_size with their own random streams from seed, so the
+    result only depends on seed and not on num_workers.
+
+    Args:
+    @value_matrix(np.array): (cell, column) values, nan where a cell has no value
+    @num_resamples(int): number of bootstrap resamples
+    @seed(int): random seed
+    @num_workers(int): Number of worker processes. 1 resamples in this process
+    @chunk_size(int): resamples done at once by a worker
+
+    Returns:
+    @mean_samples(np.array): (resample, column) resampled means, nan where no drawn cell has a value
+    @std_samples(np.array): (resample, column) resampled std
+    """
+    value_matrix = np.asarray(value_matrix, dtype=float)
+    chunk_sizes = [min(chunk_size, num_resamples-start) for start in range(0, num_resamples, chunk_size)]
+    seed_list = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    if num_workers<=1:
+        chunk_results = [_bootstrap_chunk(value_matrix, x, y) for x, y in zip(chunk_sizes, seed_list)]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            chunk_results = list(executor.map(_bootstrap_chunk, [value_matrix]*len(chunk_sizes), chunk_sizes, seed_list))
+
+    if len(chunk_results)==0:
+        return np.zeros((0, value_matrix.shape[1])), np.zeros((0, value_matrix.shape[1]))
+    mean_samples = np.concatenate([x[0] for x in chunk_results])
+    std_samples = np.concatenate([x[1] for x in chunk_results])
+    return mean_samples, std_samples
+
+def _bootstrap_chunk(value_matrix, num_resamples, seed_sequence):
+    """
+    Worker function of bootstrap_mean_std. Resampled mean and std of num_resamples resamples.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    num_cells = value_matrix.shape[0]
+    drawn_idx = rng.integers(0, num_cells, size=(num_resamples, num_cells))
+    #(resample, cell) number of times each cell was drawn
+    offset_idx = drawn_idx+num_cells*np.arange(num_resamples)[:, None]
+    draw_counts = np.bincount(offset_idx.ravel(), minlength=num_resamples*num_cells).reshape(num_resamples, num_cells)
+    draw_counts = draw_counts.astype(float)
+
+    valid = np.isfinite(value_matrix)
+    filled_matrix = np.where(valid, value_matrix, 0.0)
+    #Center on the mean of all cells so the sum of squares does not lose precision
+    num_valid = valid.sum(axis=0)
+    center = np.where(num_valid>0, filled_matrix.sum(axis=0)/np.maximum(num_valid, 1), 0.0)
+    centered_matrix = np.where(valid, filled_matrix-center, 0.0)
+
+    num_values = draw_counts@valid.astype(float)
+    sum_values = draw_counts@centered_matrix
+    sum_sq_values = draw_counts@(centered_matrix**2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_centered = sum_values/num_values
+        variance = np.maximum(sum_sq_values/num_values-mean_centered**2, 0.0)
+    return mean_centered+center, np.sqrt(variance)
+
+def get_confidence_band(samples, confidence=0.95):
+    """
+    Percentile confidence band of bootstrap samples at every column, leaving out nan samples.
+    Gives the same result as np.nanpercentile without its slow per column loop when there are nan.
+
+    Args:
+    @samples(np.array): (resample, column) bootstrap samples
+    @confidence(float): fraction of the samples inside the band
+
+    Returns:
+    @low_array(np.array): lower edge of the band at each column
+    @high_array(np.array): upper edge of the band at each column
+    """
+    sorted_samples = np.sort(samples, axis=0)
+    num_valid = np.sum(np.isfinite(samples), axis=0)
+    band_list = []
+    for quantile in [(1-confidence)/2, (1+confidence)/2]:
+        position = quantile*(num_valid-1)
+        low_idx = np.clip(np.floor(position).astype(int), 0, None)
+        high_idx = np.clip(np.ceil(position).astype(int), 0, None)
+        low_value = np.take_along_axis(sorted_samples, low_idx[None, :], axis=0)[0]
+        high_value = np.take_along_axis(sorted_samples, high_idx[None, :], axis=0)[0]
+        band = low_value+(position-low_idx)*(high_value-low_value)
+        band_list.append(np.where(num_valid>0, band, np.nan))
+    return band_list[0], band_list[1]
+
+@profile_stage("bootstrap_trend_bands", rows_fun=lambda args, output: len(output))
+def bootstrap_trend_bands(file_index, sum_path, metric, normalize_before_mean=True, group_cols=BOOTSTRAP_GROUP_COLS,
+                          num_resamples=1000, confidence=0.95, time_grid=None, seed=None, num_workers=1, store_path=None):
+    """
+    Bootstrap confidence bands of the mean trend and the cell to cell std of a metric for every
+    group of nominally identical cells (same Test_id and Lot by default). The smoothed and
+    interpolated cell x time matrix of each group is the same one get_mean_trend uses, so the mean
+    and std columns are its mean_metric_array and std_metric_array.
+
+    Args:
+    @file_index(pd.DataFrame): File index from Joule_file_index.build_file_index or load_file_index
+    @sum_path(str): Path to the summary data objects
+    @metric(str): "RPT0.2C_2_D_capacity" or "Res_SS_2_D"
+    @normalize_before_mean(Boolean): If True each cell is normalized to start at 100, see get_mean_trend
+    @group_cols(list[str]): Joule_cell_id.csv columns that define a group
+    @num_resamples(int): number of bootstrap resamples of each group
+    @confidence(float): fraction of the resamples inside the bands
+    @time_grid(np.array): Time points in weeks to use for every group. If None the unique time
+        points of each group are used
+    @seed(int): random seed
+    @num_workers(int): Number of worker processes used to resample each group
+    @store_path(str): Folder of the summary data store to read the cells from instead of the
+        summary files, see plotting_and_fitting_helpers.iter_sum_columns
+
+    Returns:
+    @band_df(pd.DataFrame): a row per group and time point with the group columns, time(weeks),
+        num_cells, mean, mean_low, mean_high, std, std_low and std_high
+    """
+    import pandas as pd
+    group_index = file_index[file_index["sum_file_path"].notna()]
+    band_df_list = []
+    for group_idx, (group_values, group_df) in enumerate(group_index.groupby(list(group_cols), sort=True)):
+        sum_obj_list = [os.path.basename(x) for x in group_df["sum_file_path"]]
+        interp_metric_matrix, all_times, _ = get_interp_metric_matrix(sum_obj_list, sum_path, metric,
+                                                                      normalize_before_mean, time_grid, file_index,
+                                                                      store_path)
+        if len(interp_metric_matrix)==0:
+            continue
+
+        group_seed = None if seed is None else [seed, group_idx]
+        mean_samples, std_samples = bootstrap_mean_std(interp_metric_matrix, num_resamples, seed=group_seed,
+                                                       num_workers=num_workers)
+        mean_low, mean_high = get_confidence_band(mean_samples, confidence)
+        std_low, std_high = get_confidence_band(std_samples, confidence)
+
+        group_band_df = pd.DataFrame({"time(weeks)": all_times,
+                                      "num_cells": np.sum(np.isfinite(interp_metric_matrix), axis=0),
+                                      "mean": np.nanmean(interp_metric_matrix, axis=0), "mean_low": mean_low,
+                                      "mean_high": mean_high, "std": np.nanstd(interp_metric_matrix, axis=0),
+                                      "std_low": std_low, "std_high": std_high})
+        for col, value in reversed(list(zip(group_cols, group_values))):
+            group_band_df.insert(0, col, value)
+        band_df_list.append(group_band_df)
+
+    if len(band_df_list)==0:
+        return pd.DataFrame(columns=list(group_cols)+["time(weeks)", "num_cells", "mean", "mean_low", "mean_high",
+                                                      "std", "std_low", "std_high"])
+    return pd.concat(band_df_list, ignore_index=True)
+
+@profile_stage("bootstrap_t_x_param_bands", rows_fun=lambda args, output: len(output))
+def bootstrap_t_x_param_bands(tx_fitting_df, joule_cell_id_df, group_cols=BOOTSTRAP_GROUP_COLS, params=["a", "b"],
+                              num_resamples=1000, confidence=0.95, seed=None, num_workers=1):
+    """
+    Bootstrap confidence bands of the group mean and cell to cell std of the fitted t^x parameters
+    of every group of nominally identical cells. Each cell is only fit once (see fit_t_x_batch or
+    the saved tx_*_fitting csv files) and the fitted parameters are resampled, so no fits are redone
+    for the resamples.
+
+    Args:
+    @tx_fitting_df(pd.DataFrame): fitting dataframe with a filename column of the form
+        {cell_id}_sum.json and a column for each of params
+    @joule_cell_id_df(pd.DataFrame): Joule_cell_id.csv dataframe or a file index
+    @group_cols(list[str]): Joule_cell_id.csv columns that define a group
+    @params(list[str]): parameter columns to bootstrap
+    @num_resamples(int): number of bootstrap resamples of each group
+    @confidence(float): fraction of the resamples inside the bands
+    @seed(int): random seed
+    @num_workers(int): Number of worker processes used to resample each group
+
+    Returns:
+    @param_band_df(pd.DataFrame): a row per group with the group columns, num_cells and for each
+        parameter its mean, mean_low, mean_high, std, std_low and std_high, ex: a_mean, a_mean_low
+    """
+    import pandas as pd
+    cell_info_df = joule_cell_id_df.assign(Cell_id=joule_cell_id_df["Cell_id"].astype(str))
+    cell_info_df = cell_info_df.drop_duplicates("Cell_id").set_index("Cell_id")
+    fit_df = tx_fitting_df.copy()
+    cell_id_series = fit_df["filename"].str.split("_").str[0]
+    for col in group_cols:
+        fit_df[col] = cell_id_series.map(cell_info_df[col]).to_numpy()
+
+    row_list = []
+    for group_idx, (group_values, group_df) in enumerate(fit_df.groupby(list(group_cols), sort=True)):
+        param_matrix = group_df[list(params)].to_numpy(dtype=float)
+        group_seed = None if seed is None else [seed, group_idx]
+        mean_samples, std_samples = bootstrap_mean_std(param_matrix, num_resamples, seed=group_seed, num_workers=num_workers)
+        mean_low, mean_high = get_confidence_band(mean_samples, confidence)
+        std_low, std_high = get_confidence_band(std_samples, confidence)
+
+        row = dict(zip(group_cols, group_values))
+        row["num_cells"] = len(group_df)
+        for idx, param in enumerate(params):
+            row["{}_mean".format(param)] = np.nanmean(param_matrix[:, idx])
+            row["{}_mean_low".format(param)] = mean_low[idx]
+            row["{}_mean_high".format(param)] = mean_high[idx]
+            row["{}_std".format(param)] = np.nanstd(param_matrix[:, idx])
+            row["{}_std_low".format(param)] = std_low[idx]
+            row["{}_std_high".format(param)] = std_high[idx]
+        row_list.append(row)
+    return pd.DataFrame(row_list)
@@ -0,0 +1,196 @@
+import numpy as np
+import json
+
+#Summary data column kept as a datetime64[D] array instead of in the value array
+COMPACT_DATE_COLUMN = "Calendar_Time(date)"
+#Format of the dates in the summary data
+SUM_DATE_FORMAT = "%Y-%m-%d"
+
+#Column names and column name -> index dicts shared by every compact object with the same columns
+_column_index_cache = {}
+
+
+def load_compact_sum_obj(file_path, dtype=np.float32, keep_meta_data=False):
+    """
+    This function loads a {cell_id}_sum.json file straight in to a cellLife_compact_sum_obj without
+    making a pandas DataFrame, so loading many cells for plotting does not need the memory of the
+    DataFrames. Values are the same as compact_sum_obj(load_sum_obj(file_path)) up to the last bit
+    of float64 values, since pandas reads json floats with a faster but less exact parser.
+
+    Args:
+    @file_path(string): location to the file of interest
+    @dtype(np.dtype): np.float32 or np.float64, dtype of the value array
+    @keep_meta_data(Boolean): True to keep the meta_data dictionary, it is dropped otherwise
+
+    Returns:
+    @obj(cellLife_compact_sum_obj): compact summary object
+    """
+    with open(file_path, 'r') as openfile:
+        json_file = json.load(openfile)
+    #summary_data is saved with df.to_json(), a dict of column -> {row: value}
+    column_dict = json.loads(json_file["summary_data"])
+
+    columns = list(column_dict.keys())
+    value_columns = [x for x in columns if x!=COMPACT_DATE_COLUMN]
+    num_rows = len(column_dict[columns[0]]) if len(columns)>0 else 0
+    values = np.empty((num_rows, len(value_columns)), dtype=dtype)
+    int_columns = []
+    for idx, col in enumerate(value_columns):
+        col_values = list(column_dict[col].values())
+        if all(type(x) is int for x in col_values):
+            int_columns.append(col)
+        values[:, idx] = _to_float_array(col_values)
+    dates = parse_sum_dates(list(column_dict[COMPACT_DATE_COLUMN].values())) if COMPACT_DATE_COLUMN in column_dict else None
+
+    obj = cellLife_compact_sum_obj(values=values, columns=columns, dates=dates, int_columns=int_columns,
+                                   comment=json_file["comment"], raw_fingerprint=json_file.get("raw_fingerprint"),
+                                   meta_data=json_file["meta_data"] if keep_meta_data else None)
+    return obj
+
+def compact_sum_obj(sum_obj, dtype=np.float32, keep_meta_data=False):
+    """
+    Converts a cellLife_sum_obj to a cellLife_compact_sum_obj.
+
+    Args:
+    @sum_obj(cellLife_sum_obj): summary object
+    @dtype(np.dtype): np.float32 or np.float64, dtype of the value array
+    @keep_meta_data(Boolean): True to keep the meta_data dictionary, it is dropped otherwise
+
+    Returns:
+    @obj(cellLife_compact_sum_obj): compact summary object
+    """
+    import pandas as pd
+    df = sum_obj.summary_data
+    columns = list(df.columns)
+    value_columns = [x for x in columns if x!=COMPACT_DATE_COLUMN]
+    values = np.empty((len(df), len(value_columns)), dtype=dtype)
+    int_columns = []
+    for idx, col in enumerate(value_columns):
+        if pd.api.types.is_integer_dtype(df[col]):
+            int_columns.append(col)
+        #Corrupted entries that are not numbers become nan, like the featurization does with them
+        values[:, idx] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+    dates = parse_sum_dates(df[COMPACT_DATE_COLUMN]) if COMPACT_DATE_COLUMN in df.columns else None
+
+    obj = cellLife_compact_sum_obj(values=values, columns=columns, dates=dates, int_columns=int_columns,
+                                   comment=sum_obj.comment, raw_fingerprint=sum_obj.raw_fingerprint,
+                                   meta_data=sum_obj.meta_data if keep_meta_data else None)
+    return obj
+
+def parse_sum_dates(date_strings):
+    """
+    Parses the Calendar_Time(date) strings of summary data to a datetime64[D] array in one call
+    instead of one datetime.strptime per date. Dates are "%Y-%m-%d", dates that NumPy can't parse
+    directly (ex: not zero padded) are parsed by pandas with the same format.
+
+    Args:
+    @date_strings(list[str] or pd.Series): dates in the form "%Y-%m-%d"
+
+    Returns:
+    @dates(np.array): datetime64[D] array
+    """
+    try:
+        return np.array(date_strings, dtype="datetime64[D]")
+    except ValueError:
+        import pandas as pd
+        return pd.to_datetime(pd.Series(date_strings), format=SUM_DATE_FORMAT).to_numpy().astype("datetime64[D]")
+
+def _to_float_array(col_values):
+    """
+    Converts json values (numbers and null) to a float array. Values that are not numbers become nan.
+    """
+    try:
+        return np.array(col_values, dtype=float)
+    except (ValueError, TypeError):
+        return np.array([x if isinstance(x, (int, float)) else np.nan for x in col_values], dtype=float)
+
+def _get_column_index(columns):
+    """
+    Returns the shared column name tuple and column name -> index dict of the value array.
+    """
+    columns = tuple(columns)
+    if columns not in _column_index_cache:
+        value_columns = [x for x in columns if x!=COMPACT_DATE_COLUMN]
+        _column_index_cache[columns] = (columns, {col: idx for idx, col in enumerate(value_columns)})
+    return _column_index_cache[columns]
+
+class cellLife_compact_sum_obj():
+    __slots__ = ("values", "columns", "column_index", "dates", "int_columns", "comment", "raw_fingerprint", "meta_data")
+
+    def __init__(self, values, columns, dates=None, int_columns=(), comment="N/A", raw_fingerprint=None, meta_data=None):
+        """
+        Constructor for cellLife_compact_sum_obj. A summary object that keeps the summary data as
+        one contiguous (diagnostic, column) float32 or float64 array instead of a DataFrame, with
+        the dates as a datetime64[D] array. The column names and their index are shared by all
+        objects with the same columns, so each object only holds its arrays. Columns are read
+        with obj[metric] or obj.get(metric), which return views in to the array.
+        Use load_compact_sum_obj or compact_sum_obj to make one and to_sum_obj to go back.
+
+        Args:
+        @values(np.array): (diagnostic, column) array of every column except Calendar_Time(date)
+        @columns(list[str]): all summary data column names in order, including Calendar_Time(date)
+        @dates(np.array): datetime64[D] Calendar_Time(date) of each diagnostic, None if there is no date column
+        @int_columns(list[str]): columns that are ints in the DataFrame, ex: diag_num
+        @comment(string): A string commenting on the data
+        @raw_fingerprint(dict): get_file_fingerprint of the raw data file
+        @meta_data(Dict): meta data dictionary, usually left out to save memory
+        """
+        self.values          = np.ascontiguousarray(values)
+        self.columns, self.column_index = _get_column_index(columns)
+        self.dates           = dates
+        self.int_columns     = tuple(int_columns)
+        self.comment         = comment
+        self.raw_fingerprint = raw_fingerprint
+        self.meta_data       = meta_data
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __getitem__(self, metric):
+        return self.get(metric)
+
+    def get(self, metric):
+        """
+        Returns a column of the summary data. Calendar_Time(date) is the datetime64[D] array, every
+        other column is a view in to the value array.
+        """
+        if metric==COMPACT_DATE_COLUMN:
+            return self.dates
+        return self.values[:, self.column_index[metric]]
+
+    def get_time_points(self):
+        """
+        Returns the time of each diagnostic in weeks, np.array(df["Calendar_DateTime(days)"])/7
+        """
+        return self.values[:, self.column_index["Calendar_DateTime(days)"]].astype(float)/7
+
+    @property
+    def nbytes(self):
+        """
+        Bytes of the value and date arrays
+        """
+        return self.values.nbytes+(self.dates.nbytes if self.dates is not None else 0)
+
+    def to_dataframe(self):
+        """
+        Returns the summary data as a DataFrame with the columns and dtypes of the cellLife_sum_obj,
+        float columns are float64 and Calendar_Time(date) is "%Y-%m-%d" strings.
+        """
+        import pandas as pd
+        data_dict = {}
+        for col in self.columns:
+            if col==COMPACT_DATE_COLUMN:
+                data_dict[col] = np.datetime_as_string(self.dates, unit="D").astype(object)
+            elif col in self.int_columns:
+                data_dict[col] = self.get(col).astype(np.int64)
+            else:
+                data_dict[col] = self.get(col).astype(np.float64)
+        return pd.DataFrame(data_dict, columns=list(self.columns))
+
+    def to_sum_obj(self):
+        """
+        Converts back to a cellLife_sum_obj. meta_data is {} if it was not kept.
+        """
+        from Joule_sum_data_builder import cellLife_sum_obj
+        return cellLife_sum_obj(meta_data=self.meta_data if self.meta_data is not None else {}, summary_data=self.to_dataframe(),
+                                comment=self.comment, raw_fingerprint=self.raw_fingerprint)
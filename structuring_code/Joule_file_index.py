@@ -0,0 +1,224 @@
+import pandas as pd
+import numpy as np
+import os
+from Joule_raw_data_builder import load_raw_obj, load_raw_obj_parquet
+#ignoring future warnings from pandas due to loading in json
+import warnings
+warnings.simplefilter(action='ignore', category=FutureWarning)
+
+#Columns describing each file in the index. Each is prefixed with raw_ or sum_
+FILE_STAT_COLUMNS = ["file_path", "size", "mtime_ns", "num_diags", "start_date", "end_date"]
+#Stored as nullable ints so large mtimes are not rounded by being cast to float for missing files
+FILE_STAT_INT_COLUMNS = ["size", "mtime_ns", "num_diags"]
+
+
+def build_file_index(code_path, raw_path=None, sum_path=None, index_file_path=None):
+    """
+    This function builds an index of the raw and summary data files of every cell in
+    Joule_cell_id.csv. Each row is a cell with its Joule_cell_id.csv information (type, SOC,
+    temperature, lot etc) and the path, size, modification time, number of diagnostics and date
+    range of its raw and summary file.
+
+    If index_file_path already has an index it is refreshed instead of rebuilt. Files with the same
+    path, size and modification time as before are not opened again, so only new or changed files
+    are loaded. The index is then saved to index_file_path.
+
+    Args:
+    @code_path(string): Where the Joule_cell_id.csv is stored
+    @raw_path(str): Path to the raw data objects ({cell_id}_raw.json or {cell_id}_raw.parquet).
+        None leaves the raw columns empty
+    @sum_path(str): Path to the summary data objects ({cell_id}_sum.json). None leaves the
+        summary columns empty
+    @index_file_path(str): csv file the index is loaded from and saved to. None does not save it
+
+    Returns:
+    @file_index(pd.DataFrame): The file index with one row per Cell_id
+    """
+    from tqdm import tqdm
+    cell_id_df = pd.read_csv(code_path+"Joule_cell_id.csv", index_col=False)
+    file_index = cell_id_df.copy()
+
+    old_index = None
+    if index_file_path is not None and os.path.exists(index_file_path):
+        old_index = load_file_index(index_file_path).set_index("Cell_id")
+
+    for kind, folder, stats_fun in [("raw", raw_path, _get_raw_file_stats), ("sum", sum_path, _get_sum_file_stats)]:
+        stat_dict = {stat: [] for stat in FILE_STAT_COLUMNS}
+        #Only list the folder once instead of once per cell
+        file_dict = _get_cell_file_dict(folder, kind) if folder is not None else {}
+
+        for i in tqdm(range(len(file_index))):
+            cell_id = str(file_index["Cell_id"].iloc[i])
+            cell_stats = dict.fromkeys(FILE_STAT_COLUMNS, np.nan)
+
+            if cell_id in file_dict:
+                file_path = folder+file_dict[cell_id]
+                file_stat = os.stat(file_path)
+                cell_stats["file_path"] = file_path
+                cell_stats["size"] = file_stat.st_size
+                cell_stats["mtime_ns"] = file_stat.st_mtime_ns
+
+                #Reuse the old stats if the file has not changed
+                if _file_unchanged(old_index, cell_id, kind, cell_stats):
+                    for stat in ["num_diags", "start_date", "end_date"]:
+                        cell_stats[stat] = old_index.loc[cell_id, "{}_{}".format(kind, stat)]
+                else:
+                    try:
+                        cell_stats.update(stats_fun(file_path))
+                    #Keep the file in the index even if it can not be read
+                    except Exception:
+                        pass
+
+            for stat in FILE_STAT_COLUMNS:
+                stat_dict[stat].append(cell_stats[stat])
+
+        for stat in FILE_STAT_COLUMNS:
+            if stat in FILE_STAT_INT_COLUMNS:
+                stat_dict[stat] = pd.array(stat_dict[stat], dtype="Int64")
+            file_index["{}_{}".format(kind, stat)] = stat_dict[stat]
+
+    if index_file_path is not None:
+        file_index.to_csv(index_file_path, index=False)
+    return file_index
+
+def load_file_index(index_file_path):
+    """
+    This function loads a file index saved by build_file_index.
+
+    Args:
+    @index_file_path(str): location of the file index csv
+
+    Returns:
+    @file_index(pd.DataFrame): The file index with one row per Cell_id
+    """
+    dtype_dict = {"Cell_id": str}
+    for kind in ["raw", "sum"]:
+        dtype_dict.update({"{}_{}".format(kind, stat): "Int64" for stat in FILE_STAT_INT_COLUMNS})
+    file_index = pd.read_csv(index_file_path, index_col=False, dtype=dtype_dict)
+    return file_index
+
+def get_raw_file_path(cell_id, raw_path, file_index=None):
+    """
+    Returns the path to the raw data file of a cell_id. Uses the file index if one is given,
+    otherwise looks for the first file in raw_path that starts with the cell_id.
+
+    Args:
+    @cell_id(str): Unqiue Cell identification number ex: "C00001"
+    @raw_path(str): Path to where all the raw data objects are stored
+    @file_index(pd.DataFrame): File index from build_file_index or load_file_index
+
+    Returns:
+    @file_path(str): Path to the raw data file
+    """
+    if file_index is None:
+        file_name = [x for x in os.listdir(raw_path) if x.startswith(cell_id)][0]
+        return raw_path+file_name
+    return _get_index_file_path(cell_id, file_index, "raw")
+
+def get_sum_file_path(cell_id, sum_path, file_index=None):
+    """
+    Returns the path to the summary data file of a cell_id. Uses the file index if one is given,
+    otherwise it is {cell_id}_sum.json in sum_path.
+
+    Args:
+    @cell_id(str): Unqiue Cell identification number ex: "C00001"
+    @sum_path(str): Path to where all the summary data objects are stored
+    @file_index(pd.DataFrame): File index from build_file_index or load_file_index
+
+    Returns:
+    @file_path(str): Path to the summary data file
+    """
+    if file_index is None:
+        return sum_path+"{}_sum.json".format(cell_id)
+    return _get_index_file_path(cell_id, file_index, "sum")
+
+def filter_file_index(file_index, cell_type=None, soc=None, temperature=None, lot=None, has_sum=False, has_raw=False):
+    """
+    Returns the rows of the file index for the testing conditions of interest. Each condition can
+    be a single value or a list of values. None does not filter on that condition.
+
+    Args:
+    @file_index(pd.DataFrame): File index from build_file_index or load_file_index
+    @cell_type(str or list): Cell_type(s) to keep, ex: "Panasonic NCR18650B"
+    @soc(int or list): SOC(s) to keep
+    @temperature(int or list): Temperature(s) to keep
+    @lot(str or list): Lot(s) to keep
+    @has_sum(Boolean): Only keep cells that have a summary data file
+    @has_raw(Boolean): Only keep cells that have a raw data file
+
+    Returns:
+    @filtered_index(pd.DataFrame): Rows of the file index that pass all the filters
+    """
+    mask = np.ones(len(file_index), dtype=bool)
+    for col, value in [("Cell_type", cell_type), ("SOC", soc), ("Temperature", temperature), ("Lot", lot)]:
+        if value is None:
+            continue
+        if not isinstance(value, (list, tuple, set, np.ndarray)):
+            value = [value]
+        mask &= file_index[col].isin(value).to_numpy()
+    if has_sum:
+        mask &= file_index["sum_file_path"].notna().to_numpy()
+    if has_raw:
+        mask &= file_index["raw_file_path"].notna().to_numpy()
+    return file_index[mask]
+
+def _get_index_file_path(cell_id, file_index, kind):
+    """
+    Looks up the raw or sum file path of a cell_id in the file index.
+    """
+    file_path = file_index.loc[file_index["Cell_id"]==cell_id, "{}_file_path".format(kind)]
+    if len(file_path)==0 or pd.isna(file_path.iloc[0]):
+        raise FileNotFoundError("No {} file for {} in the file index".format(kind, cell_id))
+    return file_path.iloc[0]
+
+def _get_cell_file_dict(folder, kind):
+    """
+    Returns a dict of cell_id to the {cell_id}_{kind} file name in folder. Folders with both a
+    json and parquet raw file use the json file like load_raw_obj does.
+    """
+    file_dict = {}
+    for file_name in sorted(os.listdir(folder)):
+        name, extension = os.path.splitext(file_name)
+        if not name.endswith("_"+kind) or extension not in (".json", ".parquet"):
+            continue
+        cell_id = name.split("_")[0]
+        if cell_id not in file_dict or extension==".json":
+            file_dict[cell_id] = file_name
+    return file_dict
+
+def _file_unchanged(old_index, cell_id, kind, cell_stats):
+    """
+    True if the file in the old index has the same path, size and modification time.
+    """
+    if old_index is None or cell_id not in old_index.index:
+        return False
+    old_row = old_index.loc[cell_id]
+    for stat in ["file_path", "size", "mtime_ns"]:
+        old_value = old_row["{}_{}".format(kind, stat)]
+        if pd.isna(old_value) or old_value!=cell_stats[stat]:
+            return False
+    return True
+
+def _get_raw_file_stats(file_path):
+    """
+    Number of diagnostics and date range of a raw data file. Parquet files only load the columns
+    that are needed.
+    """
+    if file_path.endswith(".parquet"):
+        raw_data = load_raw_obj_parquet(file_path, columns=["diag_num", "Diag_Start_Datetime"]).raw_data
+    else:
+        raw_data = load_raw_obj(file_path).raw_data
+    diag_dates = raw_data.drop_duplicates("diag_num")["Diag_Start_Datetime"]
+    return {"num_diags": len(diag_dates), "start_date": diag_dates.min(), "end_date": diag_dates.max()}
+
+def _get_sum_file_stats(file_path):
+    """
+    Number of diagnostics and date range of a summary data file.
+    """
+    #Import here since Joule_sum_data_builder resolves raw files through this module
+    from Joule_sum_data_builder import load_sum_obj
+    summary_data = load_sum_obj(file_path).summary_data
+    if len(summary_data)==0:
+        return {"num_diags": 0}
+    dates = summary_data["Calendar_Time(date)"]
+    return {"num_diags": len(summary_data), "start_date": dates.min(), "end_date": dates.max()}
@@ -0,0 +1,195 @@
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+
+#Rows of a dataframe column serialized, escaped and written at a time by write_json_dict
+JSON_WRITE_CHUNK_ROWS = 2**16
+
+
+@contextmanager
+def atomic_write(file_path, mode="w", overwrite=False, sync_dir=True):
+    """
+    Context manager that opens a temporary file in the same folder as file_path for writing and,
+    once the block finishes without an exception, moves it to file_path in one rename. Readers
+    loading file_path at the same time see either the old file or the whole new file, never a
+    missing or partly written one. If the block raises, the temporary file is removed and file_path
+    is left as it was.
+
+        with atomic_write(file_path, overwrite=True) as outfile:
+            json.dump(dict_to_save, outfile)
+
+    Args:
+    @file_path(str): file to write
+    @mode(str): "w" for text or "wb" for binary
+    @overwrite(Boolean): True to replace an existing file. If False and the file exists (or is made
+        by someone else while writing) an exception is raised
+    @sync_dir(Boolean): True to also flush the folder to disk so the rename survives a crash. False
+        leaves this to the caller, see write_json_objects
+
+    Returns:
+    @outfile(file): open temporary file to write to
+    """
+    #throw error if file already exists so we don't overwrite it
+    if (os.path.exists(file_path) and not overwrite):
+        raise Exception("File already exists")
+
+    folder = os.path.dirname(os.path.abspath(file_path))
+    file_descriptor, temp_file_path = tempfile.mkstemp(dir=folder, prefix="."+os.path.basename(file_path)+".",
+                                                       suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, mode) as outfile:
+            yield outfile
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        #mkstemp makes the file readable only by its owner, give it the permissions of a normal file
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_file_path, 0o666 & ~umask)
+
+        if overwrite:
+            os.replace(temp_file_path, file_path)
+        else:
+            #A hard link fails if file_path exists, so a file made while writing is not replaced
+            try:
+                os.link(temp_file_path, file_path)
+            except FileExistsError:
+                raise Exception("File already exists")
+            except OSError:
+                #Folders that don't support hard links
+                if os.path.exists(file_path):
+                    raise Exception("File already exists")
+                os.replace(temp_file_path, file_path)
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+    if sync_dir:
+        sync_directory(folder)
+
+def sync_directory(folder):
+    """
+    Flushes the entries of a folder (new and renamed files) to disk. Does nothing on systems that
+    can't open folders, such as Windows.
+    """
+    try:
+        dir_descriptor = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_descriptor)
+
+@contextmanager
+def lock_file(file_path, shared=False):
+    """
+    Context manager that holds an advisory lock on file_path while the block runs. The lock is
+    taken on a {file_path}.lock file next to it, so it is kept across the renames done by
+    atomic_write. Only processes that also use lock_file wait for it. The lock files are left in
+    place since removing them while another process waits on them would let two processes hold the
+    lock. Does nothing on systems without fcntl, such as Windows.
+
+    Args:
+    @file_path(str): file to lock
+    @shared(Boolean): True for a shared (read) lock that only waits for exclusive locks
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    with open(file_path+".lock", "a") as lockfile:
+        fcntl.flock(lockfile.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_UN)
+
+def write_json_dict(outfile, dict_to_save, dataframe_keys=()):
+    """
+    Writes a dict to an open text file in the same format as json.dump(dict_to_save, outfile) with
+    the dataframes in dataframe_keys saved as json strings, the same string as df.to_json(). The
+    dataframe json is serialized one column and JSON_WRITE_CHUNK_ROWS rows at a time, escaped and
+    written, so neither the json string of the whole dataframe nor the file is held in memory.
+
+    Args:
+    @outfile(file): open text file
+    @dict_to_save(dict): values to save
+    @dataframe_keys(list[str]): keys of dict_to_save whose values are dataframes
+    """
+    outfile.write("{")
+    for idx, (key, value) in enumerate(dict_to_save.items()):
+        if idx>0:
+            outfile.write(", ")
+        outfile.write(json.dumps(key)+": ")
+        if key in dataframe_keys:
+            outfile.write('"')
+            _write_dataframe_json(outfile, value)
+            outfile.write('"')
+        else:
+            json.dump(value, outfile)
+    outfile.write("}")
+
+def _write_dataframe_json(outfile, df):
+    """
+    Writes df.to_json() escaped as the inside of a json string. df.to_json() is
+    {"column":{"index":value,...},...}, which is pieced together from to_json of each column's
+    row chunks so pandas formats every key and value the same way.
+    """
+    #Same checks as df.to_json(), which can't write duplicate keys
+    if not df.columns.is_unique:
+        raise ValueError("DataFrame columns must be unique for orient='columns'.")
+    if not df.index.is_unique:
+        raise ValueError("DataFrame index must be unique for orient='columns'.")
+    outfile.write(_escape_json('{'))
+    for col_idx in range(df.shape[1]):
+        if col_idx>0:
+            outfile.write(_escape_json(','))
+        #'{"column":{}}' of the empty column gives the column key as pandas writes it
+        empty_json = df.iloc[:0, [col_idx]].to_json()
+        outfile.write(_escape_json(empty_json[1:-3]+'{'))
+        for start in range(0, len(df), JSON_WRITE_CHUNK_ROWS):
+            #'{"index":value,...}' of the rows without the braces
+            chunk_json = df.iloc[start:start+JSON_WRITE_CHUNK_ROWS, col_idx].to_json()
+            if start>0:
+                outfile.write(_escape_json(','))
+            outfile.write(_escape_json(chunk_json[1:-1]))
+        outfile.write(_escape_json('}'))
+    outfile.write(_escape_json('}'))
+
+def _escape_json(text):
+    """
+    Escapes text to go inside a json string. Escaping is done character by character so pieces of
+    a string can be escaped separately.
+    """
+    return json.dumps(text)[1:-1]
+
+def write_json_objects(obj_list, file_path_list, overwrite=False, lock=False):
+    """
+    Saves many cellLife_raw_obj or cellLife_sum_obj objects with to_json_file. Each file is
+    written atomically, and each folder is flushed to disk once at the end instead of once per file.
+
+    Args:
+    @obj_list(list): objects with a to_json_file method
+    @file_path_list(list[str]): file to save each object to
+    @overwrite(Boolean): True to replace existing files
+    @lock(Boolean): True to hold lock_file on each file while it is written
+
+    Returns:
+    @files_failed(list[tuple(str, str)]): (file_path, error) of every file that could not be saved
+    """
+    files_failed = []
+    folder_set = set()
+    for obj, file_path in zip(obj_list, file_path_list):
+        try:
+            obj.to_json_file(file_path, overwrite=overwrite, lock=lock, sync_dir=False)
+            folder_set.add(os.path.dirname(os.path.abspath(file_path)))
+        except Exception as e:
+            files_failed.append((file_path, "{}: {}".format(type(e).__name__, e)))
+    for folder in sorted(folder_set):
+        sync_directory(folder)
+    return files_failed
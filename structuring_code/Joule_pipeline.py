@@ -0,0 +1,386 @@
+import os
+import sys
+import glob
+import pickle
+import argparse
+from datetime import datetime
+from Joule_query_service import QUERY_SERVICE_HOST, QUERY_SERVICE_PORT
+
+#Folder with Joule_cell_id.csv and the data folders the notebooks use, the parent of structuring_code
+REPO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "")
+DEFAULT_RAW_PATH = os.path.join(REPO_PATH, "joule_declass_raw", "")
+DEFAULT_SUM_PATH = os.path.join(REPO_PATH, "joule_declass_sum", "")
+DEFAULT_OUTPUT_PATH = os.path.join(REPO_PATH, "saved_fitting_results", "")
+#Output formats of the fit and eol subcommands. The first one is the format of saved_fitting_results
+FIT_OUTPUT_FORMATS = ["csv", "parquet", "json"]
+EOL_OUTPUT_FORMATS = ["pkl", "npy", "parquet"]
+#File name prefixes of the saved results, {prefix}{date}.{format}
+FIT_FILE_PREFIX = "tx_{}_fitting_"
+EOL_FILE_PREFIX = "eol_error_dictionary_all_tpoints_"
+
+
+def main(argv=None):
+    """
+    Runs the command line pipeline, see get_parser. Run from the repository with
+    python -m structuring_code {build,fit,eol,serve} [options], or from structuring_code with
+    python -m Joule_pipeline {build,fit,eol,serve} [options]. Use --help for the options of each step.
+
+    Args:
+    @argv(list[str]): command line arguments, None uses sys.argv
+
+    Returns:
+    @exit_code(int): 0, or 1 if the step raised an error. The error is printed to stderr
+    """
+    args = get_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except Exception as e:
+        print("Error: {}".format(e), file=sys.stderr)
+        return 1
+    return 0
+
+def get_parser():
+    """
+    Returns the argparse parser of the command line pipeline with a subcommand for each step:
+    build (raw data to summary data), fit (t^x fits) and eol (eol error sweep), and serve to
+    run the Joule_query_service on the summary data.
+    """
+    parser = argparse.ArgumentParser(prog="python -m structuring_code",
+                                     description="Joule calendar aging pipeline: raw data -> summary data -> t^x fits -> eol reports")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    #Options shared by every step
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument("--code-path", default=REPO_PATH, help="folder with Joule_cell_id.csv (default: %(default)s)")
+    common_parser.add_argument("--sum-path", default=DEFAULT_SUM_PATH, help="summary data folder (default: %(default)s)")
+    common_parser.add_argument("--cell-type", nargs="+", default=None, help="only use these cell types")
+    common_parser.add_argument("--cell-id", nargs="+", default=None, help="only use these cell ids")
+    common_parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: %(default)s)")
+    common_parser.add_argument("--incremental", action="store_true",
+                               help="only redo cells that are new or whose input files changed since the last run")
+
+    build_parser = subparsers.add_parser("build", parents=[common_parser], help="generate summary data from raw data")
+    build_parser.add_argument("--raw-path", default=DEFAULT_RAW_PATH, help="raw data folder (default: %(default)s)")
+    build_parser.add_argument("--file-index", default=None, help="file index csv from Joule_file_index to find the raw files")
+    build_parser.add_argument("--chunksize", type=int, default=1, help="cells sent to a worker at a time (default: %(default)s)")
+    build_parser.add_argument("--no-overwrite", action="store_true", help="keep summary files that already exist")
+    build_parser.add_argument("--lock", action="store_true", help="lock each summary file while it is written")
+    build_parser.set_defaults(func=_run_build_command)
+
+    #Options shared by the fit and eol steps
+    result_parser = argparse.ArgumentParser(add_help=False)
+    result_parser.add_argument("--output-path", default=DEFAULT_OUTPUT_PATH, help="folder to save results to (default: %(default)s)")
+    result_parser.add_argument("--date", default=None, help="date in the result file names (default: today, YYYY-MM-DD)")
+    result_parser.add_argument("--eol-cond", type=float, default=90, help="eol capacity in %% (default: %(default)s)")
+    result_parser.add_argument("--seed", type=int, default=None, help="random seed of differential evolution")
+
+    fit_parser = subparsers.add_parser("fit", parents=[common_parser, result_parser], help="fit t^x models to summary data")
+    fit_parser.add_argument("--metric", nargs="+", choices=["cap", "res"], default=["cap", "res"],
+                            help="metrics to fit (default: cap res)")
+    fit_parser.add_argument("--format", choices=FIT_OUTPUT_FORMATS, default=FIT_OUTPUT_FORMATS[0],
+                            help="output format (default: %(default)s)")
+    fit_parser.add_argument("--chunksize", type=int, default=8, help="cells sent to a worker at a time (default: %(default)s)")
+    fit_parser.add_argument("--maxiter", type=int, default=10000, help="maximum generations of differential evolution")
+    fit_parser.set_defaults(func=_run_fit_command)
+
+    eol_parser = subparsers.add_parser("eol", parents=[common_parser, result_parser], help="run the eol error sweep")
+    eol_parser.add_argument("--temperature", nargs="+", default=["24"],
+                            help="only use cells tested at these temperatures, all for every temperature (default: 24)")
+    eol_parser.add_argument("--min-data-points", type=int, default=4, help="data points needed to extrapolate (default: %(default)s)")
+    eol_parser.add_argument("--format", choices=EOL_OUTPUT_FORMATS, default=EOL_OUTPUT_FORMATS[0],
+                            help="output format (default: %(default)s)")
+    eol_parser.set_defaults(func=_run_eol_command)
+
+    serve_parser = subparsers.add_parser("serve", help="serve summary metrics, eol times and t^x fits to local clients")
+    serve_parser.add_argument("--code-path", default=REPO_PATH, help="folder with Joule_cell_id.csv (default: %(default)s)")
+    serve_parser.add_argument("--sum-path", default=DEFAULT_SUM_PATH, help="summary data folder (default: %(default)s)")
+    serve_parser.add_argument("--host", default=QUERY_SERVICE_HOST, help="address to listen on (default: %(default)s)")
+    serve_parser.add_argument("--port", type=int, default=QUERY_SERVICE_PORT, help="port to listen on (default: %(default)s)")
+    serve_parser.add_argument("--unix-socket", default=None, help="also listen on this unix socket")
+    serve_parser.add_argument("--workers", type=int, default=2, help="number of worker processes (default: %(default)s)")
+    serve_parser.add_argument("--reload-interval", type=float, default=30,
+                              help="seconds between checks for changed summary files (default: %(default)s)")
+    serve_parser.set_defaults(func=_run_serve_command)
+    return parser
+
+def get_cell_id_df(code_path, cell_types=None, cell_ids=None, temperatures=None):
+    """
+    Returns the rows of Joule_cell_id.csv of the cells to run, in the order of the file.
+
+    Args:
+    @code_path(str): folder with Joule_cell_id.csv
+    @cell_types(list[str]): cell types to keep. None keeps all
+    @cell_ids(list[str]): cell ids to keep. None keeps all
+    @temperatures(list[int]): temperatures to keep. None keeps all
+
+    Returns:
+    @cell_id_df(pd.DataFrame): the rows of Joule_cell_id.csv with Cell_id as str
+    """
+    import pandas as pd
+    cell_id_df = pd.read_csv(os.path.join(code_path, "Joule_cell_id.csv"), index_col=False)
+    cell_id_df["Cell_id"] = cell_id_df["Cell_id"].astype(str)
+    if cell_types is not None:
+        cell_id_df = cell_id_df[cell_id_df["Cell_type"].isin(cell_types)]
+    if cell_ids is not None:
+        cell_id_df = cell_id_df[cell_id_df["Cell_id"].isin([str(x) for x in cell_ids])]
+    if temperatures is not None:
+        cell_id_df = cell_id_df[cell_id_df["Temperature"].isin(temperatures)]
+    if len(cell_id_df)==0:
+        raise Exception("No cells in Joule_cell_id.csv match the cell types, cell ids and temperatures given")
+    return cell_id_df
+
+def build_summaries(raw_path, sum_path, code_path, cell_types=None, cell_ids=None, num_workers=1, chunksize=1,
+                    incremental=False, overwrite=True, lock=False, file_index_path=None):
+    """
+    Generates the summary data of the cells with generate_sum_data, one cell type at a time.
+
+    Args:
+    @raw_path(str): Path to the raw data objects
+    @sum_path(str): Path to save the summary data objects to, made if it does not exist
+    @code_path(str): folder with Joule_cell_id.csv
+    @cell_types(list[str]): cell types to generate. None generates all
+    @cell_ids(list[str]): cell ids to generate. None generates all
+    @num_workers(int): Number of worker processes
+    @chunksize(int): Number of cells sent to a worker process at a time
+    @incremental(Boolean): Only featurize new diagnostics of cells that already have summary data
+    @overwrite(Boolean): Whether to overwrite already existing summary objects
+    @lock(Boolean): Hold an advisory lock on each summary object while it is generated and saved
+    @file_index_path(str): file index csv from Joule_file_index used to find the raw files
+
+    Returns:
+    @failed_cells(list[tuple(str, str)]): (cell_id, error) for every cell that failed
+    """
+    from Joule_sum_data_builder import generate_sum_data
+    from Joule_file_index import load_file_index
+    cell_id_df = get_cell_id_df(code_path, cell_types, cell_ids)
+    file_index = load_file_index(file_index_path) if file_index_path is not None else None
+    os.makedirs(sum_path, exist_ok=True)
+
+    failed_cells = []
+    for cell_type in cell_id_df["Cell_type"].unique():
+        cell_type_ids = list(cell_id_df[cell_id_df["Cell_type"]==cell_type]["Cell_id"])
+        _, errors_list = generate_sum_data(cell_type, os.path.join(raw_path, ""), os.path.join(sum_path, ""),
+                                           os.path.join(code_path, ""), overwrite=overwrite, num_workers=num_workers,
+                                           chunksize=chunksize, incremental=incremental, file_index=file_index,
+                                           lock=lock, cell_ids=cell_type_ids, return_errors=True)
+        failed_cells += errors_list
+    return failed_cells
+
+def fit_t_x_models(sum_path, code_path, output_path, metric_types=["cap", "res"], cell_types=None, cell_ids=None,
+                   eol_cond=90, num_workers=1, chunksize=8, maxiter=10000, seed=None, output_format="csv",
+                   incremental=False, date_string=None):
+    """
+    Fits the t^x model of every cell with summary data (see load_t_x_fit_data and fit_t_x_batch)
+    and saves one table per metric as {output_path}/tx_{metric}_fitting_{date}.{output_format},
+    with the same columns as the tables in saved_fitting_results.
+
+    With incremental=True the newest saved table of the same format is reused: its rows are kept
+    for cells whose summary file has not changed since it was saved and only the other cells are
+    fit.
+
+    Args:
+    @sum_path(str): Path to the summary data objects
+    @code_path(str): folder with Joule_cell_id.csv
+    @output_path(str): folder to save the tables to, made if it does not exist
+    @metric_types(list[str]): "cap" and/or "res"
+    @cell_types(list[str]): cell types to fit. None fits all
+    @cell_ids(list[str]): cell ids to fit. None fits all
+    @eol_cond(float): eol capacity in %, points after it are not fit
+    @num_workers(int): Number of worker processes
+    @chunksize(int): Number of cells sent to a worker process at a time
+    @maxiter(int): maximum generations of differential evolution
+    @seed(int): random seed passed to differential_evolution
+    @output_format(str): "csv", "parquet" or "json"
+    @incremental(Boolean): Reuse the fits of unchanged cells from the newest saved table
+    @date_string(str): date in the file names. None uses today as YYYY-MM-DD
+
+    Returns:
+    @file_path_dict(dict): metric type to the path of the saved table
+    """
+    import pandas as pd
+    from plotting_and_fitting_helpers import load_t_x_fit_data, fit_t_x_batch
+    cell_id_df = get_cell_id_df(code_path, cell_types, cell_ids)
+    sum_path = os.path.join(sum_path, "")
+    sum_obj_list = ["{}_sum.json".format(x) for x in cell_id_df["Cell_id"] if os.path.exists(sum_path+"{}_sum.json".format(x))]
+    date_string = date_string if date_string is not None else datetime.now().strftime("%Y-%m-%d")
+    os.makedirs(output_path, exist_ok=True)
+
+    file_path_dict = {}
+    for metric_type in metric_types:
+        file_prefix = FIT_FILE_PREFIX.format(metric_type)
+        kept_df = None
+        fit_obj_list = sum_obj_list
+        previous_file_path = _get_latest_output(output_path, file_prefix, output_format) if incremental else None
+        if previous_file_path is not None:
+            previous_df = _read_table(previous_file_path, output_format)
+            unchanged_list = _get_unchanged(sum_obj_list, sum_path, previous_file_path)
+            kept_df = previous_df[previous_df["filename"].isin(unchanged_list)]
+            fit_obj_list = [x for x in sum_obj_list if x not in set(kept_df["filename"])]
+
+        name_list, time_points_list, metric_points_list = load_t_x_fit_data(fit_obj_list, sum_path, metric_type=metric_type,
+                                                                            eol_cond=eol_cond)
+        tx_fitting_df = fit_t_x_batch(name_list, time_points_list, metric_points_list, metric_type=metric_type,
+                                      joule_cell_id_df=cell_id_df, num_workers=num_workers, chunksize=chunksize,
+                                      maxiter=maxiter, seed=seed)
+        if kept_df is not None:
+            tx_fitting_df = pd.concat([kept_df, tx_fitting_df], ignore_index=True)
+            #Same order as a full run
+            order_dict = {x: idx for idx, x in enumerate(sum_obj_list)}
+            tx_fitting_df = tx_fitting_df.sort_values("filename", key=lambda x: x.map(order_dict), ignore_index=True)
+
+        file_path = os.path.join(output_path, "{}{}.{}".format(file_prefix, date_string, output_format))
+        _write_table(tx_fitting_df, file_path, output_format)
+        file_path_dict[metric_type] = file_path
+    return file_path_dict
+
+def run_eol_sweep(sum_path, code_path, output_path, temperatures=[24], cell_types=None, cell_ids=None, eol_cond=90,
+                  min_data_points=4, num_workers=1, seed=None, output_format="pkl", incremental=False, date_string=None):
+    """
+    Runs the eol error sweep of figure 8 (get_eol_error_sweep_batch) for every cell with summary
+    data and saves it as {output_path}/eol_error_dictionary_all_tpoints_{date}.{output_format}.
+    "pkl" is the dictionary layout of saved_fitting_results (eol_error_sweep_to_dict), "npy" and
+    "parquet" save the structured array with save_eol_error_sweep. Cells that have not reached eol
+    have no rows, like in the saved dictionary.
+
+    With incremental=True the newest saved sweep of the same format is reused for cells whose
+    summary file has not changed since it was saved.
+
+    Args:
+    @sum_path(str): Path to the summary data objects
+    @code_path(str): folder with Joule_cell_id.csv
+    @output_path(str): folder to save the sweep to, made if it does not exist
+    @temperatures(list[int]): temperatures of the cells to run. None runs all. The saved sweep is 24C only
+    @cell_types(list[str]): cell types to run. None runs all
+    @cell_ids(list[str]): cell ids to run. None runs all
+    @eol_cond(float): eol capacity in %
+    @min_data_points(int): minimum number of data points needed to perform extrapolation
+    @num_workers(int): Number of worker processes
+    @seed(int): random seed passed to differential_evolution
+    @output_format(str): "pkl", "npy" or "parquet"
+    @incremental(Boolean): Reuse the sweeps of unchanged cells from the newest saved sweep
+    @date_string(str): date in the file name. None uses today as YYYY-MM-DD
+
+    Returns:
+    @file_path(str): path of the saved sweep
+    @failed_cells(list[tuple(str, str)]): (cell_id, error) of cells that failed to load or fit
+    """
+    import numpy as np
+    from plotting_and_fitting_helpers import (get_eol_error_sweep_batch, save_eol_error_sweep, load_eol_error_sweep,
+                                              eol_error_sweep_to_dict, eol_error_dict_to_sweep)
+    from Joule_file_io import atomic_write
+    cell_id_df = get_cell_id_df(code_path, cell_types, cell_ids, temperatures)
+    sum_path = os.path.join(sum_path, "")
+    cell_id_list = [x for x in cell_id_df["Cell_id"] if os.path.exists(sum_path+"{}_sum.json".format(x))]
+    date_string = date_string if date_string is not None else datetime.now().strftime("%Y-%m-%d")
+    os.makedirs(output_path, exist_ok=True)
+
+    kept_array = None
+    run_id_list = cell_id_list
+    previous_file_path = _get_latest_output(output_path, EOL_FILE_PREFIX, output_format) if incremental else None
+    if previous_file_path is not None:
+        if output_format=="pkl":
+            with open(previous_file_path, "rb") as openfile:
+                previous_array = eol_error_dict_to_sweep(pickle.load(openfile))
+        else:
+            previous_array = load_eol_error_sweep(previous_file_path)
+        unchanged_set = set(x.split("_")[0] for x in _get_unchanged(["{}_sum.json".format(x) for x in cell_id_list],
+                                                                    sum_path, previous_file_path))
+        kept_array = previous_array[np.isin(previous_array["cell_id"], list(unchanged_set))]
+        kept_set = set(kept_array["cell_id"])
+        run_id_list = [x for x in cell_id_list if x not in kept_set]
+
+    sweep_array, failed_cells = get_eol_error_sweep_batch(run_id_list, sum_path, eol_cond=eol_cond,
+                                                          min_data_points=min_data_points, num_workers=num_workers, seed=seed)
+    if kept_array is not None:
+        sweep_array = np.concatenate([kept_array, sweep_array])
+        #Same order as a full run, stable so the cutoffs of each cell stay in order
+        order_dict = {x: idx for idx, x in enumerate(cell_id_list)}
+        sweep_array = sweep_array[np.argsort([order_dict[x] for x in sweep_array["cell_id"]], kind="stable")]
+
+    file_path = os.path.join(output_path, "{}{}.{}".format(EOL_FILE_PREFIX, date_string, output_format))
+    if output_format=="pkl":
+        with atomic_write(file_path, mode="wb", overwrite=True) as outfile:
+            pickle.dump(eol_error_sweep_to_dict(sweep_array), outfile)
+    else:
+        save_eol_error_sweep(sweep_array, file_path)
+    return file_path, failed_cells
+
+def _run_build_command(args):
+    failed_cells = build_summaries(args.raw_path, args.sum_path, args.code_path, cell_types=args.cell_type,
+                                   cell_ids=args.cell_id, num_workers=args.workers, chunksize=args.chunksize,
+                                   incremental=args.incremental, overwrite=not args.no_overwrite, lock=args.lock,
+                                   file_index_path=args.file_index)
+    _print_failed(failed_cells)
+
+def _run_fit_command(args):
+    file_path_dict = fit_t_x_models(args.sum_path, args.code_path, args.output_path, metric_types=args.metric,
+                                    cell_types=args.cell_type, cell_ids=args.cell_id, eol_cond=args.eol_cond,
+                                    num_workers=args.workers, chunksize=args.chunksize, maxiter=args.maxiter,
+                                    seed=args.seed, output_format=args.format, incremental=args.incremental,
+                                    date_string=args.date)
+    for file_path in file_path_dict.values():
+        print("Saved {}".format(file_path))
+
+def _run_eol_command(args):
+    temperatures = None if "all" in args.temperature else [int(x) for x in args.temperature]
+    file_path, failed_cells = run_eol_sweep(args.sum_path, args.code_path, args.output_path, temperatures=temperatures,
+                                            cell_types=args.cell_type, cell_ids=args.cell_id, eol_cond=args.eol_cond,
+                                            min_data_points=args.min_data_points, num_workers=args.workers,
+                                            seed=args.seed, output_format=args.format, incremental=args.incremental,
+                                            date_string=args.date)
+    print("Saved {}".format(file_path))
+    _print_failed(failed_cells)
+
+def _run_serve_command(args):
+    from Joule_query_service import run_query_service
+    print("Serving {} on http://{}:{}".format(args.sum_path, args.host, args.port))
+    run_query_service(args.sum_path, args.code_path, host=args.host, port=args.port, unix_socket_path=args.unix_socket,
+                      num_workers=args.workers, reload_interval=args.reload_interval)
+
+def _print_failed(failed_list):
+    if len(failed_list)>0:
+        print("{} cells failed:".format(len(failed_list)), file=sys.stderr)
+    for cell_id, error in failed_list:
+        print("{}: {}".format(cell_id, error), file=sys.stderr)
+
+def _get_latest_output(output_path, file_prefix, output_format):
+    """
+    Returns the saved result with the newest date in its name, None if there isn't one.
+    """
+    file_path_list = sorted(glob.glob(os.path.join(glob.escape(output_path), "{}*.{}".format(file_prefix, output_format))))
+    if len(file_path_list)==0:
+        return None
+    return file_path_list[-1]
+
+def _get_unchanged(sum_obj_list, sum_path, previous_file_path):
+    """
+    Returns the summary files that were last modified before previous_file_path was saved.
+    """
+    previous_mtime = os.stat(previous_file_path).st_mtime_ns
+    return [x for x in sum_obj_list if os.stat(sum_path+x).st_mtime_ns<=previous_mtime]
+
+def _read_table(file_path, output_format):
+    import pandas as pd
+    if output_format=="csv":
+        return pd.read_csv(file_path, index_col=False)
+    if output_format=="parquet":
+        return pd.read_parquet(file_path)
+    return pd.read_json(file_path, orient="records")
+
+def _write_table(df, file_path, output_format):
+    """
+    Saves a table atomically in output_format, replacing an existing file.
+    """
+    from Joule_file_io import atomic_write
+    if output_format=="csv":
+        with atomic_write(file_path, overwrite=True) as outfile:
+            df.to_csv(outfile, index=False)
+    elif output_format=="parquet":
+        with atomic_write(file_path, mode="wb", overwrite=True) as outfile:
+            df.to_parquet(outfile, index=False)
+    else:
+        with atomic_write(file_path, overwrite=True) as outfile:
+            df.to_json(outfile, orient="records")
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import functools
+import inspect
+from contextlib import contextmanager
+
+#Profiler that stages are recorded to. None when profiling is off
+_active_profiler = None
+
+
+def profile_stage(stage_name, rows_fun=None, file_path_arg=None, cell_id_arg=None):
+    """
+    Decorator that records every call of a function as a stage of the active stage_profiler. When
+    no profiler is active the function is called directly, so the only cost is one extra function
+    call and a check of a global variable.
+
+    Args:
+    @stage_name(str): name of the stage in the records
+    @rows_fun(function): takes the dict of arguments of the call and the output and returns the
+        number of rows processed
+    @file_path_arg(str): name of the argument with the path of the file read. Its size is recorded
+        as the bytes read and the cell_id is taken from the start of the file name
+    @cell_id_arg(str): name of the argument with the cell_id. If neither this or file_path_arg is
+        given the cell_id of the stage this was called from is used
+
+    Returns:
+    @decorator(function): decorator to put on the function
+    """
+    def decorator(fun):
+        signature = inspect.signature(fun)
+
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            profiler = _active_profiler
+            if profiler is None:
+                return fun(*args, **kwargs)
+
+            arguments = signature.bind(*args, **kwargs).arguments
+            cell_id = None
+            bytes_read = None
+            if cell_id_arg is not None:
+                cell_id = arguments.get(cell_id_arg)
+            if file_path_arg is not None and isinstance(arguments.get(file_path_arg), str):
+                file_path = arguments[file_path_arg]
+                if os.path.exists(file_path):
+                    bytes_read = os.path.getsize(file_path)
+                if cell_id is None:
+                    cell_id = os.path.basename(file_path).split("_")[0]
+
+            with profiler.stage(stage_name, cell_id=cell_id, bytes_read=bytes_read) as record:
+                output = fun(*args, **kwargs)
+                if rows_fun is not None:
+                    record["rows"] = rows_fun(arguments, output)
+            return output
+        return wrapper
+    return decorator
+
+def get_active_profiler():
+    """
+    Returns the active stage_profiler or None if profiling is off.
+    """
+    return _active_profiler
+
+class stage_profiler():
+    def __init__(self):
+        """
+        Records the wall time, rows processed and bytes read of every decorated function called
+        while it is active. Use it as a context manager for ad hoc profiling:
+
+            with stage_profiler() as profiler:
+                generate_sum_data_cell_id("C00001", raw_path, cell_type)
+            profiler.summary()
+
+        or call start and stop around a longer run such as a nightly rebuild. Blocks of code can be
+        recorded as their own stage with profiler.stage(...). Calls made in worker processes of a
+        process pool are not recorded.
+        """
+        self.records   = []
+        self._stack    = []
+        self._previous = None
+        self._start    = time.perf_counter()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def start(self):
+        """
+        Makes this the active profiler.
+        """
+        global _active_profiler
+        self._previous = _active_profiler
+        _active_profiler = self
+
+    def stop(self):
+        """
+        Stops recording and makes the profiler that was active before start active again.
+        """
+        global _active_profiler
+        _active_profiler = self._previous
+        self._previous = None
+
+    @contextmanager
+    def stage(self, stage_name, cell_id=None, bytes_read=None, rows=None):
+        """
+        Context manager that records the code inside it as a stage. The yielded record is a dict
+        so rows and bytes_read can be filled in once they are known. Stages can be nested, the
+        parent stage and depth of each stage are recorded and a stage without a cell_id uses the
+        cell_id of its parent.
+
+        Args:
+        @stage_name(str): name of the stage in the records
+        @cell_id(str): cell the stage is for
+        @bytes_read(int): bytes read by the stage
+        @rows(int): rows processed by the stage
+
+        Returns:
+        @record(dict): record of the stage
+        """
+        parent = self._stack[-1] if len(self._stack)>0 else None
+        if cell_id is None and parent is not None:
+            cell_id = parent["cell_id"]
+        record = {"stage": stage_name, "cell_id": cell_id, "parent": None if parent is None else parent["stage"],
+                  "depth": len(self._stack), "start_s": time.perf_counter()-self._start, "wall_time_s": None,
+                  "rows": rows, "bytes_read": bytes_read, "error": None}
+        self._stack.append(record)
+        start_time = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = "{}: {}".format(type(e).__name__, e)
+            raise
+        finally:
+            record["wall_time_s"] = time.perf_counter()-start_time
+            self._stack.pop()
+            self.records.append(record)
+
+    def to_dataframe(self):
+        """
+        Returns the records as a dataframe with a row per stage call in the order they started.
+        """
+        #pandas is only needed for the results so profiled code doesn't import it just for this module
+        import pandas as pd
+        columns = ["stage", "cell_id", "parent", "depth", "start_s", "wall_time_s", "rows", "bytes_read", "error"]
+        record_df = pd.DataFrame(self.records, columns=columns).sort_values("start_s", ignore_index=True)
+        record_df[["rows", "bytes_read"]] = record_df[["rows", "bytes_read"]].astype("Int64")
+        return record_df
+
+    def summary(self, by_cell=False):
+        """
+        Returns the number of calls, total wall time, rows and bytes read of each stage.
+
+        Args:
+        @by_cell(Boolean): True to also split the totals by cell_id
+
+        Returns:
+        @summary_df(pd.DataFrame): totals of each stage sorted by wall time
+        """
+        group_cols = ["stage", "cell_id"] if by_cell else ["stage"]
+        record_df = self.to_dataframe()
+        summary_df = record_df.groupby(group_cols, dropna=False).agg(calls=("wall_time_s", "size"),
+                                                                     wall_time_s=("wall_time_s", "sum"),
+                                                                     rows=("rows", "sum"), bytes_read=("bytes_read", "sum"))
+        summary_df["rows_per_s"] = summary_df["rows"]/summary_df["wall_time_s"]
+        return summary_df.sort_values("wall_time_s", ascending=False).reset_index()
+
+    def to_csv(self, file_path):
+        """
+        Saves the records to a csv file.
+        """
+        self.to_dataframe().to_csv(file_path, index=False)
+
+    def to_json(self, file_path):
+        """
+        Saves the records to a json file as a list of dicts.
+        """
+        with open(file_path, "w") as outfile:
+            json.dump(self.to_dataframe().astype(object).where(lambda df: df.notna(), None).to_dict(orient="records"),
+                      outfile)
@@ -0,0 +1,423 @@
+import os
+import json
+import asyncio
+import urllib.error
+import urllib.parse
+import urllib.request
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+#Default address of the query service, only reachable from this machine
+QUERY_SERVICE_HOST = "127.0.0.1"
+QUERY_SERVICE_PORT = 8765
+#Metric used for eol times and capacity fits
+QUERY_CAP_METRIC = "RPT0.2C_2_D_capacity"
+QUERY_RES_METRIC = "Res_SS_2_D"
+#Status line of each HTTP status code the service returns
+HTTP_STATUS_DICT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                    500: "Internal Server Error"}
+
+
+def run_query_service(sum_path, code_path, host=QUERY_SERVICE_HOST, port=QUERY_SERVICE_PORT, unix_socket_path=None,
+                      num_workers=2, reload_interval=30, max_cache_entries=1024):
+    """
+    Starts a sum_query_service and serves requests until it is stopped (ctrl+c).
+
+    Args:
+    @sum_path(str): Path to the summary data objects
+    @code_path(str): folder with Joule_cell_id.csv
+    @host(str): address to listen on, the default only accepts connections from this machine
+    @port(int): port to listen on
+    @unix_socket_path(str): also listen on this unix socket
+    @num_workers(int): worker processes for loading, smoothing and fitting
+    @reload_interval(float): seconds between checks for changed summary files
+    @max_cache_entries(int): responses kept in the response cache
+
+    Returns:
+    None
+    """
+    service = sum_query_service(sum_path, code_path, num_workers=num_workers, reload_interval=reload_interval,
+                                max_cache_entries=max_cache_entries)
+    try:
+        asyncio.run(service.serve_forever(host, port, unix_socket_path))
+    except KeyboardInterrupt:
+        pass
+
+def query_service(endpoint, host=QUERY_SERVICE_HOST, port=QUERY_SERVICE_PORT, timeout=600, **params):
+    """
+    Sends a request to a running query service and returns the decoded json response. Lists in
+    params are sent as repeated parameters, ex: query_service("eol", cell_id=["C00001", "C00002"]).
+
+    Args:
+    @endpoint(str): "status", "cells", "metric", "mean_trend", "eol" or "tx_fit"
+    @host(str): address of the service
+    @port(int): port of the service
+    @timeout(float): seconds to wait for the response
+    @params: parameters of the endpoint, see sum_query_service.handle_request
+
+    Returns:
+    @response(dict): decoded json response
+    """
+    query_string = urllib.parse.urlencode({x: y for x, y in params.items() if y is not None}, doseq=True)
+    url = "http://{}:{}/{}?{}".format(host, port, endpoint, query_string)
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise Exception("Query service error {}: {}".format(e.code, json.loads(e.read()).get("error")))
+
+def _load_service_cell(file_path):
+    """
+    Worker function of sum_query_service. Loads a summary file as a float64 cellLife_compact_sum_obj.
+    """
+    from Joule_sum_data_builder import load_sum_obj
+    from Joule_compact_sum import compact_sum_obj
+    return compact_sum_obj(load_sum_obj(file_path), dtype=np.float64)
+
+def _get_eol_times(time_points_list, cap_points_list, eol_cond):
+    """
+    Worker function of sum_query_service. Smoothed eol time in weeks of each cell, nan if not reached.
+    """
+    from plotting_and_fitting_helpers import get_smoothed_cap_eol_times
+    return get_smoothed_cap_eol_times(time_points_list, cap_points_list, [eol_cond])[:, 0]
+
+def _fit_t_x_cell(time_points, cap_points, res_points, metric_type, eol_cond, seed):
+    """
+    Worker function of sum_query_service. (a, b, mae) of the t^x fit of a cell, None if there is
+    too little data to fit.
+    """
+    from plotting_and_fitting_helpers import get_t_x_fit_points, fit_t_x
+    time_points_to_fit, metric_points_to_fit = get_t_x_fit_points(time_points, cap_points, res_points=res_points,
+                                                                  eol_cond=eol_cond)
+    if time_points_to_fit is None:
+        return None
+    return fit_t_x(time_points_to_fit, metric_points_to_fit, metric_type=metric_type, seed=seed)
+
+def _to_jsonable(value):
+    """
+    Converts np.arrays and numbers to lists and floats with nan as None (null) so they can be sent as json.
+    """
+    if isinstance(value, dict):
+        return {str(x): _to_jsonable(y) for x, y in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(x) for x in value]
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind=="f":
+            return [None if np.isnan(x) else x for x in value.tolist()]
+        return _to_jsonable(value.tolist())
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+class sum_query_service():
+    def __init__(self, sum_path, code_path, num_workers=2, reload_interval=30, max_cache_entries=1024):
+        """
+        Read only query service for the summary data of every cell in sum_path. The summary data is
+        kept in memory as cellLife_compact_sum_obj (float64) and checked for changed, new and
+        removed {cell_id}_sum.json files every reload_interval seconds. Changed files are reloaded
+        in the background and the old data is served until they are loaded.
+
+        Requests are handled with asyncio so many clients can wait at once. Loading, smoothing
+        (get_mean_trend_from_points, get_smoothed_cap_eol_times) and fitting (fit_t_x) is done in a
+        process pool so it doesn't block other requests. Every endpoint uses the cells in memory,
+        files are only read by the reloads. Responses are kept in an LRU cache keyed by the request
+        and the file fingerprints of the cells it used, so a changed file is never served from the
+        cache, and identical requests that arrive together are only computed once.
+
+        Endpoints are served over HTTP (GET, json responses) with serve_forever, or can be called
+        directly with handle_request. See handle_request for the endpoints and their parameters.
+
+        Args:
+        @sum_path(str): Path to the summary data objects
+        @code_path(str): folder with Joule_cell_id.csv
+        @num_workers(int): worker processes for loading, smoothing and fitting
+        @reload_interval(float): seconds between checks for changed summary files
+        @max_cache_entries(int): responses kept in the response cache
+        """
+        self.sum_path          = os.path.join(sum_path, "")
+        self.code_path         = code_path
+        self.num_workers       = num_workers
+        self.reload_interval   = reload_interval
+        self.max_cache_entries = max_cache_entries
+        self.cells             = {}
+        self.fingerprints      = {}
+        self.load_errors       = {}
+        self.reload_count      = 0
+        self.cache_hits        = 0
+        self.cache_misses      = 0
+        self._cache            = OrderedDict()
+        self._pending          = {}
+        self._executor         = None
+        self._reload_task      = None
+        self._reload_lock      = None
+        self._cell_id_df       = None
+
+    async def start(self):
+        """
+        Starts the worker pool, loads every summary file and starts the background reloads.
+        """
+        from Joule_pipeline import get_cell_id_df
+        self._executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        self._reload_lock = asyncio.Lock()
+        self._cell_id_df = get_cell_id_df(self.code_path)
+        await self.reload()
+        if self.reload_interval is not None and self.reload_interval>0:
+            self._reload_task = asyncio.get_running_loop().create_task(self._reload_loop())
+
+    async def stop(self):
+        """
+        Stops the background reloads and the worker pool.
+        """
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            try:
+                await self._reload_task
+            except asyncio.CancelledError:
+                pass
+            self._reload_task = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def serve_forever(self, host=QUERY_SERVICE_HOST, port=QUERY_SERVICE_PORT, unix_socket_path=None):
+        """
+        Starts the service and serves HTTP requests on host:port (and unix_socket_path if given)
+        until cancelled.
+        """
+        await self.start()
+        server_list = [await asyncio.start_server(self._handle_connection, host, port)]
+        if unix_socket_path is not None:
+            server_list.append(await asyncio.start_unix_server(self._handle_connection, unix_socket_path))
+        try:
+            await asyncio.gather(*[server.serve_forever() for server in server_list])
+        finally:
+            for server in server_list:
+                server.close()
+            await self.stop()
+
+    async def reload(self):
+        """
+        Loads summary files that are new or changed since they were loaded and drops cells whose
+        file was removed. Files that fail to load keep their old data and are retried next time.
+
+        Returns:
+        @changed_list(list[str]): cell ids that were loaded or dropped
+        """
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            file_stat_dict = await loop.run_in_executor(None, self._get_file_stats)
+            changed_list = [x for x, y in file_stat_dict.items() if self.fingerprints.get(x)!=y]
+            removed_list = [x for x in self.cells if x not in file_stat_dict]
+
+            load_futures = [loop.run_in_executor(self._executor, _load_service_cell,
+                                                 self.sum_path+"{}_sum.json".format(x)) for x in changed_list]
+            load_results = await asyncio.gather(*load_futures, return_exceptions=True)
+            for cell_id, result in zip(changed_list, load_results):
+                if isinstance(result, Exception):
+                    self.load_errors[cell_id] = "{}: {}".format(type(result).__name__, result)
+                    continue
+                self.cells[cell_id] = result
+                self.fingerprints[cell_id] = file_stat_dict[cell_id]
+                self.load_errors.pop(cell_id, None)
+            for cell_id in removed_list:
+                self.cells.pop(cell_id, None)
+                self.fingerprints.pop(cell_id, None)
+            self.reload_count += 1
+            return [x for x in changed_list if x not in self.load_errors]+removed_list
+
+    async def handle_request(self, endpoint, params):
+        """
+        Answers a request. Every parameter can be given more than once (or as a list) where a list
+        makes sense. Group filters are cell_type, soc, temperature, lot and cell_id. Time points
+        are in weeks and nan values are None.
+
+        Endpoints:
+        status: number of cells loaded, load errors, reloads and cache hits/misses
+        cells (filters): Joule_cell_id.csv rows of the loaded cells
+        metric (cell_id, metric): time(weeks) and the metric(s) of a cell
+        mean_trend (filters, metric, normalize=true): mean trend of the group, the same as
+            get_mean_trend of its files, time(weeks), mean, std and num_cells
+        eol (filters, eol_cond=90): smoothed eol time in weeks of each cell, None if not reached
+        tx_fit (filters, metric_type=cap, eol_cond=90, seed): a, b and mae of the t^x fit of each
+            cell, None if there is too little data
+
+        Args:
+        @endpoint(str): name of the endpoint
+        @params(dict): parameter name -> value or list of values (as given by urllib.parse.parse_qs)
+
+        Returns:
+        @response(dict): json serializable response
+        """
+        params = {x: (list(y) if isinstance(y, (list, tuple)) else [y]) for x, y in params.items()}
+        if endpoint=="status":
+            return {"num_cells": len(self.cells), "load_errors": self.load_errors, "reload_count": self.reload_count,
+                    "cache_hits": self.cache_hits, "cache_misses": self.cache_misses, "cache_entries": len(self._cache)}
+        if endpoint not in ["cells", "metric", "mean_trend", "eol", "tx_fit"]:
+            raise KeyError("Unknown endpoint {}".format(endpoint))
+
+        cell_id_list = self._get_cell_ids(params)
+        cache_key = (endpoint, tuple(sorted((x, tuple(str(z) for z in y)) for x, y in params.items())),
+                     tuple((x, tuple(self.fingerprints[x])) for x in cell_id_list))
+        if cache_key in self._cache:
+            self._cache.move_to_end(cache_key)
+            self.cache_hits += 1
+            return self._cache[cache_key]
+        #The same request is already being computed, wait for it instead of computing it again
+        if cache_key in self._pending:
+            self.cache_hits += 1
+            return await asyncio.shield(self._pending[cache_key])
+
+        self.cache_misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[cache_key] = future
+        try:
+            response = _to_jsonable(await getattr(self, "_get_"+endpoint)(params, cell_id_list))
+            future.set_result(response)
+        except Exception as e:
+            future.set_exception(e)
+            #Retrieve the exception so it is not reported as never retrieved when nobody else waits
+            future.exception()
+            raise
+        finally:
+            self._pending.pop(cache_key, None)
+
+        self._cache[cache_key] = response
+        while len(self._cache)>self.max_cache_entries:
+            self._cache.popitem(last=False)
+        return response
+
+    async def _get_cells(self, params, cell_id_list):
+        cell_info_df = self._cell_id_df.drop_duplicates("Cell_id").set_index("Cell_id")
+        cell_info_df = cell_info_df.reindex(cell_id_list).reset_index()
+        return {"cells": cell_info_df.astype(object).where(cell_info_df.notna(), None).to_dict(orient="records")}
+
+    async def _get_metric(self, params, cell_id_list):
+        if len(cell_id_list)!=1 or "cell_id" not in params:
+            raise ValueError("metric needs one cell_id")
+        cell = self.cells[cell_id_list[0]]
+        response = {"cell_id": cell_id_list[0], "time(weeks)": cell.get_time_points()}
+        for metric in self._get_param(params, "metric", as_list=True, required=True):
+            if metric not in cell.columns:
+                raise KeyError("Unknown metric {}".format(metric))
+            response[metric] = cell.get(metric)
+        return response
+
+    async def _get_mean_trend(self, params, cell_id_list):
+        from plotting_and_fitting_helpers import get_mean_trend_from_points
+        metric = self._get_param(params, "metric", required=True)
+        normalize_before_mean = self._get_param(params, "normalize", "true").lower() in ["true", "1"]
+        if len(cell_id_list)>0 and metric not in self.cells[cell_id_list[0]].columns:
+            raise KeyError("Unknown metric {}".format(metric))
+        #Taken from the cells in memory before waiting, so the response matches the fingerprints it is cached under
+        time_points_list = [self.cells[x].get_time_points() for x in cell_id_list]
+        metric_points_list = [self.cells[x].get(metric) for x in cell_id_list]
+        mean_metric_array, std_metric_array, all_times, num_cells_array = await asyncio.get_running_loop().run_in_executor(
+            self._executor, get_mean_trend_from_points, time_points_list, metric_points_list, normalize_before_mean)
+        return {"cells": cell_id_list, "time(weeks)": all_times, "mean": mean_metric_array, "std": std_metric_array,
+                "num_cells": num_cells_array}
+
+    async def _get_eol(self, params, cell_id_list):
+        eol_cond = float(self._get_param(params, "eol_cond", 90))
+        eol_time_array = await asyncio.get_running_loop().run_in_executor(
+            self._executor, _get_eol_times, [self.cells[x].get_time_points() for x in cell_id_list],
+            [self.cells[x].get(QUERY_CAP_METRIC) for x in cell_id_list], eol_cond)
+        return {"eol_cond": eol_cond, "eol_time(weeks)": dict(zip(cell_id_list, eol_time_array))}
+
+    async def _get_tx_fit(self, params, cell_id_list):
+        metric_type = self._get_param(params, "metric_type", "cap")
+        if metric_type not in ["cap", "res"]:
+            raise ValueError("metric_type must be cap or res")
+        eol_cond = float(self._get_param(params, "eol_cond", 90))
+        seed = self._get_param(params, "seed")
+        seed = int(seed) if seed is not None else None
+        loop = asyncio.get_running_loop()
+        #Each cell is fit by its own worker call so the fits of a group are spread over the pool
+        fit_futures = [loop.run_in_executor(self._executor, _fit_t_x_cell, self.cells[x].get_time_points(),
+                                            self.cells[x].get(QUERY_CAP_METRIC),
+                                            self.cells[x].get(QUERY_RES_METRIC) if metric_type=="res" else None,
+                                            metric_type, eol_cond, seed) for x in cell_id_list]
+        fit_results = await asyncio.gather(*fit_futures)
+        fit_dict = {x: (None if y is None else {"a": y[0], "b": y[1], "mae": y[2]}) for x, y in zip(cell_id_list, fit_results)}
+        return {"metric_type": metric_type, "eol_cond": eol_cond, "fits": fit_dict}
+
+    def _get_cell_ids(self, params):
+        """
+        Loaded cell ids that pass the filters in params, in the order of Joule_cell_id.csv.
+        """
+        from Joule_file_index import filter_file_index
+        filter_dict = {}
+        for param, col, dtype in [("cell_type", "cell_type", str), ("soc", "soc", int), ("temperature", "temperature", int),
+                                  ("lot", "lot", str)]:
+            if param in params:
+                filter_dict[col] = [dtype(x) for x in params[param]]
+        filtered_df = filter_file_index(self._cell_id_df, **filter_dict)
+        cell_id_list = [x for x in dict.fromkeys(filtered_df["Cell_id"]) if x in self.cells]
+        if "cell_id" in params:
+            requested_set = set(str(x) for x in params["cell_id"])
+            missing_list = [x for x in requested_set if x not in self.cells]
+            if len(missing_list)>0:
+                raise KeyError("No summary data loaded for {}".format(", ".join(sorted(missing_list))))
+            cell_id_list = [x for x in cell_id_list if x in requested_set]
+        return cell_id_list
+
+    def _get_param(self, params, name, default=None, as_list=False, required=False):
+        if name not in params:
+            if required:
+                raise ValueError("Missing parameter {}".format(name))
+            return default
+        return params[name] if as_list else params[name][0]
+
+    def _get_file_stats(self):
+        """
+        (size, mtime_ns) of every {cell_id}_sum.json file in sum_path.
+        """
+        file_stat_dict = {}
+        for entry in os.scandir(self.sum_path):
+            if entry.name.endswith("_sum.json"):
+                file_stat = entry.stat()
+                file_stat_dict[entry.name[:-len("_sum.json")]] = (file_stat.st_size, file_stat.st_mtime_ns)
+        return file_stat_dict
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                self.load_errors["reload"] = "{}: {}".format(type(e).__name__, e)
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Answers one HTTP GET request on a connection and closes it.
+        """
+        status = 200
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            #Skip the headers, GET requests have no body
+            while (await reader.readline()) not in [b"\r\n", b"\n", b""]:
+                pass
+            if len(request_line)<2 or request_line[0]!="GET":
+                status, response = 405, {"error": "Only GET requests are supported"}
+            else:
+                url = urllib.parse.urlsplit(request_line[1])
+                response = await self.handle_request(url.path.strip("/"), urllib.parse.parse_qs(url.query))
+        except KeyError as e:
+            status, response = 404, {"error": str(e.args[0]) if len(e.args)>0 else str(e)}
+        except ValueError as e:
+            status, response = 400, {"error": str(e)}
+        except Exception as e:
+            status, response = 500, {"error": "{}: {}".format(type(e).__name__, e)}
+
+        body = json.dumps(response).encode()
+        header = "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(
+            status, HTTP_STATUS_DICT[status], len(body))
+        try:
+            writer.write(header.encode()+body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
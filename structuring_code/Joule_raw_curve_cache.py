@@ -0,0 +1,175 @@
+import pandas as pd
+import numpy as np
+import os
+import json
+from Joule_raw_data_builder import load_raw_obj
+
+#Raw data columns stored in the curve cache
+CURVE_COLUMNS = ["Test Time (s)", "Voltage (V)", "Current (A)", "Capacity (Ah)", "Energy (Wh)"]
+
+
+def build_raw_curve_cache(raw_obj, cache_file_prefix, overwrite=False, columns=CURVE_COLUMNS):
+    """
+    This function saves the voltage, current, capacity, energy and time curves of a cellLife_raw_obj
+    to a curve cache that can be memory mapped by load_raw_curve_cache. The columns are stored as
+    rows of one contiguous float64 array in {cache_file_prefix}_curves.npy. The rows of the raw
+    data are ordered by diag_num, Cycle and then MD step (in the order the steps were run) so every
+    (diag_num, Cycle, MD) segment is one contiguous block. The start and end offset of every
+    segment is saved in {cache_file_prefix}_curves_index.json.
+
+    Args:
+    @raw_obj(cellLife_raw_obj): raw data object to cache
+    @cache_file_prefix(str): path and start of the cache file names, ex: cache_path+"C00001"
+    @overwrite(Boolean): True if you want to overwrite an existing cache
+    @columns(list[str]): raw data columns to cache. Columns missing from the raw data are skipped
+
+    Returns:
+    None
+    """
+    array_file_path = cache_file_prefix+"_curves.npy"
+    index_file_path = cache_file_prefix+"_curves_index.json"
+    #throw error if file already exists so we don't overwrite it
+    if (os.path.exists(array_file_path) and not overwrite):
+        raise Exception("File already exists")
+
+    raw_data = raw_obj.raw_data
+    columns = [col for col in columns if col in raw_data.columns]
+
+    #Group id of each row in order of first appearance, then order groups by diag_num and Cycle
+    segment_keys = raw_data[["diag_num", "Cycle", "MD"]]
+    segment_codes, _ = pd.factorize(pd.MultiIndex.from_frame(segment_keys))
+    first_rows = np.unique(segment_codes, return_index=True)[1]
+    segment_df = segment_keys.iloc[first_rows].reset_index(drop=True)
+    segment_order = np.lexsort((np.arange(len(segment_df)), segment_df["Cycle"].to_numpy(),
+                                segment_df["diag_num"].to_numpy()))
+    segment_rank = np.empty(len(segment_order), dtype=int)
+    segment_rank[segment_order] = np.arange(len(segment_order))
+    row_order = np.argsort(segment_rank[segment_codes], kind="stable")
+
+    segment_sizes = np.bincount(segment_codes, minlength=len(segment_df))[segment_order]
+    segment_ends = np.cumsum(segment_sizes)
+    segment_starts = segment_ends-segment_sizes
+
+    #Write each column straight in to the memory mapped file
+    curve_array = np.lib.format.open_memmap(array_file_path, mode="w+", dtype=np.float64,
+                                            shape=(len(columns), len(raw_data)))
+    for col_idx, col in enumerate(columns):
+        #Corrupted string entries (see get_energy) become nan
+        col_values = pd.to_numeric(raw_data[col], errors="coerce").to_numpy(dtype=np.float64)
+        curve_array[col_idx] = col_values[row_order]
+    curve_array.flush()
+    del curve_array
+
+    ordered_segment_df = segment_df.iloc[segment_order]
+    segment_list = [[int(diag_num), int(cycle), str(md), int(start), int(end)] for diag_num, cycle, md, start, end
+                    in zip(ordered_segment_df["diag_num"], ordered_segment_df["Cycle"], ordered_segment_df["MD"],
+                           segment_starts, segment_ends)]
+    with open(index_file_path, "w") as outfile:
+        json.dump({"columns": columns, "segments": segment_list}, outfile)
+
+def convert_raw_to_curve_cache(raw_path, cache_path, overwrite=False, return_errors=False):
+    """
+    This function builds the curve cache of every {cell_id}_raw.json file in raw_path. The cache of
+    each cell is saved as {cell_id}_curves.npy and {cell_id}_curves_index.json in cache_path.
+
+    Args:
+    @raw_path(str): Path to the raw data json objects
+    @cache_path(str): Path of where to save the curve caches
+    @overwrite(Boolean): Whether you want to overwrite already existing curve caches
+    @return_errors(Boolean): True to also return the error of every file that failed
+
+    Returns:
+    @files_failed(list[str]): The raw filenames that could not be cached
+    @errors_list(list[tuple(str, str)]): (filename, error) of every file that failed, only returned
+        if return_errors is True
+    """
+    from tqdm import tqdm
+    raw_file_list = sorted([x for x in os.listdir(raw_path) if x.endswith("_raw.json")])
+    errors_list = []
+
+    for i in tqdm(range(len(raw_file_list))):
+        raw_name = raw_file_list[i]
+        cell_id = raw_name.split("_")[0]
+        try:
+            build_raw_curve_cache(load_raw_obj(raw_path+raw_name), cache_path+cell_id, overwrite=overwrite)
+        except Exception as e:
+            errors_list.append((raw_name, "{}: {}".format(type(e).__name__, e)))
+
+    files_failed = [raw_name for raw_name, _ in errors_list]
+    if return_errors:
+        return files_failed, errors_list
+    return files_failed
+
+def load_raw_curve_cache(cache_file_prefix):
+    """
+    This function memory maps a curve cache saved by build_raw_curve_cache. Nothing is read from
+    the array file until a segment is accessed.
+
+    Args:
+    @cache_file_prefix(str): path and start of the cache file names, ex: cache_path+"C00001"
+
+    Returns:
+    @obj(cellLife_curve_cache): memory mapped curve cache
+    """
+    with open(cache_file_prefix+"_curves_index.json", "r") as openfile:
+        index_dict = json.load(openfile)
+    curve_array = np.load(cache_file_prefix+"_curves.npy", mmap_mode="r")
+    obj = cellLife_curve_cache(curve_array=curve_array, columns=index_dict["columns"], segments=index_dict["segments"])
+    return obj
+
+class cellLife_curve_cache():
+    def __init__(self, curve_array, columns, segments):
+        """
+        Constructor for cellLife_curve_cache
+        Args:
+        @curve_array(np.array): (columns, rows) array, usually memory mapped, with a row per column
+        @columns(list[str]): name of each row of curve_array
+        @segments(list[list]): [diag_num, Cycle, MD, start, end] of every segment in order
+        """
+        self.curve_array = curve_array
+        self.columns     = list(columns)
+        self.segments    = segments
+        self.segment_dict = {(diag_num, cycle, md): (start, end) for diag_num, cycle, md, start, end in segments}
+
+    def get_segment(self, diag_num, cycle=None, md=None, columns=None):
+        """
+        Returns the curves of a diagnostic, a cycle of a diagnostic or a single step (MD) of a cycle
+        as views in to the cache without reading or copying anything else.
+
+        Args:
+        @diag_num(int): diagnostic number
+        @cycle(int): Cycle number. None returns the whole diagnostic
+        @md(str): step of the cycle, ex: "C" or "D". None returns the whole cycle
+        @columns(list[str]): columns to return. None returns all of the cached columns
+
+        Returns:
+        @segment_dict(dict): column -> np.array view of the segment
+        """
+        start, end = self._get_bounds(diag_num, cycle, md)
+        if columns is None:
+            columns = self.columns
+        return {col: self.curve_array[self.columns.index(col), start:end] for col in columns}
+
+    def get_cycles(self, diag_num):
+        """
+        Returns the sorted cycle numbers of a diagnostic, the same as sorted(set(df_diag["Cycle"]))
+        """
+        return sorted(set(cycle for diag, cycle, _, _, _ in self.segments if diag==diag_num))
+
+    def _get_bounds(self, diag_num, cycle=None, md=None):
+        """
+        Start and end row of a diagnostic, cycle or step. Segments are ordered by diag_num and Cycle
+        so a whole diagnostic or cycle is also one contiguous block.
+        """
+        if md is not None:
+            if cycle is None:
+                raise ValueError("cycle is needed to get a single step")
+            if (diag_num, cycle, md) not in self.segment_dict:
+                raise KeyError("No segment for diag_num {}, Cycle {}, MD {}".format(diag_num, cycle, md))
+            return self.segment_dict[(diag_num, cycle, md)]
+
+        bounds = [(start, end) for diag, cyc, _, start, end in self.segments
+                  if diag==diag_num and (cycle is None or cyc==cycle)]
+        if len(bounds)==0:
+            raise KeyError("No segment for diag_num {}, Cycle {}".format(diag_num, cycle))
+        return bounds[0][0], bounds[-1][1]
@@ -1,17 +1,41 @@
 import pandas as pd
+import numpy as np
 import os
 import json
+from Joule_profiler import profile_stage
+from Joule_file_io import atomic_write, lock_file, write_json_dict
+from contextlib import nullcontext
+#pyarrow is imported in the parquet functions so it is only needed when the parquet format is used
 #ignoring future warnings from pandas due to loading in json
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-def load_raw_obj(file_path):
+#Measured raw data columns that should always be floats
+RAW_FLOAT_COLUMNS = ["Test Time (s)", "Current (A)", "Voltage (V)", "Capacity (Ah)", "Energy (Wh)"]
+#Raw data columns that should always be ints
+RAW_INT_COLUMNS = ["Cycle", "diag_num"]
+#Raw data string columns stored as categories when downcasting
+RAW_CATEGORY_COLUMNS = ["MD", "Diag_Start_Datetime"]
+#Columns of the segment index. Each row is a run of raw data rows with the same diag_num, Cycle and
+#MD from row position start up to (not including) end
+SEGMENT_INDEX_COLUMNS = ["diag_num", "Cycle", "cycle_rank", "MD", "start", "end", "cc_end"]
+#Rows at the start of a cycle averaged to get its CC current
+CC_CURRENT_ROWS = 10
+
+@profile_stage("load_raw_obj", rows_fun=lambda args, obj: len(obj.raw_data), file_path_arg="file_path")
+def load_raw_obj(file_path, coerce_types=True, downcast=False):
     """
     This function converts the json file back in to a cellLife_raw_obj and returns it. Manually add each field 
     and convert certain json fields back in to pandas dataframes
     
     Args:
     @file_path(string): location to the file of interest
+    @coerce_types(Boolean): True to convert the numeric columns to numeric types with
+        coerce_raw_data_types. If any entries are corrupted the number per diagnostic is saved in
+        meta_data["corrupted_rows"], which is carried in to the meta_data of the summary data. Raw
+        data without corrupted entries keeps its meta_data as it was saved
+    @downcast(Boolean): True to store the raw data in smaller types, see coerce_raw_data_types.
+        Only used if coerce_types is True
     
     Returns:
     @obj(cellLife_raw_obj): reconstructed cellLife_raw_obj
@@ -24,12 +48,250 @@ def load_raw_obj(file_path):
     meta_data = json_file["meta_data"]
 
     raw_data = pd.read_json(json_file["raw_data"])
+    if coerce_types:
+        raw_data, corrupted_rows = coerce_raw_data_types(raw_data, downcast=downcast)
+        if len(corrupted_rows)>0:
+            meta_data["corrupted_rows"] = corrupted_rows
     comment = json_file["comment"]
-    obj = cellLife_raw_obj(meta_data=meta_data, raw_data=raw_data, comment=comment)
+    #Older raw files were saved without the segment index, it is built by the constructor
+    segment_index = None
+    if json_file.get("segment_index") is not None:
+        segment_index = _segment_index_from_dict(json_file["segment_index"])
+    obj = cellLife_raw_obj(meta_data=meta_data, raw_data=raw_data, comment=comment, segment_index=segment_index)
+    return obj
+
+@profile_stage("load_raw_obj_parquet", rows_fun=lambda args, obj: len(obj.raw_data), file_path_arg="file_path")
+def load_raw_obj_parquet(file_path, columns=None, diag_nums=None):
+    """
+    This function loads a cellLife_raw_obj that was saved with to_parquet_file. Only the columns
+    and diagnostics asked for are read from disk. Each diagnostic is its own row group so a
+    diag_num range skips the rest of the file instead of filtering it after loading.
+    
+    Args:
+    @file_path(string): location to the {cell_id}_raw.parquet file of interest
+    @columns(list[str]): raw_data columns to load. None loads all of the columns
+    @diag_nums(tuple(int, int)): Inclusive (first, last) diag_num range to load. None loads
+        all diagnostics
+    
+    Returns:
+    @obj(cellLife_raw_obj): reconstructed cellLife_raw_obj
+    """
+    import pyarrow.parquet as pq
+
+    #meta_data and comment are stored in the parquet footer as json strings
+    footer = pq.read_schema(file_path).metadata
+    meta_data = json.loads(footer[b"meta_data"])
+    comment = json.loads(footer[b"comment"])
+
+    filters = None
+    if diag_nums is not None:
+        filters = [("diag_num", ">=", diag_nums[0]), ("diag_num", "<=", diag_nums[1])]
+
+    table = pq.read_table(file_path, columns=columns, filters=filters, use_pandas_metadata=True)
+    raw_data = table.to_pandas()
+
+    segment_index = None
+    if b"segment_index" in footer:
+        segment_index = _segment_index_from_dict(json.loads(footer[b"segment_index"]))
+        if diag_nums is not None:
+            segment_index = _select_segment_diags(segment_index, diag_nums)
+    obj = cellLife_raw_obj(meta_data=meta_data, raw_data=raw_data, comment=comment, segment_index=segment_index)
     return obj
 
+def convert_raw_json_to_parquet(raw_path, save_path, overwrite=False, compression="zstd", return_errors=False):
+    """
+    This function converts every {cell_id}_raw.json file in raw_path in to a {cell_id}_raw.parquet
+    file in save_path. The json files are left as is.
+
+    Args:
+    @raw_path(str): Path to the raw data json objects
+    @save_path(str): Path of where to save the parquet files
+    @overwrite(Boolean): Whether you want to overwrite already existing parquet files
+    @compression(str): Parquet compression codec passed to to_parquet_file
+    @return_errors(Boolean): True to also return the error of every file that failed
+
+    Returns:
+    @files_failed(list[str]): The json filenames that could not be converted
+    @errors_list(list[tuple(str, str)]): (filename, error) of every file that failed, only returned
+        if return_errors is True
+    """
+    from tqdm import tqdm
+    raw_file_list = sorted([x for x in os.listdir(raw_path) if x.endswith("_raw.json")])
+    errors_list = []
+
+    for i in tqdm(range(len(raw_file_list))):
+        raw_name = raw_file_list[i]
+        parquet_name = raw_name[:-len(".json")]+".parquet"
+
+        try:
+            raw_obj = load_raw_obj(raw_path+raw_name)
+            raw_obj.to_parquet_file(save_path+parquet_name, overwrite=overwrite, compression=compression)
+        except Exception as e:
+            errors_list.append((raw_name, "{}: {}".format(type(e).__name__, e)))
+
+    files_failed = [raw_name for raw_name, _ in errors_list]
+    if return_errors:
+        return files_failed, errors_list
+    return files_failed
+
+@profile_stage("coerce_raw_data_types", rows_fun=lambda args, output: len(args["raw_data"]))
+def coerce_raw_data_types(raw_data, downcast=False):
+    """
+    This function converts the numeric columns of the raw data to numeric types in one pass per
+    column. Some of the raw data is corrupted and is a string, which makes that whole column an
+    object column of mixed floats and strings (see get_energy). Entries that can't be converted
+    become nan, the same as get_energy does with them.
+
+    Args:
+    @raw_data(pd.DataFrame): raw_data of a cellLife_raw_obj. Changed in place
+    @downcast(Boolean): True to store the float columns as float32, the int columns as the
+        smallest int type that fits and the MD and Diag_Start_Datetime columns as categories,
+        which roughly halves the memory of the raw data
+
+    Returns:
+    @raw_data(pd.DataFrame): raw data with numeric columns
+    @corrupted_rows(dict): {diag_num: {column: number of corrupted entries}} of every diagnostic
+        with corrupted entries. diag_num keys are strings so they match after saving to json
+    """
+    float_type = np.float32 if downcast else np.float64
+    corrupted_rows = {}
+
+    for col in RAW_FLOAT_COLUMNS:
+        if col not in raw_data.columns:
+            continue
+        if raw_data[col].dtype==object:
+            coerced = pd.to_numeric(raw_data[col], errors="coerce")
+            corrupted = coerced.isna().to_numpy() & raw_data[col].notna().to_numpy()
+            if corrupted.any():
+                corrupted_counts = pd.Series(corrupted).groupby(raw_data["diag_num"].to_numpy()).sum()
+                for diag_num, count in corrupted_counts[corrupted_counts>0].items():
+                    corrupted_rows.setdefault(str(diag_num), {})[col] = int(count)
+            raw_data[col] = coerced
+        if raw_data[col].dtype!=float_type:
+            raw_data[col] = raw_data[col].astype(float_type)
+
+    if downcast:
+        for col in RAW_INT_COLUMNS:
+            if col in raw_data.columns:
+                raw_data[col] = pd.to_numeric(raw_data[col], downcast="integer")
+        #The step and date columns only have a few unique strings
+        for col in RAW_CATEGORY_COLUMNS:
+            if col in raw_data.columns:
+                raw_data[col] = raw_data[col].astype("category")
+
+    return raw_data, corrupted_rows
+
+@profile_stage("build_segment_index", rows_fun=lambda args, output: len(args["raw_data"]))
+def build_segment_index(raw_data):
+    """
+    This function builds the segment index of the raw data. Each row of the index is a run of
+    raw data rows with the same diag_num, Cycle and MD (a step) and has the row positions the run
+    starts and ends at, so a step can be sliced with raw_data.iloc[start:end] instead of filtering
+    the whole raw data with boolean masks.
+
+    cycle_rank is the index of the cycle in sorted(set(df_diag["Cycle"])) of its diagnostic, the
+    position the featurization uses (1-3 are the C/5 RPT cycles and 4-6 the high rate RPT
+    cycles). cc_end is the row after the last CC row of charge steps, which is where the CV hold
+    starts. A row is CC if its current is at least the average current of the first 10 rows of its
+    cycle less 1/100th of it, the same rule as get_capacity. cc_end is start for charge steps
+    without CC rows and -1 for other steps.
+
+    Args:
+    @raw_data(pd.DataFrame): raw_data of a cellLife_raw_obj
+
+    Returns:
+    @segment_index(pd.DataFrame): index with the SEGMENT_INDEX_COLUMNS columns, a row per step in
+        the order they are in the raw data
+    """
+    num_rows = len(raw_data)
+    if num_rows==0:
+        return _segment_index_from_dict({col: [] for col in SEGMENT_INDEX_COLUMNS})
+
+    diag_num_array = raw_data["diag_num"].to_numpy()
+    cycle_array = raw_data["Cycle"].to_numpy()
+    md_array = np.asarray(raw_data["MD"], dtype=object)
+    md_codes = pd.factorize(md_array)[0]
+
+    #A new step starts wherever diag_num, Cycle or MD changes
+    change = (diag_num_array[1:]!=diag_num_array[:-1]) | (cycle_array[1:]!=cycle_array[:-1]) | (md_codes[1:]!=md_codes[:-1])
+    start_array = np.concatenate([[0], np.flatnonzero(change)+1])
+    end_array = np.concatenate([start_array[1:], [num_rows]])
+    segment_index = pd.DataFrame({"diag_num": diag_num_array[start_array], "Cycle": cycle_array[start_array]})
+    segment_index["cycle_rank"] = segment_index.groupby("diag_num")["Cycle"].rank(method="dense").astype(int)-1
+    segment_index["MD"] = md_array[start_array]
+    segment_index["start"] = start_array
+    segment_index["end"] = end_array
+
+    #CC current of each cycle is the average of its first rows, steps of a cycle may not be next to each other
+    segment_cycle_codes = segment_index.groupby(["diag_num", "Cycle"], sort=False).ngroup().to_numpy()
+    row_cycle_codes = np.repeat(segment_cycle_codes, end_array-start_array)
+    current_array = pd.to_numeric(raw_data["Current (A)"], errors="coerce").to_numpy(dtype=float)
+    avg_curr = _first_rows_mean(current_array, row_cycle_codes, CC_CURRENT_ROWS)
+    #If current falls below the average value by 1/100th of the value you are in CV portion
+    epsilon = avg_curr/100
+    cc_threshold = (avg_curr-epsilon)[row_cycle_codes]
+
+    is_charge_segment = (segment_index["MD"]=="C").to_numpy()
+    is_cc_row = np.repeat(is_charge_segment, end_array-start_array) & (current_array>=cc_threshold)
+    #Row after the last CC row of each step, 0 if it has none
+    last_cc_end = np.maximum.reduceat(np.where(is_cc_row, np.arange(1, num_rows+1), 0), start_array)
+    cc_end_array = np.where(last_cc_end>0, last_cc_end, start_array)
+    segment_index["cc_end"] = np.where(is_charge_segment, cc_end_array, -1)
+    return _segment_index_from_dict(segment_index)
+
+def _segment_index_from_dict(segment_dict):
+    """
+    Makes a segment index with the SEGMENT_INDEX_COLUMNS columns and types from a dataframe or a
+    dict of columns, such as one loaded from json.
+    """
+    segment_index = pd.DataFrame({col: segment_dict[col] for col in SEGMENT_INDEX_COLUMNS})
+    for col in ["diag_num", "Cycle", "cycle_rank", "start", "end", "cc_end"]:
+        segment_index[col] = segment_index[col].astype(np.int64)
+    segment_index["MD"] = segment_index["MD"].astype(object)
+    return segment_index
+
+def _select_segment_diags(segment_index, diag_nums):
+    """
+    Keeps the steps of the segment index in the inclusive (first, last) diag_num range and moves
+    their row positions to where they are once only those rows are loaded.
+    """
+    keep = segment_index["diag_num"].between(diag_nums[0], diag_nums[1]).to_numpy()
+    segment_index = segment_index[keep].reset_index(drop=True)
+    length_array = (segment_index["end"]-segment_index["start"]).to_numpy()
+    new_start_array = np.concatenate([[0], np.cumsum(length_array)[:-1]]).astype(np.int64)
+    shift_array = new_start_array-segment_index["start"].to_numpy()
+    segment_index["cc_end"] = np.where(segment_index["cc_end"]>=0, segment_index["cc_end"]+shift_array, -1)
+    segment_index["start"] = new_start_array
+    segment_index["end"] = new_start_array+length_array
+    return segment_index
+
+def _first_rows_mean(values, group_codes, num_rows):
+    """
+    Mean of the first num_rows values of every group, the same as np.mean(series.iloc[:num_rows])
+    on each group. group_codes has to be the group number (0 to n_groups-1) of every value.
+    """
+    num_groups = group_codes.max()+1
+    order = np.argsort(group_codes, kind="stable")
+    sorted_codes = group_codes[order]
+    group_starts = np.searchsorted(sorted_codes, np.arange(num_groups))
+    position = np.arange(len(sorted_codes))-group_starts[sorted_codes]
+    keep = position<num_rows
+
+    first_rows = np.full((num_groups, num_rows), np.nan)
+    first_rows[sorted_codes[keep], position[keep]] = values[order][keep]
+
+    #Summing the full rows along the last axis adds them in the same order as pandas does for a
+    #single series. Short groups or groups with nan are rare so just do them one at a time.
+    group_sizes = np.minimum(np.bincount(group_codes, minlength=num_groups), num_rows)
+    full_rows = ~np.isnan(first_rows).any(axis=1)
+    mean_array = np.sum(first_rows, axis=1)/num_rows
+    for group in np.flatnonzero(~full_rows):
+        group_values = first_rows[group][:group_sizes[group]]
+        mean_array[group] = np.mean(pd.Series(group_values))
+    return mean_array
+
 class cellLife_raw_obj():
-    def __init__(self, meta_data, raw_data, comment="N/A"):
+    def __init__(self, meta_data, raw_data, comment="N/A", segment_index=None):
         """
         Constructor for cellLife_data_object
         Args:
@@ -37,35 +299,139 @@ class cellLife_raw_obj():
         @raw_data(pd.DataFrame): concatentation of all raw data with the inclusion of Calendar 
             time and diagnostic num column. Nothing else is changed.
         @comment(string): A string commenting on the data.
+        @segment_index(pd.DataFrame): build_segment_index of raw_data. If None it is built the
+            first time segment_index is used (see the segment_index property), so raw objects
+            that are never featurized do not pay for it. It is saved with the object once built.
+        """
+        self.meta_data     = meta_data
+        self.raw_data      = raw_data
+        self.comment       = comment
+        self._segment_index = segment_index
+
+    @property
+    def segment_index(self):
+        """
+        build_segment_index of raw_data, built on first use and kept on the object. None if
+        raw_data is missing the diag_num, Cycle, MD or Current (A) column.
+        """
+        if self._segment_index is None and set(["diag_num", "Cycle", "MD", "Current (A)"]).issubset(self.raw_data.columns):
+            self._segment_index = build_segment_index(self.raw_data)
+        return self._segment_index
+
+    @segment_index.setter
+    def segment_index(self, segment_index):
+        self._segment_index = segment_index
+
+    def get_segment_rows(self, diag_num, cycle_rank=None, md=None):
+        """
+        Returns the raw data rows of a diagnostic, or of one cycle (by its rank in the diagnostic)
+        or step of it, using the segment index instead of filtering the raw data.
+
+        Args:
+        @diag_num(int): diagnostic number
+        @cycle_rank(int): index of the cycle in sorted(set(df_diag["Cycle"])). None for all cycles
+        @md(str): "C" or "D" to only get the charge or discharge rows. None for all steps
+
+        Returns:
+        @df_rows(pd.DataFrame): rows of raw_data in the order they are in raw_data
         """
-        self.meta_data = meta_data
-        self.raw_data  = raw_data
-        self.comment   = comment
+        if self.segment_index is None:
+            raise Exception("This raw object has no segment index")
+        mask = (self.segment_index["diag_num"]==diag_num).to_numpy()
+        if cycle_rank is not None:
+            mask &= (self.segment_index["cycle_rank"]==cycle_rank).to_numpy()
+        if md is not None:
+            mask &= (self.segment_index["MD"]==md).to_numpy()
+        segments = self.segment_index[mask]
+        if len(segments)==1:
+            return self.raw_data.iloc[segments["start"].iloc[0]:segments["end"].iloc[0]]
+        row_positions = [np.arange(start, end) for start, end in zip(segments["start"], segments["end"])]
+        return self.raw_data.iloc[np.concatenate(row_positions) if len(row_positions)>0 else []]
         
-    def to_json_file(self, file_path, overwrite=False):
+    def to_json_file(self, file_path, overwrite=False, lock=False, sync_dir=True):
         """
         This function saves the cellLife_raw_obj to a json file. All pieces are converted to 
         serializable objects such as Pandas dataframes to json and then put inside a parent
         dictionary which is converted to the json file.
 
+        The file is written to a temporary file in the same folder and renamed to file_path once it
+        is complete (see Joule_file_io.atomic_write), so processes loading file_path at the same
+        time never see a missing or partly written file.
+
         Args:
         @file_path(string): Path to save_file location
         @overwrite(Boolean): True if you want to overwrite the file at file_path
+        @lock(Boolean): True to hold an advisory lock on file_path while writing (Joule_file_io.lock_file)
+        @sync_dir(Boolean): False leaves flushing the folder to disk to the caller, see 
+            Joule_file_io.write_json_objects
 
         Returns:
         None
         """
         
+        #Convert data to jsonable object. The segment index is only saved if it was built or loaded
+        dict_to_save = {"meta_data":self.meta_data, "raw_data":self.raw_data,
+                       "comment": self.comment, "segment_index": _segment_index_to_dict(self._segment_index)}
+        with lock_file(file_path) if lock else nullcontext():
+            with atomic_write(file_path, overwrite=overwrite, sync_dir=sync_dir) as outfile:
+                write_json_dict(outfile, dict_to_save, dataframe_keys=["raw_data"])
+
+    def to_parquet_file(self, file_path, overwrite=False, compression="zstd"):
+        """
+        This function saves the cellLife_raw_obj to a compressed, columnar parquet file. Every
+        diagnostic is written as its own row group so it can be loaded on its own with 
+        load_raw_obj_parquet. meta_data and comment are stored as json strings in the 
+        parquet footer so the file is self contained. 
+
+        Corrupted entries make some numeric columns (usually Energy (Wh)) an object column of
+        mixed floats and strings. Parquet needs one type per column so these are coerced to 
+        float and the corrupted entries become nan, which is what the featurization already
+        does with them.
+
+        Args:
+        @file_path(string): Path to save_file location, ex: {cell_id}_raw.parquet
+        @overwrite(Boolean): True if you want to overwrite the file at file_path
+        @compression(str): Parquet compression codec, ex: "zstd", "snappy" or "none"
+
+        Returns:
+        None
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
         #throw error if file already exists so we don't overwrite it
         if (os.path.exists(file_path) and not overwrite):
             raise Exception("File already exists")
-        #If file exists, but you want to overwrite it delete it first
-        if (os.path.exists(file_path) and overwrite):
-            os.remove(file_path)
-        
-        #Convert data to jsonable object
-        dict_to_save = {"meta_data":self.meta_data, "raw_data":self.raw_data.to_json(),
-                       "comment": self.comment}
-        #Open and save to json file
-        with open(file_path, "w") as outfile:
-            json.dump(dict_to_save, outfile)
\ No newline at end of file
+
+        raw_data = self.raw_data.copy(deep=False)
+        for col in raw_data.columns:
+            if raw_data[col].dtype != object:
+                continue
+            if pd.api.types.infer_dtype(raw_data[col], skipna=True) not in ("string", "empty"):
+                raw_data[col] = pd.to_numeric(raw_data[col], errors="coerce")
+
+        table = pa.Table.from_pandas(raw_data, preserve_index=True)
+        footer = dict(table.schema.metadata)
+        footer[b"meta_data"] = json.dumps(self.meta_data)
+        footer[b"comment"] = json.dumps(self.comment)
+        if self._segment_index is not None:
+            footer[b"segment_index"] = json.dumps(_segment_index_to_dict(self._segment_index))
+        table = table.replace_schema_metadata(footer)
+
+        #Write each contiguous run of a diag_num as its own row group
+        diag_num_array = np.asarray(raw_data["diag_num"])
+        run_starts = np.flatnonzero(np.diff(diag_num_array))+1
+        run_bounds = np.concatenate([[0], run_starts, [len(diag_num_array)]])
+
+        with atomic_write(file_path, mode="wb", overwrite=overwrite) as outfile:
+            with pq.ParquetWriter(outfile, table.schema, compression=compression) as writer:
+                for start, end in zip(run_bounds[:-1], run_bounds[1:]):
+                    writer.write_table(table.slice(start, end-start))
+
+def _segment_index_to_dict(segment_index):
+    """
+    Converts the segment index to a dict of lists to save in json. None stays None.
+    """
+    if segment_index is None:
+        return None
+    return {col: segment_index[col].tolist() for col in SEGMENT_INDEX_COLUMNS}
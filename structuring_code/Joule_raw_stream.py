@@ -0,0 +1,454 @@
+import pandas as pd
+import numpy as np
+import os
+import re
+import json
+import tempfile
+from io import StringIO
+from Joule_raw_data_builder import RAW_FLOAT_COLUMNS, coerce_raw_data_types
+
+#Characters of the file read at a time
+STREAM_CHUNK_SIZE = 2**18
+
+#Contents of a json string up to its closing quote or the end of the text read so far
+_STRING_CONTENT_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+#Start of a column in the column oriented raw_data json: "name":{
+_COLUMN_START_RE = re.compile(r'\s*,?\s*"((?:[^"\\]|\\.)*)"\s*:\s*\{')
+#Everything before the } that ends a column, skipping over strings
+_COLUMN_CONTENT_RE = re.compile(r'[^"}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"}]*)*')
+
+
+def stream_raw_obj(file_path, downcast=False, temp_path=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    This function returns a cellLife_raw_stream that yields the raw data of a cell one diagnostic at
+    a time as (diag_num, df_diag) without ever holding the whole raw data in memory, see
+    cellLife_raw_stream.
+
+    Args:
+    @file_path(string): location of the {cell_id}_raw.json or {cell_id}_raw.parquet file
+    @downcast(Boolean): True to downcast each df_diag the same as load_raw_obj(downcast=True)
+    @temp_path(str): folder for the temporary column files. None uses the system temp folder
+    @chunk_size(int): characters of the json file read at a time
+
+    Returns:
+    @raw_stream(cellLife_raw_stream): iterable of (diag_num, df_diag)
+    """
+    return cellLife_raw_stream(file_path, downcast=downcast, temp_path=temp_path, chunk_size=chunk_size)
+
+class cellLife_raw_stream():
+    def __init__(self, file_path, downcast=False, temp_path=None, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Streams a raw data file one diagnostic at a time. Iterating over it yields (diag_num, df_diag)
+        in increasing diag_num order, once per diag_num, where df_diag is the same as the rows of
+        load_raw_obj(file_path).raw_data for that diag_num in the order they are in the file (the
+        same as load_raw_obj(file_path).raw_data.groupby("diag_num")).
+
+        The raw_data of a json file is a column oriented json string inside the json file, so all
+        of a column comes before the next one starts and no diagnostic is complete until the last
+        column is read. The file is read chunk_size characters at a time and each column is parsed
+        in to typed values that are written to a temporary file per column, so the whole raw data
+        is spilled to temp_path (about 8 bytes per value) before the first diagnostic is yielded.
+        The diagnostics are then read back from the temporary files one at a time. Memory use
+        depends on chunk_size and the size of a diagnostic instead of the size of the file. A
+        parquet file is read one diagnostic (row group) at a time without temporary files.
+
+        meta_data is read when the stream is made. comment and meta_data["corrupted_rows"] are
+        filled in once iterating has started, meta_data["corrupted_rows"] only if there are
+        corrupted entries, the same as load_raw_obj.
+
+        Args:
+        @file_path(string): location of the {cell_id}_raw.json or {cell_id}_raw.parquet file
+        @downcast(Boolean): True to downcast each df_diag the same as load_raw_obj(downcast=True)
+        @temp_path(str): folder for the temporary column files. None uses the system temp folder
+        @chunk_size(int): characters of the json file read at a time
+        """
+        self.file_path  = file_path
+        self.downcast   = downcast
+        self.temp_path  = temp_path
+        self.chunk_size = chunk_size
+        self.comment    = None
+        if file_path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            footer = pq.read_schema(file_path).metadata
+            self.meta_data = json.loads(footer[b"meta_data"])
+            self.comment = json.loads(footer[b"comment"])
+        else:
+            with open(file_path, "r") as openfile:
+                reader = _json_chunk_reader(openfile, chunk_size)
+                reader.expect("{")
+                key = reader.read_key()
+                if key!="meta_data":
+                    raise Exception("Expected meta_data to be the first key of {}".format(file_path))
+                self.meta_data = reader.read_value()
+
+    def __iter__(self):
+        if self.file_path.endswith(".parquet"):
+            return self._iter_parquet()
+        return self._iter_json()
+
+    def _iter_parquet(self):
+        """
+        Yields the diagnostics of a parquet file made with to_parquet_file, one row group at a time.
+        """
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(self.file_path)
+        #Row groups of each diagnostic, usually one. Row groups with more than one diagnostic are
+        #split after reading
+        diag_row_groups = {}
+        for row_group in range(parquet_file.num_row_groups):
+            diag_nums = _get_row_group_diag_nums(parquet_file, row_group)
+            for diag_num in diag_nums:
+                diag_row_groups.setdefault(diag_num, []).append(row_group)
+
+        for diag_num in sorted(diag_row_groups):
+            df = parquet_file.read_row_groups(diag_row_groups[diag_num], use_pandas_metadata=True).to_pandas()
+            df_diag = df[df["diag_num"]==diag_num]
+            yield self._finish_diag(diag_num, df_diag)
+
+    def _iter_json(self):
+        """
+        Parses the json file in to temporary column files and then yields each diagnostic.
+        """
+        with tempfile.TemporaryDirectory(dir=self.temp_path) as temp_dir:
+            with open(self.file_path, "r") as openfile:
+                reader = _json_chunk_reader(openfile, self.chunk_size)
+                reader.expect("{")
+                column_list = None
+                while True:
+                    if reader.at_object_end():
+                        break
+                    key = reader.read_key()
+                    if key=="raw_data":
+                        column_list = _spill_raw_data_columns(reader, temp_dir)
+                    else:
+                        value = reader.read_value()
+                        if key=="comment":
+                            self.comment = value
+                if column_list is None:
+                    raise Exception("No raw_data in {}".format(self.file_path))
+
+            yield from self._iter_spilled_diags(column_list)
+
+    def _iter_spilled_diags(self, column_list):
+        """
+        Reads the diagnostics back from the temporary column files.
+        """
+        num_rows = column_list[0]["num_rows"]
+        for column in column_list:
+            if column["num_rows"]!=num_rows:
+                raise Exception("Column {} has {} rows instead of {}".format(column["name"], column["num_rows"], num_rows))
+            column["values"] = _open_column_file(column["file_path"], column["dtype"], num_rows)
+        index_values = _open_column_file(column_list[0]["index_file_path"], np.int64, num_rows)
+
+        diag_column = [column for column in column_list if column["name"]=="diag_num"][0]
+        diag_array = np.asarray(diag_column["values"])
+        if diag_column["kind"]=="str":
+            diag_array = np.array(diag_column["categories"], dtype=object)[diag_array]
+
+        #Rows of each diagnostic. Usually each diagnostic is one contiguous block
+        run_starts = np.concatenate([[0], np.flatnonzero(diag_array[1:]!=diag_array[:-1])+1])
+        run_ends = np.concatenate([run_starts[1:], [num_rows]])
+        diag_runs = {}
+        for start, end in zip(run_starts, run_ends):
+            diag_runs.setdefault(diag_array[start], []).append((start, end))
+
+        #Count corrupted entries per diagnostic the same way coerce_raw_data_types does
+        corrupted_rows = {}
+        for column in column_list:
+            if len(column["corrupted"])==0:
+                continue
+            corrupted_diags, counts = np.unique(diag_array[np.concatenate(column["corrupted"])], return_counts=True)
+            for diag_num, count in zip(corrupted_diags, counts):
+                corrupted_rows.setdefault(str(diag_num), {})[column["name"]] = int(count)
+        if len(corrupted_rows)>0:
+            self.meta_data["corrupted_rows"] = corrupted_rows
+
+        for diag_num in sorted(diag_runs):
+            runs = diag_runs[diag_num]
+            row_idx = np.concatenate([np.arange(start, end) for start, end in runs])
+            df_dict = {}
+            for column in column_list:
+                values = np.asarray(column["values"][row_idx])
+                if column["kind"]=="str":
+                    values = np.array(column["categories"], dtype=object)[values]
+                df_dict[column["name"]] = values
+            df_diag = pd.DataFrame(df_dict, index=pd.Index(np.asarray(index_values[row_idx])))
+            yield self._finish_diag(diag_num, df_diag)
+
+        #Close the memory maps so the temporary folder can be removed
+        for column in column_list:
+            column["values"] = None
+
+    def _finish_diag(self, diag_num, df_diag):
+        """
+        Makes the columns of df_diag the same types load_raw_obj gives.
+        """
+        df_diag, _ = coerce_raw_data_types(df_diag, downcast=self.downcast)
+        if isinstance(diag_num, (np.integer, np.floating)):
+            diag_num = int(diag_num)
+        return diag_num, df_diag
+
+def _get_row_group_diag_nums(parquet_file, row_group):
+    """
+    Returns the diag_nums in a row group of a parquet file, from the column statistics when the
+    row group has a single diag_num and by reading its diag_num column otherwise.
+    """
+    column_idx = parquet_file.schema_arrow.get_field_index("diag_num")
+    statistics = parquet_file.metadata.row_group(row_group).column(column_idx).statistics
+    if statistics is not None and statistics.has_min_max and statistics.min==statistics.max:
+        return [statistics.min]
+    diag_num_array = parquet_file.read_row_group(row_group, columns=["diag_num"]).column("diag_num").to_numpy()
+    return list(np.unique(diag_num_array))
+
+class _json_chunk_reader():
+    def __init__(self, openfile, chunk_size):
+        """
+        Reads a json file a chunk at a time. buffer holds the part of the file that has been read
+        but not parsed yet.
+        """
+        self.openfile   = openfile
+        self.chunk_size = chunk_size
+        self.buffer     = ""
+        self.pos        = 0
+        self.decoder    = json.JSONDecoder()
+
+    def read_more(self):
+        """
+        Reads the next chunk of the file in to the buffer. Returns False at the end of the file.
+        """
+        chunk = self.openfile.read(self.chunk_size)
+        if chunk=="":
+            return False
+        self.buffer = self.buffer[self.pos:]+chunk
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos<len(self.buffer) and self.buffer[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos<len(self.buffer) or not self.read_more():
+                return
+
+    def expect(self, char):
+        self.skip_whitespace()
+        if self.pos>=len(self.buffer) or self.buffer[self.pos]!=char:
+            raise Exception("Expected {} at character {} of the json file".format(char, self.pos))
+        self.pos += 1
+
+    def at_object_end(self):
+        """
+        True at the } closing the outer object, otherwise skips the comma before the next key.
+        """
+        self.skip_whitespace()
+        if self.pos<len(self.buffer) and self.buffer[self.pos]=="}":
+            self.pos += 1
+            return True
+        if self.pos<len(self.buffer) and self.buffer[self.pos]==",":
+            self.pos += 1
+        return False
+
+    def read_value(self):
+        """
+        Decodes the next json value, reading more of the file until the whole value is in the buffer.
+        """
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                #A number at the end of the buffer might continue in the next chunk
+                if end<len(self.buffer) or not self.read_more():
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if not self.read_more():
+                    raise
+                continue
+
+    def read_key(self):
+        key = self.read_value()
+        self.expect(":")
+        return key
+
+    def iter_string(self):
+        """
+        Yields the decoded text of the json string at the current position a piece at a time.
+        """
+        self.expect('"')
+        while True:
+            end = _STRING_CONTENT_RE.match(self.buffer, self.pos).end()
+            if end<len(self.buffer) and self.buffer[end]=='"':
+                piece = self.buffer[self.pos:end]
+                self.pos = end+1
+                yield json.loads('"'+piece+'"')
+                return
+            #Don't split an escape sequence, cut before the last run of backslashes near the end
+            cut = len(self.buffer)
+            tail_backslash = self.buffer.rfind("\\", max(self.pos, cut-6), cut)
+            if tail_backslash>=0:
+                cut = tail_backslash
+                while cut>self.pos and self.buffer[cut-1]=="\\":
+                    cut -= 1
+            if cut>self.pos:
+                piece = self.buffer[self.pos:cut]
+                self.pos = cut
+                yield json.loads('"'+piece+'"')
+            if not self.read_more():
+                raise Exception("The json file ended inside a string")
+
+def _spill_raw_data_columns(reader, temp_dir):
+    """
+    Parses the column oriented raw_data json string a piece at a time and writes the values of each
+    column to a temporary file in temp_dir. Numeric columns are saved as int64 or float64 and other
+    columns as int32 codes in to a list of categories. String entries in RAW_FLOAT_COLUMNS are
+    corrupted and become nan, their row positions are kept in the column's corrupted list.
+
+    Returns:
+    @column_list(list[dict]): information about each column and its temporary file
+    """
+    column_list = []
+    column = None
+    text = ""
+    pos = 0
+    pieces = reader.iter_string()
+    string_done = False
+
+    def read_more_text(text, pos):
+        try:
+            return text[pos:]+next(pieces), 0, False
+        except StopIteration:
+            return text[pos:], 0, True
+
+    text, pos, string_done = read_more_text(text, pos)
+    text = text.lstrip()
+    if not text.startswith("{"):
+        raise Exception("raw_data is not a column oriented json object")
+    pos = 1
+
+    while True:
+        if column is None:
+            match = _COLUMN_START_RE.match(text, pos)
+            if match is None:
+                if text[pos:].strip() in ("}", "") and string_done:
+                    break
+                if string_done:
+                    raise Exception("Could not parse raw_data")
+                text, pos, string_done = read_more_text(text, pos)
+                continue
+            name = json.loads('"'+match.group(1)+'"')
+            column = {"name": name, "json_name": match.group(1), "file_path": os.path.join(temp_dir, "{}.bin".format(len(column_list))),
+                      "index_file_path": os.path.join(temp_dir, "{}_index.bin".format(len(column_list))),
+                      "kind": None, "dtype": None, "categories": [], "category_codes": {}, "corrupted": [],
+                      "num_rows": 0}
+            column["file"] = open(column["file_path"], "wb")
+            column["index_file"] = open(column["index_file_path"], "wb") if len(column_list)==0 else None
+            pos = match.end()
+            continue
+
+        end = _COLUMN_CONTENT_RE.match(text, pos).end()
+        if end<len(text) and text[end]=="}":
+            _write_column_pairs(column, text[pos:end])
+            column["file"].close()
+            if column["index_file"] is not None:
+                column["index_file"].close()
+            column_list.append(column)
+            column = None
+            pos = end+1
+            continue
+
+        #Parse all of the complete pairs and keep the rest for the next piece
+        cut = _find_last_pair_start(text, pos)
+        if cut>pos:
+            _write_column_pairs(column, text[pos:cut])
+            pos = cut
+        if string_done:
+            raise Exception("raw_data ended inside column {}".format(column["name"]))
+        text, pos, string_done = read_more_text(text, pos)
+
+    for column in column_list:
+        column.pop("file")
+        column.pop("index_file")
+        column.pop("category_codes")
+    return column_list
+
+def _find_last_pair_start(text, pos):
+    """
+    Returns the position of the last ," in text after pos that starts a new "index":value pair,
+    -1 if there isn't one. A ," can also be the end of a string value (ex: "x,"), so the ones
+    inside strings are skipped: text[pos:cut] is only complete pairs if it has an even number of
+    unescaped quotes.
+    """
+    cut = len(text)
+    while True:
+        cut = text.rfind(',"', pos, cut)
+        if cut<=pos:
+            return cut
+        piece = text[pos:cut]
+        #Escaped backslashes are removed first so \\" counts as an unescaped quote
+        num_quotes = piece.count('"')-piece.replace("\\\\", "").count('\\"')
+        if num_quotes%2==0:
+            return cut
+
+def _write_column_pairs(column, text):
+    """
+    Parses the "index":value pairs in text and appends them to the column's temporary files. Each
+    piece is parsed with pd.read_json so the values and types are the same as load_raw_obj gives.
+    """
+    text = text.strip().lstrip(",")
+    if text=="":
+        return
+    series = pd.read_json(StringIO('{"'+column["json_name"]+'":{'+text+'}}')).iloc[:, 0]
+    if column["index_file"] is not None:
+        series.index.to_numpy(dtype=np.int64).tofile(column["index_file"])
+
+    values = None
+    if series.dtype.kind in "iu" and column["kind"] in (None, "int"):
+        values = series.to_numpy(dtype=np.int64)
+        column["kind"], column["dtype"] = "int", np.int64
+    elif series.dtype.kind in "iuf" and column["kind"] in (None, "int", "float"):
+        if column["kind"]=="int":
+            _promote_column_to_float(column)
+        values = series.to_numpy(dtype=np.float64)
+        column["kind"], column["dtype"] = "float", np.float64
+    elif column["name"] in RAW_FLOAT_COLUMNS and column["kind"] in (None, "int", "float"):
+        #Corrupted entries become nan, the same as coerce_raw_data_types
+        if column["kind"]=="int":
+            _promote_column_to_float(column)
+        coerced = pd.to_numeric(series, errors="coerce")
+        corrupted = np.flatnonzero(coerced.isna().to_numpy() & series.notna().to_numpy())
+        if len(corrupted)>0:
+            column["corrupted"].append(column["num_rows"]+corrupted)
+        values = coerced.to_numpy(dtype=np.float64)
+        column["kind"], column["dtype"] = "float", np.float64
+    elif column["kind"] in (None, "str"):
+        column["kind"], column["dtype"] = "str", np.int32
+        values = np.empty(len(series), dtype=np.int32)
+        for i, value in enumerate(series.to_numpy(dtype=object)):
+            if value not in column["category_codes"]:
+                column["category_codes"][value] = len(column["categories"])
+                column["categories"].append(value)
+            values[i] = column["category_codes"][value]
+    else:
+        raise Exception("Column {} changes from numbers to other values, use load_raw_obj".format(column["name"]))
+
+    values.tofile(column["file"])
+    column["num_rows"] += len(values)
+
+def _promote_column_to_float(column):
+    """
+    Rewrites the values already written for an int column as float64, like pandas does when a
+    column has both ints and floats.
+    """
+    column["file"].close()
+    values = np.fromfile(column["file_path"], dtype=np.int64).astype(np.float64)
+    column["file"] = open(column["file_path"], "wb")
+    values.tofile(column["file"])
+    column["kind"], column["dtype"] = "float", np.float64
+
+def _open_column_file(file_path, dtype, num_rows):
+    """
+    Memory maps a temporary column file.
+    """
+    if num_rows==0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode="r", shape=(num_rows,))
@@ -0,0 +1,237 @@
+import numpy as np
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+
+#Part of every key. Change it when the cached functions change so old results are not used
+RESULT_CACHE_VERSION = 1
+
+
+class result_cache():
+    def __init__(self, max_memory_entries=4096, cache_path=None, max_disk_bytes=2**30):
+        """
+        Content addressed cache of function results made of np.arrays. Results are kept in an in
+        memory LRU of max_memory_entries results and, if cache_path is given, saved as
+        {key}.npz files in cache_path. The least recently used files are removed once the folder
+        holds more than max_disk_bytes. Keys are made with make_key from a hash of the inputs, so
+        the same inputs always give the same key, in any process.
+
+        Args:
+        @max_memory_entries(int): results kept in memory. 0 turns the memory tier off
+        @cache_path(str): folder for the disk tier. None turns the disk tier off
+        @max_disk_bytes(int): size the disk tier is kept under
+        """
+        self.max_memory_entries = max_memory_entries
+        self.cache_path         = cache_path
+        self.max_disk_bytes     = max_disk_bytes
+        self.hits               = 0
+        self.misses             = 0
+        self._memory            = OrderedDict()
+        self._disk_bytes        = 0
+        if cache_path is not None:
+            os.makedirs(cache_path, exist_ok=True)
+            self._disk_bytes = sum(entry.stat().st_size for entry in self._disk_entries())
+
+    def get(self, key):
+        """
+        Returns a copy of the result saved under key, or None if there isn't one.
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return _copy_result(self._memory[key])
+
+        if self.cache_path is not None:
+            file_path = self._get_file_path(key)
+            try:
+                result = _load_result(file_path)
+                #Mark the file as recently used for the eviction
+                os.utime(file_path)
+            except (OSError, ValueError, KeyError):
+                result = None
+            if result is not None:
+                self._put_memory(key, result)
+                self.hits += 1
+                return _copy_result(result)
+
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """
+        Saves a copy of result (an np.array or a tuple of np.arrays/numbers) under key.
+        """
+        result = _copy_result(result)
+        self._put_memory(key, result)
+        if self.cache_path is None:
+            return
+
+        #Write to a temporary file and rename it so other processes never see a partial file
+        file_descriptor, temp_file_path = tempfile.mkstemp(dir=self.cache_path, suffix=".tmp")
+        with os.fdopen(file_descriptor, "wb") as outfile:
+            _save_result(outfile, result)
+        file_path = self._get_file_path(key)
+        old_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        os.replace(temp_file_path, file_path)
+        self._disk_bytes += os.path.getsize(file_path)-old_size
+        if self._disk_bytes>self.max_disk_bytes:
+            self._evict_disk()
+
+    def get_or_compute(self, key, fun, *args, **kwargs):
+        """
+        Returns the result saved under key, or calls fun(*args, **kwargs), saves it and returns it.
+        """
+        result = self.get(key)
+        if result is None:
+            result = fun(*args, **kwargs)
+            self.put(key, result)
+        return result
+
+    def invalidate(self, key=None):
+        """
+        Removes the result saved under key from both tiers, or every result if key is None.
+        """
+        if key is None:
+            self._memory.clear()
+            for entry in self._disk_entries():
+                os.remove(entry.path)
+            self._disk_bytes = 0
+            return
+        self._memory.pop(key, None)
+        if self.cache_path is not None and os.path.exists(self._get_file_path(key)):
+            self._disk_bytes -= os.path.getsize(self._get_file_path(key))
+            os.remove(self._get_file_path(key))
+
+    def clear_memory(self):
+        """
+        Empties the memory tier and keeps the disk tier.
+        """
+        self._memory.clear()
+
+    def _put_memory(self, key, result):
+        if self.max_memory_entries<=0:
+            return
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory)>self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _get_file_path(self, key):
+        return os.path.join(self.cache_path, key+".npz")
+
+    def _disk_entries(self):
+        if self.cache_path is None:
+            return []
+        return [entry for entry in os.scandir(self.cache_path) if entry.name.endswith(".npz")]
+
+    def _evict_disk(self):
+        """
+        Removes the least recently used files until the disk tier is under 90% of max_disk_bytes.
+        Files can be removed by other processes at the same time so the size is counted again.
+        """
+        entries = sorted(self._disk_entries(), key=lambda entry: entry.stat().st_mtime_ns)
+        self._disk_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._disk_bytes<=0.9*self.max_disk_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._disk_bytes -= size
+            except FileNotFoundError:
+                continue
+
+#Cache used by the smoothing and eol helpers in plotting_and_fitting_helpers
+_default_cache = result_cache()
+
+
+def get_result_cache():
+    """
+    Returns the cache used by the smoothing and eol helpers. None if caching is off.
+    """
+    return _default_cache
+
+def configure_result_cache(enabled=True, max_memory_entries=4096, cache_path=None, max_disk_bytes=2**30):
+    """
+    Replaces the cache used by the smoothing and eol helpers, for example to add a disk tier that
+    is shared between notebook runs. The results already in memory are dropped.
+
+    Args:
+    @enabled(Boolean): False turns caching off
+    @max_memory_entries(int): results kept in memory
+    @cache_path(str): folder for the disk tier. None keeps the results in memory only
+    @max_disk_bytes(int): size the disk tier is kept under
+
+    Returns:
+    @cache(result_cache): the new cache, None if caching is off
+    """
+    global _default_cache
+    _default_cache = result_cache(max_memory_entries, cache_path, max_disk_bytes) if enabled else None
+    return _default_cache
+
+@contextmanager
+def temporary_result_cache(cache=None):
+    """
+    Context manager that makes the smoothing and eol helpers use cache while the block runs and
+    puts the previous cache (with its results) back afterwards. The default None turns caching
+    off, for example so a benchmark times the computation instead of cache hits.
+
+    Args:
+    @cache(result_cache): cache to use in the block, None for no caching
+    """
+    global _default_cache
+    previous_cache = _default_cache
+    _default_cache = cache
+    try:
+        yield
+    finally:
+        _default_cache = previous_cache
+
+def clear_result_cache():
+    """
+    Removes every result from the cache used by the smoothing and eol helpers, on disk as well.
+    """
+    if _default_cache is not None:
+        _default_cache.invalidate()
+
+def make_key(name, *inputs):
+    """
+    Makes a cache key from a hash of the name of the function and its inputs. np.arrays are hashed
+    by dtype, shape and contents so equal arrays give the same key.
+
+    Args:
+    @name(str): name of the function that made the result
+    @inputs: np.arrays, lists and numbers/strings/None the result depends on
+
+    Returns:
+    @key(str): sha256 hex digest
+    """
+    hasher = hashlib.sha256("{}:{}".format(RESULT_CACHE_VERSION, name).encode())
+    for value in inputs:
+        if isinstance(value, (np.ndarray, list, tuple)):
+            array = np.ascontiguousarray(value)
+            hasher.update("array:{}:{}".format(array.dtype.str, array.shape).encode())
+            hasher.update(array.tobytes())
+        else:
+            hasher.update("value:{!r}".format(value).encode())
+    return hasher.hexdigest()
+
+def _copy_result(result):
+    if isinstance(result, tuple):
+        return tuple(np.array(value, copy=True) for value in result)
+    return np.array(result, copy=True)
+
+def _save_result(outfile, result):
+    if isinstance(result, tuple):
+        np.savez(outfile, is_tuple=np.array(True), **{"item_{}".format(i): value for i, value in enumerate(result)})
+    else:
+        np.savez(outfile, is_tuple=np.array(False), item_0=result)
+
+def _load_result(file_path):
+    with np.load(file_path, allow_pickle=False) as npz_file:
+        if not bool(npz_file["is_tuple"]):
+            return npz_file["item_0"]
+        num_items = len(npz_file.files)-1
+        return tuple(npz_file["item_{}".format(i)] for i in range(num_items))
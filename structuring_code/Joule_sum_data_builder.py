@@ -2,9 +2,15 @@ import numpy as np
 import pandas as pd
 import json
 import os
-from tqdm import tqdm
-from Joule_raw_data_builder import load_raw_obj
-from datetime import datetime
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Joule_raw_data_builder import load_raw_obj, build_segment_index
+from Joule_raw_stream import stream_raw_obj
+from Joule_file_index import get_raw_file_path
+from Joule_profiler import profile_stage
+from Joule_file_io import atomic_write, lock_file, write_json_dict, sync_directory
+from contextlib import nullcontext
+from Joule_compact_sum import parse_sum_dates
 import re
 #ignoring future warnings from pandas due to loading in json
 import warnings
@@ -15,10 +21,14 @@ HIGH_C_RATE_CONSTANTS = {'Panasonic NCR18650GA': 1.0, 'Panasonic NCR18650B': 1.0
                 'Sony-Murata US18650VTC6':3.0, 'Tenergy 302030':1.0}
 
 
+@profile_stage("load_sum_obj", rows_fun=lambda args, obj: len(obj.summary_data), file_path_arg="file_path")
 def load_sum_obj(file_path):
     """
     This function converts the json file back in to a cellLife_sum_obj and returns it. Manually add each field 
     and convert certain json fields back in to pandas dataframes
+
+    To read a metric of many cells at once build a summary data store (Joule_sum_store) and pass
+    its store_path to the plotting and fitting helpers instead of loading every file.
     
     Args:
     @file_path(string): location to the file of interest
@@ -34,11 +44,37 @@ def load_sum_obj(file_path):
     meta_data = json_file["meta_data"]
     summary_data = pd.read_json(json_file["summary_data"])
     comment = json_file["comment"]
-    obj = cellLife_sum_obj(meta_data=meta_data, summary_data=summary_data, comment=comment)
+    #Older summary files were saved without the raw file fingerprint
+    raw_fingerprint = json_file.get("raw_fingerprint")
+    obj = cellLife_sum_obj(meta_data=meta_data, summary_data=summary_data, comment=comment,
+                           raw_fingerprint=raw_fingerprint)
     return obj
 
+def get_file_fingerprint(file_path, use_hash=False):
+    """
+    This function gets a fingerprint of a file that is used to tell if a raw data file has 
+    changed since its summary data was generated. 
+
+    Args:
+    @file_path(string): location to the file of interest
+    @use_hash(Boolean): If True also hash the file contents. This reads the whole file, but
+        catches changes that keep the same size and modification time.
+
+    Returns:
+    @fingerprint(dict): Dictionary with the size, mtime_ns and (if use_hash) sha256 of the file
+    """
+    file_stat = os.stat(file_path)
+    fingerprint = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns}
+    if use_hash:
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as openfile:
+            for block in iter(lambda: openfile.read(1 << 20), b""):
+                file_hash.update(block)
+        fingerprint["sha256"] = file_hash.hexdigest()
+    return fingerprint
+
 class cellLife_sum_obj():
-    def __init__(self, meta_data, summary_data, comment="N/A"):
+    def __init__(self, meta_data, summary_data, comment="N/A", raw_fingerprint=None):
         """
         Constructor for cellLife_data_object
         Args:
@@ -47,44 +83,64 @@ class cellLife_sum_obj():
         @summary_data(pd.DataFrame): concatentation of all raw data with the inclusion of 
             Calendar time column
         @comment(string): A string commenting on the data. For example: week 13 has a mistake. 
+        @raw_fingerprint(dict): get_file_fingerprint of the raw data file the summary data was 
+            generated from. Used to skip cells whose raw data has not changed.
         """
-        self.meta_data     = meta_data
-        self.summary_data  = summary_data
-        self.comment       = comment
+        self.meta_data       = meta_data
+        self.summary_data    = summary_data
+        self.comment         = comment
+        self.raw_fingerprint = raw_fingerprint
         
-    def to_json_file(self, file_path, overwrite=False):
+    def to_json_file(self, file_path, overwrite=False, lock=False, sync_dir=True):
         """
         This function saves the cellLife_data_object to a json file. All pieces are converted to 
         serializable objects such as Pandas dataframes to json and then put inside a parent
         dictionary which is converted to the json file.
 
+        The file is written to a temporary file in the same folder and renamed to file_path once it
+        is complete (see Joule_file_io.atomic_write), so processes loading file_path at the same
+        time never see a missing or partly written file.
+
         Args:
         @file_path(string): Path to save_file location
         @overwrite(Boolean): True if you want to overwrite the file at file_path
+        @lock(Boolean): True to hold an advisory lock on file_path while writing (Joule_file_io.lock_file)
+        @sync_dir(Boolean): False leaves flushing the folder to disk to the caller, see 
+            Joule_file_io.write_json_objects
 
         Returns:
         None
         """
         
-        #throw error if file already exists so we don't overwrite it
-        if (os.path.exists(file_path) and not overwrite):
-            raise Exception("File already exists")
-        #If file exists, but you want to overwrite it delete it first
-        if (os.path.exists(file_path) and overwrite):
-            os.remove(file_path)
         #This essentially does what an encoder does
-        dict_to_save = {"meta_data":self.meta_data, "summary_data":self.summary_data.to_json(),
-                       "comment": self.comment}
-        #Open and save to json file
-        with open(file_path, "w") as outfile:
-            json.dump(dict_to_save, outfile)
+        dict_to_save = {"meta_data":self.meta_data, "summary_data":self.summary_data,
+                       "comment": self.comment, "raw_fingerprint": self.raw_fingerprint}
+        with lock_file(file_path) if lock else nullcontext():
+            with atomic_write(file_path, overwrite=overwrite, sync_dir=sync_dir) as outfile:
+                write_json_dict(outfile, dict_to_save, dataframe_keys=["summary_data"])
 
 
-def generate_sum_data(cell_type, raw_path, save_path, code_path, overwrite=True):
+def generate_sum_data(cell_type, raw_path, save_path, code_path, overwrite=True, num_workers=1, chunksize=1,
+                      incremental=False, file_index=None, lock=False, cell_ids=None, return_errors=False):
     """
     This function looks through the raw data folder provided with raw_path and generates the feature 
     dataframe for all of the raw data that is in that folder. This function calls feature functions
     that are general enough that they should not fail on otherwise good files. 
+
+    With num_workers>1 the cells are split in to chunks of chunksize cells and featurized in 
+    parallel by a process pool. Each summary object is always saved as {cell_id}_sum.json in 
+    save_path and files_failed is in the same order as Joule_cell_id.csv, so the output does not
+    depend on the number of workers.
+
+    With incremental=True cells that already have a summary object in save_path are updated with
+    update_sum_data_cell_id, which only featurizes new diagnostics and skips cells whose raw
+    data file has not changed.
+
+    Summary objects are written atomically (see cellLife_sum_obj.to_json_file) so they can be 
+    loaded by other processes while this runs. save_path is flushed to disk once at the end (once
+    per chunk with num_workers>1) instead of once per file. With lock=True every cell holds
+    Joule_file_io.lock_file on its summary object while it is read, updated and written, so
+    generate_sum_data runs started at the same time on the same save_path don't lose updates.
     
     Args:
     @cell_type(str): String of what cell type it is (ex: "Panasonic NCR18650B")
@@ -92,27 +148,111 @@ def generate_sum_data(cell_type, raw_path, save_path, code_path, overwrite=True)
     @save_path(str): Path of where to save the summary data objects
     @code_path(string): Where the Joule_cell_id.csv is stored. This is also where the sum and raw code is. 
     @overwrite(Boolean): Whether you want to overwrite already existing summary objects
+    @num_workers(int): Number of worker processes. 1 featurizes the cells serially in this process
+    @chunksize(int): Number of cells sent to a worker process at a time
+    @incremental(Boolean): Only featurize diagnostics that are not already in the summary objects
+    @file_index(pd.DataFrame): File index from Joule_file_index used to find the raw data files
+        instead of listing raw_path for every cell
+    @lock(Boolean): Hold an advisory lock on each summary object while it is generated and saved
+    @cell_ids(list[str]): Only generate these cells of cell_type. None generates every cell of 
+        cell_type in Joule_cell_id.csv
+    @return_errors(Boolean): True to also return the error of every cell that failed
+
+    Returns:
+    @files_failed(list[str]): cell_id of every cell that failed
+    @errors_list(list[tuple(str, str)]): (cell_id, error) of every cell that failed, only returned
+        if return_errors is True. A worker process that crashes fails every cell it was sent
     """
+    from tqdm import tqdm
     
     joule_cell_id_path = code_path+"Joule_cell_id.csv"
     cell_id_df = pd.read_csv(joule_cell_id_path, dtype=str, index_col=False)
     cell_type_df = cell_id_df[cell_id_df["Cell_type"]==cell_type]
-    cell_id_list = list(cell_type_df["Cell_id"])
-    files_failed = []
-    
-    for i in tqdm(range(len(cell_id_list[:]))):
-        cell_id=str(cell_id_list[i])
-
-        try:
-            sum_obj = generate_sum_data_cell_id(cell_id, raw_path, cell_type)
-            filename = save_path+"{}_sum.json".format(cell_id)
-            sum_obj.to_json_file(filename, overwrite=overwrite)
-        except:
-            files_failed.append(cell_id)
-
+    cell_id_list = [str(x) for x in cell_type_df["Cell_id"]]
+    if cell_ids is not None:
+        cell_id_set = set(str(x) for x in cell_ids)
+        cell_id_list = [x for x in cell_id_list if x in cell_id_set]
+    errors_list = []
+
+    if num_workers<=1:
+        for i in tqdm(range(len(cell_id_list[:]))):
+            cell_id=cell_id_list[i]
+            error = _generate_and_save_sum_data_cell_id(cell_id, raw_path, save_path, cell_type, overwrite,
+                                                        incremental, file_index, lock)
+            if error is not None:
+                errors_list.append((cell_id, error))
+        sync_directory(save_path)
+        return _get_files_failed(errors_list, return_errors)
+
+    cell_id_chunks = [cell_id_list[i:i+chunksize] for i in range(0, len(cell_id_list), chunksize)]
+    error_dict = {}
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        future_to_chunk = {executor.submit(_generate_and_save_sum_data_chunk, chunk, raw_path, save_path, 
+                                           cell_type, overwrite, incremental, file_index, lock): chunk 
+                           for chunk in cell_id_chunks}
+        #Progress bar counts cells finished across all workers
+        with tqdm(total=len(cell_id_list)) as progress_bar:
+            for future in as_completed(future_to_chunk):
+                try:
+                    error_dict.update(future.result())
+                except Exception as e:
+                    #The worker crashed (ex: BrokenProcessPool), so the cells of the chunk failed
+                    error_dict.update({cell_id: "{}: {}".format(type(e).__name__, e) for cell_id in future_to_chunk[future]})
+                progress_bar.update(len(future_to_chunk[future]))
+
+    #Keep the failed files in the same order as the serial version
+    for cell_id in cell_id_list:
+        if error_dict[cell_id] is not None:
+            errors_list.append((cell_id, error_dict[cell_id]))
+
+    return _get_files_failed(errors_list, return_errors)
+
+def _get_files_failed(errors_list, return_errors):
+    """
+    Return value of generate_sum_data from the (cell_id, error) list of the cells that failed.
+    """
+    files_failed = [cell_id for cell_id, _ in errors_list]
+    if return_errors:
+        return files_failed, errors_list
     return files_failed
 
-def generate_sum_data_cell_id(cell_id, raw_path, cell_type):
+def _generate_and_save_sum_data_cell_id(cell_id, raw_path, save_path, cell_type, overwrite, incremental=False,
+                                        file_index=None, lock=False):
+    """
+    Generates and saves the summary object of one cell. Returns None if it worked, otherwise the 
+    exception as a string so it can be sent back from a worker process. The folder is not flushed
+    to disk, that is left to generate_sum_data.
+    """
+    try:
+        filename = save_path+"{}_sum.json".format(cell_id)
+        #The lock is held from reading the old summary object until the new one is saved
+        with lock_file(filename) if lock else nullcontext():
+            if incremental and os.path.exists(filename):
+                sum_obj = update_sum_data_cell_id(cell_id, raw_path, save_path, cell_type, file_index=file_index)
+                #raw data did not change so there is nothing to save
+                if sum_obj is None:
+                    return None
+                sum_obj.to_json_file(filename, overwrite=True, sync_dir=False)
+            else:
+                sum_obj = generate_sum_data_cell_id(cell_id, raw_path, cell_type, file_index=file_index)
+                sum_obj.to_json_file(filename, overwrite=overwrite, sync_dir=False)
+    except Exception as e:
+        return "{}: {}".format(type(e).__name__, e)
+    return None
+
+def _generate_and_save_sum_data_chunk(cell_id_chunk, raw_path, save_path, cell_type, overwrite, incremental=False,
+                                      file_index=None, lock=False):
+    """
+    Worker process function for generate_sum_data. Returns a dict of cell_id to error (or None).
+    """
+    error_dict = {cell_id: _generate_and_save_sum_data_cell_id(cell_id, raw_path, save_path, cell_type, overwrite,
+                                                               incremental, file_index, lock)
+                  for cell_id in cell_id_chunk}
+    sync_directory(save_path)
+    return error_dict
+
+@profile_stage("generate_sum_data_cell_id", rows_fun=lambda args, obj: len(obj.summary_data), cell_id_arg="cell_id")
+def generate_sum_data_cell_id(cell_id, raw_path, cell_type, vectorized=True, file_index=None, streaming=False):
     """
     This function generates a cellLife_sum_obj for a specific cell_id. It uses
     the raw data that is already generated (and given via the raw_path) to perform
@@ -123,17 +263,145 @@ def generate_sum_data_cell_id(cell_id, raw_path, cell_type):
     @raw_path(str): Path to where all the raw data objects are stored
     @cell_type(str): The cell type corresponding to the cell_id. Used in steady
                     state resistance feature extraction.
+    @vectorized(Boolean): If True featurize all diagnostics at once with generate_featurized_df.
+                    If False use the per diagnostic loop in generate_featurized_df_by_diag. Both
+                    give the same summary data.
+    @file_index(pd.DataFrame): File index from Joule_file_index used to find the raw data file. 
+                    If None raw_path is searched for the file.
+    @streaming(Boolean): If True read the raw data one diagnostic at a time with stream_raw_obj
+                    and featurize each diagnostic before reading the next, so the whole raw data
+                    is never in memory. Gives the same summary data.
     
     Returns:
     @sum_obj(cellLife_sum_obj): Summary data object for that cell_id
     """
     
-    file_name = [x for x in os.listdir(raw_path) if x.startswith(cell_id)][0]
-    file_path = raw_path+file_name
+    file_path = get_raw_file_path(cell_id, raw_path, file_index)
     
+    if streaming:
+        raw_obj = stream_raw_obj(file_path)
+        df_list = []
+        for diag_num, df_diag in raw_obj:
+            if vectorized:
+                df_list.append(generate_featurized_df(df_diag, cell_type))
+            elif not diagnostic_failed(df_diag):
+                df_list.append(generate_diag_summary_dataframe(df_diag, cell_type))
+        df_list = [df for df in df_list if len(df)>0]
+        df_featurized = pd.concat(df_list, ignore_index=True) if len(df_list)>0 else pd.DataFrame()
+    else:
+        raw_obj = load_raw_obj(file_path)
+        total_df = raw_obj.raw_data
+
+        if vectorized:
+            df_featurized = generate_featurized_df(total_df, cell_type, segment_index=raw_obj.segment_index)
+        else:
+            df_featurized = generate_featurized_df_by_diag(total_df, cell_type)
+
+    #add a column for the date_time measure in days
+    add_calendar_days(df_featurized)
+
+    #save to sum object
+    sum_obj = cellLife_sum_obj(meta_data=raw_obj.meta_data, summary_data=df_featurized, 
+                               comment=raw_obj.comment, raw_fingerprint=get_file_fingerprint(file_path))
+    return sum_obj
+
+def update_sum_data_cell_id(cell_id, raw_path, sum_path, cell_type, use_hash=False, file_index=None):
+    """
+    This function updates the existing summary object of a cell_id with the diagnostics that have
+    been added to its raw data since the summary was generated. Only the diagnostics that are not
+    already in the summary data are featurized. Calendar_DateTime(days) of the new diagnostics is
+    counted from the start date of the existing summary data. This assumes diagnostics are only
+    ever appended to the raw data, use generate_sum_data_cell_id to regenerate a cell from scratch.
+
+    Args:
+    @cell_id(str): Unqiue Cell identification number ex: "C00001"
+    @raw_path(str): Path to where all the raw data objects are stored
+    @sum_path(str): Path to where the existing {cell_id}_sum.json is stored
+    @cell_type(str): The cell type corresponding to the cell_id. Used in steady
+                    state resistance feature extraction.
+    @use_hash(Boolean): Also compare a hash of the raw file to tell if it has changed.
+    @file_index(pd.DataFrame): File index from Joule_file_index used to find the raw data file. 
+                    If None raw_path is searched for the file.
+
+    Returns:
+    @sum_obj(cellLife_sum_obj): Updated summary data object for that cell_id. None if the raw data
+        file has not changed since the summary object was generated.
+    """
+    file_path = get_raw_file_path(cell_id, raw_path, file_index)
+    old_sum_obj = load_sum_obj(sum_path+"{}_sum.json".format(cell_id))
+
+    raw_fingerprint = get_file_fingerprint(file_path, use_hash=use_hash)
+    if old_sum_obj.raw_fingerprint is not None:
+        #Only compare the keys both fingerprints have (hash may not have been taken before)
+        shared_keys = set(raw_fingerprint) & set(old_sum_obj.raw_fingerprint)
+        if all(raw_fingerprint[key]==old_sum_obj.raw_fingerprint[key] for key in shared_keys):
+            return None
+
     raw_obj = load_raw_obj(file_path)
     total_df = raw_obj.raw_data
+    old_df = old_sum_obj.summary_data
+
+    if len(old_df)>0:
+        new_df = total_df[~total_df["diag_num"].isin(set(old_df["diag_num"]))]
+    else:
+        new_df = total_df
+
+    if len(new_df)>0:
+        df_featurized = generate_featurized_df(new_df, cell_type)
+    else:
+        df_featurized = pd.DataFrame()
+
+    if len(old_df)==0:
+        add_calendar_days(df_featurized)
+    elif len(df_featurized)>0:
+        start_date = old_df["Calendar_Time(date)"].iloc[0]
+        add_calendar_days(df_featurized, start_date=start_date)
+        df_featurized = pd.concat([old_df, df_featurized], ignore_index=True)
+        df_featurized = df_featurized.sort_values("diag_num", kind="stable", ignore_index=True)
+    else:
+        df_featurized = old_df
+
+    sum_obj = cellLife_sum_obj(meta_data=raw_obj.meta_data, summary_data=df_featurized, 
+                               comment=raw_obj.comment, raw_fingerprint=raw_fingerprint)
+    return sum_obj
+
+def add_calendar_days(df_featurized, start_date=None):
+    """
+    Adds the Calendar_DateTime(days) column to featurized summary data in place. This is the 
+    number of days between each diagnostic and start_date.
+
+    Args:
+    @df_featurized(pd.DataFrame): Summary data with a Calendar_Time(date) column
+    @start_date(str): Date to count days from in the form "%Y-%m-%d". If None the first diagnostic
+        in df_featurized is used.
+
+    Returns:
+    None
+    """
+    if len(df_featurized)==0:
+        return
+    if start_date is None:
+        start_date = df_featurized["Calendar_Time(date)"].iloc[0]
+    #Parse all dates at once instead of calling datetime.strptime on each one
+    date_array = parse_sum_dates(df_featurized["Calendar_Time(date)"])
+    start_date = parse_sum_dates([start_date])[0]
+    df_featurized["Calendar_DateTime(days)"] = (date_array-start_date).astype(np.int64)
+
+def generate_featurized_df_by_diag(total_df, cell_type):
+    """
+    This function featurizes every diagnostic of a cell one at a time by filtering total_df
+    for each diagnostic and calling generate_diag_summary_dataframe on it. This is the original
+    featurization and is kept as the reference generate_featurized_df is checked against.
+
+    Args:
+    @total_df(pd.DataFrame): raw_data of a cellLife_raw_obj
+    @cell_type(str): The cell type corresponding to the raw data. Used in steady
+                    state resistance feature extraction.
 
+    Returns:
+    @df_featurized(pd.DataFrame): Dataframe with a row of features for every diagnostic that did
+            not fail. Does not include the Calendar_DateTime(days) column.
+    """
     total_num_diags = total_df["diag_num"].iloc[-1]+1
 
     df_featurized = pd.DataFrame()
@@ -150,17 +418,118 @@ def generate_sum_data_cell_id(cell_id, raw_path, cell_type):
         #Concatenate to total df
         df_featurized = pd.concat([df_featurized, temp_feat_total_df], ignore_index=True)
 
-    #add a column for the date_time measure in days
-    if len(df_featurized)>0:
-        start_date = datetime.strptime(df_featurized["Calendar_Time(date)"].iloc[0], '%Y-%m-%d')
-        df_featurized["Calendar_DateTime(days)"] = df_featurized["Calendar_Time(date)"].apply(lambda x: (datetime.strptime(x, '%Y-%m-%d')-start_date).days)
+    return df_featurized
 
+@profile_stage("generate_featurized_df", rows_fun=lambda args, df: len(args["total_df"]))
+def generate_featurized_df(total_df, cell_type, segment_index=None):
+    """
+    This function gets every capacity, energy and steady state resistance feature of every 
+    diagnostic of a cell from the segment index of the raw data instead of filtering the raw 
+    data again for every diagnostic, cycle and feature. The features are calculated the same way
+    as get_capacity, get_energy and get_ss_resistance, so the output is column for column the 
+    same as generate_featurized_df_by_diag.
+
+    The steps of a diagnostic are split in to cycles by the rank of their cycle number (cycles 1-3
+    are the RPT_C/5 and cycles 4-6 the high rate RPT, same as generate_capacity_df). For each 
+    of these cycles the row positions of the last row of the charge, the charge before the CV hold
+    (cc_end) and the discharge are read off of the segment index and the features are taken at
+    those rows.
 
-    #save to sum object
-    sum_obj = cellLife_sum_obj(meta_data=raw_obj.meta_data, summary_data=df_featurized, 
-                               comment=raw_obj.comment)
-    return sum_obj
+    Args:
+    @total_df(pd.DataFrame): raw_data of a cellLife_raw_obj
+    @cell_type(str): The cell type corresponding to the raw data. Used in steady
+                    state resistance feature extraction.
+    @segment_index(pd.DataFrame): segment_index of the cellLife_raw_obj total_df is the raw_data
+                    of. If None it is built with build_segment_index, which is needed when
+                    total_df is only some of the rows of the raw data.
+
+    Returns:
+    @df_featurized(pd.DataFrame): Dataframe with a row of features for every diagnostic that did
+            not fail. Does not include the Calendar_DateTime(days) column.
+    """
+    if segment_index is None:
+        segment_index = build_segment_index(total_df)
+    total_num_diags = total_df["diag_num"].iloc[-1]+1
+    segments = segment_index[(segment_index["diag_num"]>=0) & (segment_index["diag_num"]<total_num_diags)]
+
+    #If diagnostic does not complete 7 cycles it failed, same as diagnostic_failed
+    num_cycles = segments.groupby("diag_num")["cycle_rank"].max()+1
+    good_diags = np.sort(num_cycles[num_cycles>=7].index.to_numpy())
+    if len(good_diags)==0:
+        return pd.DataFrame()
+
+    #Date of a diagnostic is the date of its first row
+    diag_start_rows = segments.groupby("diag_num")["start"].min().loc[good_diags].to_numpy()
+
+    #Only the RPT cycles 1-6 are used for features
+    rpt_segments = segments[segments["diag_num"].isin(good_diags) & segments["cycle_rank"].between(1, 6)]
+    cycle_keys = ["diag_num", "cycle_rank"]
+    is_charge = (rpt_segments["MD"]=="C").to_numpy()
+    is_discharge = (rpt_segments["MD"]=="D").to_numpy()
+    has_cc_rows = (rpt_segments["cc_end"]>rpt_segments["start"]).to_numpy()
+
+    #Row position of the last row of each cycle for the step of interest
+    cycle_index = pd.MultiIndex.from_product([good_diags, range(1, 7)], names=cycle_keys)
+    last_rows = {}
+    for step_name, step_mask, end_col in [("C", is_charge & has_cc_rows, "cc_end"), ("C_CV", is_charge, "end"), 
+                                          ("D", is_discharge, "end")]:
+        step_ends = rpt_segments[step_mask].groupby(cycle_keys)[end_col].max().reindex(cycle_index)
+        #get_capacity and get_energy fail on a missing step with .iloc[-1] so do the same here
+        if step_ends.isna().to_numpy().any():
+            raise IndexError("Step {} is missing from a diagnostic cycle".format(step_name))
+        last_rows[step_name] = step_ends.to_numpy().astype(np.int64).reshape(len(good_diags), 6)-1
+
+    def get_feature(step_name, rank, col):
+        values = total_df[col].to_numpy()[last_rows[step_name][:, rank-1]]
+        if col=="Energy (Wh)":
+            return np.array([_energy_to_float(x) for x in values], dtype=float)
+        return values.astype(float)
+
+    feature_dict = {}
+    for col, suffix in [("Capacity (Ah)", "capacity"), ("Energy (Wh)", "energy")]:
+        for idx, cycle in enumerate(range(1,7)):
+            if cycle<4:
+                prefix = "RPT0.2C_{}".format(idx)
+                cv_prefix = prefix
+            #1C cycles. The CV names keep idx to match generate_capacity_df
+            else:
+                prefix = "RPT_HighC_{}".format(idx-3)
+                cv_prefix = "RPT_HighC_{}".format(idx)
+            feature_dict["{}_C_{}".format(prefix, suffix)] = get_feature("C", cycle, col)
+            feature_dict["{}_C_CV_{}".format(cv_prefix, suffix)] = get_feature("C_CV", cycle, col)
+            feature_dict["{}_D_{}".format(prefix, suffix)] = get_feature("D", cycle, col)
+
+    #Taken from the raw data so diag_num keeps its type
+    feature_dict["diag_num"] = total_df["diag_num"].to_numpy()[diag_start_rows]
+    feature_dict["Calendar_Time(date)"] = np.asarray(total_df["Diag_Start_Datetime"], dtype=object)[diag_start_rows]
+
+    lowCrate = 1/5
+    highCrate = HIGH_C_RATE_CONSTANTS[cell_type]
+    for idx, cycle in enumerate(range(1,4)):
+        disc_cap_lowrate = get_feature("D", cycle, "Capacity (Ah)")
+        disc_cap_highrate = get_feature("D", cycle+3, "Capacity (Ah)")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_volt_lowrate = get_feature("D", cycle, "Energy (Wh)")/disc_cap_lowrate
+            avg_volt_highrate = get_feature("D", cycle+3, "Energy (Wh)")/disc_cap_highrate
+            #multiply by -1 to account for the C-rate being negative
+            res_ss = -1*(avg_volt_highrate-avg_volt_lowrate)/(highCrate-lowCrate)
+        #get_ss_resistance returns nan on divide by 0
+        res_ss[(disc_cap_lowrate==0) | (disc_cap_highrate==0)] = np.nan
+        feature_dict["Res_SS_{}_D".format(idx)] = res_ss
+
+    df_featurized = pd.DataFrame(feature_dict)
+    return df_featurized
+
+def _energy_to_float(energy):
+    """
+    Same coercion as get_energy, corrupted string energies become nan.
+    """
+    try:
+        return float(energy)
+    except:
+        return np.nan
 
+@profile_stage("generate_diag_summary_dataframe", rows_fun=lambda args, df: len(args["df_diag"]))
 def generate_diag_summary_dataframe(df_diag, cell_type):
     """
     This is a wrapper function that contains all the summary dataframes that are to
@@ -0,0 +1,185 @@
+import pandas as pd
+import numpy as np
+import os
+import json
+import shutil
+from Joule_sum_data_builder import load_sum_obj, cellLife_sum_obj
+from Joule_file_index import get_sum_file_path
+#ignoring future warnings from pandas due to loading in json
+import warnings
+warnings.simplefilter(action='ignore', category=FutureWarning)
+
+#Joule_cell_id.csv columns stored with every summary row
+SUM_STORE_CELL_COLUMNS = ["Cell_id", "Cell_type", "Cell_chemistry", "Test_id", "SOC", "Temperature", "Lot"]
+#Columns the store is partitioned by
+SUM_STORE_PARTITION_COLUMNS = ["Cell_type", "Temperature", "SOC"]
+#meta_data and comment of every cell are kept in this file in the store folder. The leading _
+#makes pyarrow skip it when reading the dataset.
+SUM_STORE_CELL_INFO_FILE = "_cell_info.json"
+
+
+def build_sum_store(sum_path, code_path, store_path, file_index=None):
+    """
+    This function builds a single summary data store of every cell in Joule_cell_id.csv that has
+    a summary data file. The summary rows of every cell are joined with the cell's information
+    from Joule_cell_id.csv and saved as a parquet dataset in store_path partitioned by Cell_type,
+    Temperature and SOC. meta_data and comment of every cell are saved in _cell_info.json in
+    store_path. An existing store in store_path is replaced: its partition folders and
+    _cell_info.json are deleted first, so cells that are no longer in the summary data are not
+    left in the store. Other files in store_path are kept.
+
+    Args:
+    @sum_path(str): Path to the summary data objects
+    @code_path(string): Where the Joule_cell_id.csv is stored
+    @store_path(str): Folder to save the store to
+    @file_index(pd.DataFrame): File index from Joule_file_index used to find the summary files.
+        If None the files are {cell_id}_sum.json in sum_path
+
+    Returns:
+    @files_failed(list[tuple(str, str)]): (cell_id, error) for every summary file that could not
+        be added
+    """
+    from tqdm import tqdm
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    cell_id_df = pd.read_csv(code_path+"Joule_cell_id.csv", index_col=False)
+    df_list = []
+    cell_info_dict = {}
+    files_failed = []
+
+    for i in tqdm(range(len(cell_id_df))):
+        cell_row = cell_id_df.iloc[i]
+        cell_id = str(cell_row["Cell_id"])
+        try:
+            file_path = get_sum_file_path(cell_id, sum_path, file_index)
+        except FileNotFoundError:
+            continue
+        if not os.path.exists(file_path):
+            continue
+
+        try:
+            sum_obj = load_sum_obj(file_path)
+        except Exception as e:
+            files_failed.append((cell_id, "{}: {}".format(type(e).__name__, e)))
+            continue
+
+        df = sum_obj.summary_data
+        if len(df)==0:
+            continue
+        for col in SUM_STORE_CELL_COLUMNS:
+            df[col] = cell_row[col]
+        df_list.append(df)
+        cell_info_dict[cell_id] = {"meta_data": sum_obj.meta_data, "comment": sum_obj.comment}
+
+    if len(df_list)==0:
+        raise Exception("No summary data found in {} for the cells in Joule_cell_id.csv".format(sum_path))
+    store_df = pd.concat(df_list, ignore_index=True)
+    store_df["Cell_id"] = store_df["Cell_id"].astype(str)
+    table = pa.Table.from_pandas(store_df, preserve_index=False)
+
+    os.makedirs(store_path, exist_ok=True)
+    _clear_sum_store(store_path)
+    pq.write_to_dataset(table, store_path, partition_cols=SUM_STORE_PARTITION_COLUMNS,
+                        existing_data_behavior="overwrite_or_ignore")
+    with open(os.path.join(store_path, SUM_STORE_CELL_INFO_FILE), "w") as outfile:
+        json.dump(cell_info_dict, outfile)
+
+    return files_failed
+
+def query_sum_store(store_path, metric, cell_type=None, soc=None, temperature=None, cell_id=None, time_range=None):
+    """
+    Gets the metric(s) of interest of every cell in the summary data store that matches the
+    filters. Only the partitions and columns needed are read. Each filter can be a single value
+    or a list of values, None does not filter on it.
+
+    Args:
+    @store_path(str): Folder of the store made by build_sum_store
+    @metric(str or list[str]): summary data column(s) to get, ex: "RPT0.2C_2_D_capacity"
+    @cell_type(str or list): Cell_type(s) to get, ex: "Panasonic NCR18650B"
+    @soc(int or list): SOC(s) to get
+    @temperature(int or list): Temperature(s) to get
+    @cell_id(str or list): Cell_id(s) to get
+    @time_range(tuple(float, float)): Inclusive (start, end) range of Calendar_DateTime(days)
+
+    Returns:
+    @cell_data_dict(dict): cell_id -> dict of column -> np.array sorted by diag_num. Always has
+        "diag_num" and "Calendar_DateTime(days)" as well as the metric(s)
+    """
+    import pyarrow.dataset as ds
+
+    metric_list = [metric] if isinstance(metric, str) else list(metric)
+    columns = ["Cell_id", "diag_num", "Calendar_DateTime(days)"]
+    columns += [x for x in metric_list if x not in columns]
+
+    filter_expr = None
+    for col, value in [("Cell_type", cell_type), ("SOC", soc), ("Temperature", temperature), ("Cell_id", cell_id)]:
+        if value is None:
+            continue
+        if not isinstance(value, (list, tuple, set, np.ndarray)):
+            value = [value]
+        expr = ds.field(col).isin(list(value))
+        filter_expr = expr if filter_expr is None else filter_expr & expr
+    if time_range is not None:
+        expr = (ds.field("Calendar_DateTime(days)")>=time_range[0]) & (ds.field("Calendar_DateTime(days)")<=time_range[1])
+        filter_expr = expr if filter_expr is None else filter_expr & expr
+
+    dataset = ds.dataset(store_path, format="parquet", partitioning=_get_store_partitioning())
+    df = dataset.to_table(columns=columns, filter=filter_expr).to_pandas()
+    df = df.sort_values(["Cell_id", "diag_num"], kind="stable")
+
+    cell_data_dict = {}
+    cell_id_array = df["Cell_id"].to_numpy()
+    change_idx = np.flatnonzero(cell_id_array[1:]!=cell_id_array[:-1])+1
+    block_bounds = np.concatenate([[0], change_idx, [len(df)]])
+    column_arrays = {col: df[col].to_numpy() for col in columns[1:]}
+    for start, end in zip(block_bounds[:-1], block_bounds[1:]):
+        if start==end:
+            continue
+        cell_data_dict[str(cell_id_array[start])] = {col: column_arrays[col][start:end] for col in columns[1:]}
+    return cell_data_dict
+
+def load_sum_obj_from_store(store_path, cell_id):
+    """
+    This function gets the cellLife_sum_obj of a cell_id back from the summary data store. The
+    summary data has the same columns as the {cell_id}_sum.json file it was built from.
+
+    Args:
+    @store_path(str): Folder of the store made by build_sum_store
+    @cell_id(str): Unqiue Cell identification number ex: "C00001"
+
+    Returns:
+    @obj(cellLife_sum_obj): reconstructed cellLife_sum_obj
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(store_path, format="parquet", partitioning=_get_store_partitioning())
+    summary_data = dataset.to_table(filter=(ds.field("Cell_id")==cell_id)).to_pandas()
+    summary_data = summary_data.sort_values("diag_num", kind="stable", ignore_index=True)
+    summary_data = summary_data.drop(columns=SUM_STORE_CELL_COLUMNS)
+
+    with open(os.path.join(store_path, SUM_STORE_CELL_INFO_FILE), "r") as openfile:
+        cell_info = json.load(openfile)[cell_id]
+    obj = cellLife_sum_obj(meta_data=cell_info["meta_data"], summary_data=summary_data, comment=cell_info["comment"])
+    return obj
+
+def _get_store_partitioning():
+    """
+    Hive partitioning of the store with fixed types so SOC and Temperature are always ints.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([("Cell_type", pa.string()), ("Temperature", pa.int64()), ("SOC", pa.int64())]),
+                           flavor="hive")
+
+def _clear_sum_store(store_path):
+    """
+    Deletes the partition folders and the cell info file of a store made by build_sum_store.
+    """
+    partition_prefix = SUM_STORE_PARTITION_COLUMNS[0]+"="
+    for name in os.listdir(store_path):
+        entry_path = os.path.join(store_path, name)
+        if name.startswith(partition_prefix) and os.path.isdir(entry_path):
+            shutil.rmtree(entry_path)
+        elif name==SUM_STORE_CELL_INFO_FILE:
+            os.remove(entry_path)
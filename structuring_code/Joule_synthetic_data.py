@@ -0,0 +1,187 @@
+import pandas as pd
+import numpy as np
+import os
+from Joule_raw_data_builder import cellLife_raw_obj
+from Joule_sum_data_builder import generate_sum_data, HIGH_C_RATE_CONSTANTS
+from Joule_file_io import sync_directory
+
+#Rate of the RPT charges and the low rate discharges
+LOW_C_RATE = 1/5
+#Cycles in each synthetic diagnostic: conditioning, 3 low rate RPTs, 3 high rate RPTs, recharge to storage SOC
+NUM_DIAG_CYCLES = 8
+#Cycle numbers skipped between diagnostics, like the aging cycles between real diagnostics
+CYCLES_BETWEEN_DIAGS = 3
+
+
+def make_synthetic_raw_data(num_diags=10, cell_type="Panasonic NCR18650B", nominal_capacity=3.0, points_per_step=100,
+                            diag_interval_days=182, start_date="2014-01-01", fade_rate=2.0, resistance=0.05,
+                            resistance_growth=10.0, storage_soc=50, corrupt_fraction=0.0, seed=None):
+    """
+    This function makes synthetic raw data in the same layout as the raw_data of a cellLife_raw_obj.
+    Every diagnostic has a conditioning cycle, three C/5 RPT cycles, three high rate RPT cycles and a
+    recharge to the storage SOC. Charges are CC at C/5 followed by a CV hold with a decaying current
+    and discharges are CC at C/5 or the high rate of the cell_type. Capacity fades and resistance
+    grows with the square root of time so the summary data looks like a calendar aging test.
+
+    Args:
+    @num_diags(int): number of diagnostics
+    @cell_type(str): cell type used for the high discharge rate, ex: "Panasonic NCR18650B"
+    @nominal_capacity(float): starting capacity in Ah
+    @points_per_step(int): data points in each CC step. The CV holds have a quarter of this
+    @diag_interval_days(int): days between diagnostics
+    @start_date(str): date of the first diagnostic in the form "%Y-%m-%d"
+    @fade_rate(float): capacity lost in % per sqrt(year)
+    @resistance(float): starting resistance in Ohm*Ah
+    @resistance_growth(float): resistance gained in % per sqrt(year)
+    @storage_soc(float): SOC in % the cell is left at after each diagnostic
+    @corrupt_fraction(float): fraction of Energy (Wh) entries replaced with corrupted strings, which
+        makes the column an object column like in the real data
+    @seed(int): random seed
+
+    Returns:
+    @raw_data(pd.DataFrame): synthetic raw data
+    """
+    rng = np.random.default_rng(seed)
+    high_c_rate = HIGH_C_RATE_CONSTANTS[cell_type]
+    start_date = pd.Timestamp(start_date)
+
+    step_list = []
+    test_time = 0.0
+    for diag_num in range(num_diags):
+        years = diag_num*diag_interval_days/365.25
+        capacity = nominal_capacity*(1-fade_rate/100*np.sqrt(years))
+        diag_resistance = resistance*(1+resistance_growth/100*np.sqrt(years))
+        diag_date = (start_date+pd.Timedelta(days=diag_num*diag_interval_days)).strftime("%Y-%m-%d")
+        first_cycle = diag_num*(NUM_DIAG_CYCLES+CYCLES_BETWEEN_DIAGS)
+
+        for cycle_idx in range(NUM_DIAG_CYCLES):
+            discharge_rate = high_c_rate if 4<=cycle_idx<=6 else LOW_C_RATE
+            #The first cycle starts from the storage SOC (at most 90% so there is something to charge),
+            #every cycle is charged to full and discharged to empty and the last cycle only charges
+            #back to the storage SOC
+            start_soc = min(storage_soc/100, 0.9) if cycle_idx==0 else 0.0
+            end_soc = storage_soc/100 if cycle_idx==NUM_DIAG_CYCLES-1 else 1.0
+            cycle_steps = [_make_charge_step(capacity, nominal_capacity, diag_resistance, start_soc, end_soc,
+                                             points_per_step, cv_hold=end_soc==1.0, rng=rng)]
+            if cycle_idx<NUM_DIAG_CYCLES-1:
+                cycle_steps.append(_make_discharge_step(capacity, nominal_capacity, diag_resistance, discharge_rate,
+                                                        points_per_step, rng=rng))
+            for step_df in cycle_steps:
+                step_df["Test Time (s)"] += test_time
+                test_time = step_df["Test Time (s)"].iloc[-1]
+                step_df["Cycle"] = first_cycle+cycle_idx
+                step_df["diag_num"] = diag_num
+                step_df["Diag_Start_Datetime"] = diag_date
+                step_list.append(step_df)
+
+    raw_data = pd.concat(step_list, ignore_index=True)
+    raw_data = raw_data[["Test Time (s)", "Cycle", "MD", "Current (A)", "Voltage (V)", "Capacity (Ah)", "Energy (Wh)",
+                         "diag_num", "Diag_Start_Datetime"]]
+
+    if corrupt_fraction>0:
+        corrupt_idx = rng.choice(len(raw_data), size=max(1, int(corrupt_fraction*len(raw_data))), replace=False)
+        energy = raw_data["Energy (Wh)"].astype(object)
+        energy.iloc[corrupt_idx] = "#VALUE!"
+        raw_data["Energy (Wh)"] = energy
+    return raw_data
+
+def write_synthetic_dataset(save_path, num_cells=4, num_diags=10, cell_type="Panasonic NCR18650B", points_per_step=100,
+                            corrupt_fraction=0.0, write_sum=True, seed=0):
+    """
+    This function writes a synthetic dataset in the same layout as the real one so the
+    structuring_code pipeline can be run without the OSF data. save_path gets a Joule_cell_id.csv,
+    a raw_data folder of {cell_id}_raw.json files and, if write_sum is True, a sum_data folder of
+    {cell_id}_sum.json files made with generate_sum_data. Cells are named S00001, S00002 etc and
+    have different fade rates, resistances and test conditions.
+
+    Args:
+    @save_path(str): folder to write the dataset to
+    @num_cells(int): number of cells
+    @num_diags(int): number of diagnostics of each cell
+    @cell_type(str): cell type of every cell, ex: "Panasonic NCR18650B"
+    @points_per_step(int): data points in each CC step, see make_synthetic_raw_data
+    @corrupt_fraction(float): fraction of corrupted Energy (Wh) entries in each cell
+    @write_sum(Boolean): True to also write the summary data
+    @seed(int): random seed
+
+    Returns:
+    @cell_id_df(pd.DataFrame): Joule_cell_id.csv of the synthetic cells
+    """
+    from tqdm import tqdm
+    rng = np.random.default_rng(seed)
+    raw_path = os.path.join(save_path, "raw_data", "")
+    sum_path = os.path.join(save_path, "sum_data", "")
+    os.makedirs(raw_path, exist_ok=True)
+
+    cell_row_list = []
+    for cell_num in tqdm(range(1, num_cells+1)):
+        cell_id = "S{:05d}".format(cell_num)
+        soc = int(rng.choice([0, 50, 100]))
+        temperature = int(rng.choice([5, 24, 45, 60]))
+        #Hotter, fuller cells fade faster
+        fade_rate = 1.0+0.04*temperature+0.01*soc+rng.normal(0, 0.2)
+        raw_data = make_synthetic_raw_data(num_diags=num_diags, cell_type=cell_type, points_per_step=points_per_step,
+                                           fade_rate=max(fade_rate, 0.1), resistance=rng.uniform(0.04, 0.06),
+                                           resistance_growth=2*fade_rate, storage_soc=max(soc, 10),
+                                           corrupt_fraction=corrupt_fraction, seed=rng.integers(2**32))
+        meta_data = {"synthetic": {"seed": seed, "fade_rate": fade_rate}}
+        raw_obj = cellLife_raw_obj(meta_data=meta_data, raw_data=raw_data, comment="Synthetic data")
+        raw_obj.to_json_file(raw_path+"{}_raw.json".format(cell_id), overwrite=True, sync_dir=False)
+        cell_row_list.append({"Cell_type": cell_type, "Cell_chemistry": "synthetic", "Form_factor": "18650",
+                              "Approximate Recording Frequency": "bi-annual", "Test_id": "T{:07d}".format(cell_num),
+                              "SOC": soc, "Temperature": temperature, "Cell_id": cell_id, "Lot": "L000",
+                              "Comment": "Synthetic data"})
+
+    sync_directory(raw_path)
+
+    cell_id_df = pd.DataFrame(cell_row_list)
+    cell_id_df.to_csv(os.path.join(save_path, "Joule_cell_id.csv"), index=False)
+
+    if write_sum:
+        os.makedirs(sum_path, exist_ok=True)
+        generate_sum_data(cell_type, raw_path, sum_path, os.path.join(save_path, ""), overwrite=True)
+    return cell_id_df
+
+def _ocv(soc):
+    """
+    Simple open circuit voltage curve of an 18650 cell vs SOC (0 to 1).
+    """
+    return 3.0+1.0*soc+0.2*np.tanh(10*soc)-0.1*np.exp(-20*(1-soc))
+
+def _make_charge_step(capacity, nominal_capacity, resistance, start_soc, end_soc, points_per_step, cv_hold, rng):
+    """
+    CC charge at C/5 from start_soc to end_soc with an optional CV hold at the end.
+    """
+    current = LOW_C_RATE*nominal_capacity
+    cc_capacity = capacity*(end_soc-start_soc)*(0.95 if cv_hold else 1.0)
+    dt = cc_capacity*3600/current/points_per_step
+    step_current = current+rng.normal(0, current*1e-4, points_per_step)
+    step_capacity = np.cumsum(step_current)*dt/3600
+    step_voltage = _ocv(start_soc+step_capacity/capacity)+LOW_C_RATE*resistance
+
+    if cv_hold:
+        num_cv_points = max(points_per_step//4, 2)
+        cv_current = current*np.exp(-np.linspace(0.5, 4, num_cv_points))
+        cv_capacity = step_capacity[-1]+np.cumsum(cv_current)*dt/3600
+        step_current = np.concatenate([step_current, cv_current])
+        step_capacity = np.concatenate([step_capacity, cv_capacity])
+        step_voltage = np.concatenate([step_voltage, np.full(num_cv_points, step_voltage[-1])])
+
+    step_energy = np.cumsum(step_voltage*step_current)*dt/3600
+    return pd.DataFrame({"Test Time (s)": dt*np.arange(1, len(step_current)+1), "MD": "C", "Current (A)": step_current,
+                         "Voltage (V)": step_voltage, "Capacity (Ah)": step_capacity, "Energy (Wh)": step_energy})
+
+def _make_discharge_step(capacity, nominal_capacity, resistance, c_rate, points_per_step, rng):
+    """
+    CC discharge from full to empty at c_rate. Higher rates reach the cutoff voltage sooner and
+    deliver a little less capacity.
+    """
+    current = c_rate*nominal_capacity
+    delivered_capacity = capacity*(1-0.02*c_rate*resistance/0.05)
+    dt = delivered_capacity*3600/current/points_per_step
+    step_current = current+rng.normal(0, current*1e-4, points_per_step)
+    step_capacity = np.cumsum(step_current)*dt/3600
+    step_voltage = _ocv(1-step_capacity/capacity)-c_rate*resistance+rng.normal(0, 1e-4, points_per_step)
+    step_energy = np.cumsum(step_voltage*step_current)*dt/3600
+    return pd.DataFrame({"Test Time (s)": dt*np.arange(1, points_per_step+1), "MD": "D", "Current (A)": -step_current,
+                         "Voltage (V)": step_voltage, "Capacity (Ah)": step_capacity, "Energy (Wh)": step_energy})
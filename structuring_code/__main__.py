@@ -0,0 +1,7 @@
+import os
+import sys
+#The structuring_code modules import each other by name, so add this folder to the path like the notebooks do
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from Joule_pipeline import main
+
+sys.exit(main())
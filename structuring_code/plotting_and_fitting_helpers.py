@@ -1,18 +1,37 @@
+import os
 import numpy as np
-from scipy.interpolate import interp1d
+from concurrent.futures import ProcessPoolExecutor
 from numpy.polynomial.polynomial import Polynomial
-from Joule_sum_data_builder import load_sum_obj
-from sklearn.metrics import mean_absolute_error
+from Joule_profiler import profile_stage
+from Joule_result_cache import get_result_cache, make_key
+#pandas, scipy and the summary data loader are imported inside the functions that use them, so
+#fitting worker processes and scripts that only smooth or fit arrays don't spend time importing them
 
 
+@profile_stage("local_reg_adjust_window", rows_fun=lambda args, output: np.size(args["metric_points"]))
 def local_reg_adjust_window(time_points, metric_points, deg=2, min_data_points_to_smooth=10, throw_min_error=False, nominal_window_size=14, force_start_value=True):
     """
     This function will smooth the data using local polynomial regression without additional
     weighting. 
 
+    The least squares problems of every time point are solved together as one stack of small
+    Vandermonde systems instead of calling Polynomial.fit once per time point. The fit of each
+    window is done in the same [-1, 1] mapped domain as Polynomial.fit so the result is the same
+    up to floating point round-off. Many equal length cells can be smoothed in a single call by
+    passing a 2-D metric_points array with a row per cell.
+
+    Results are kept in the process wide cache from Joule_result_cache, which is on by default and
+    shared by every call in the process, keyed by a hash of the points and the settings. Smoothing
+    the same cell again returns a copy of the saved result instead of smoothing it, so timing or
+    memory profiling repeated calls measures cache hits (see benchmark_stage). Use clear_result_cache to
+    invalidate it, temporary_result_cache to turn it off for a block or configure_result_cache
+    to turn it off.
+
     Args:
-    @time_points(np.array): time points to smooth
-    @metric_points(np.array): metric points to smooth (capacity or resistance either in % or Ah)
+    @time_points(np.array): time points to smooth. Either 1-D and shared by all cells, or 2-D with
+                                        the same shape as metric_points
+    @metric_points(np.array): metric points to smooth (capacity or resistance either in % or Ah).
+                                        1-D for a single cell or 2-D with a row per cell
     @deg(int): degree of the polynomial to fit
     @min_data_points_to_smooth(int): The minimum data points to smooth. If below this it will either throw an
                                         error if throw_min_error is true, or just no-smoothing if True. 
@@ -25,57 +44,383 @@ def local_reg_adjust_window(time_points, metric_points, deg=2, min_data_points_t
 
     #Round to allow odd nominal_window_size. Remember round, rounds to the even number.
     half_window = round(nominal_window_size/2)
-    smoothed_metric_points = np.zeros(len(time_points))
-    start_idx_list = []
-    end_idx_list = []
 
     #If data is too short either throw error or return it as is
-    if len(time_points) <= min_data_points_to_smooth:
+    if np.shape(time_points)[-1] <= min_data_points_to_smooth:
         if throw_min_error:
             raise Exception("Too few data points")
         else:
             smoothed_metric_points = metric_points
             return smoothed_metric_points
 
-    #If not too short do local polynomial regression
-    for time_idx in range(len(time_points)):
-
-        if time_idx < half_window:
-            start_time_idx = 0
-            end_time_idx = half_window+time_idx
-        elif time_idx >= half_window:
-            start_time_idx = time_idx-half_window
-            end_time_idx = half_window+time_idx
+    metric_array = np.asarray(metric_points, dtype=float)
+    time_array = np.asarray(time_points, dtype=float)
+    single_cell = (metric_array.ndim == 1)
 
-        start_idx_list.append(start_time_idx)
-        end_idx_list.append(end_time_idx)
-        
-        time_window = time_points[start_time_idx:end_time_idx]
-        metric_window = metric_points[start_time_idx:end_time_idx]
+    #Reuse the result if the same points have already been smoothed with the same settings
+    cache = get_result_cache()
+    if cache is not None:
+        cache_key = make_key("local_reg_adjust_window", time_array, metric_array, deg, half_window, force_start_value)
+        smoothed_metric_points = cache.get(cache_key)
+        if smoothed_metric_points is not None:
+            return smoothed_metric_points
 
-        poly = Polynomial.fit(time_window, metric_window, deg=deg)
-        smoothed_metric_points[time_idx] = poly(time_points[time_idx])
+    #If not too short do local polynomial regression
+    smoothed_metric_points = _local_poly_fit(np.atleast_2d(time_array), np.atleast_2d(metric_array), deg, half_window)
+    if single_cell:
+        smoothed_metric_points = smoothed_metric_points[0]
 
     #Replace the first value to force them to match
     if force_start_value:
-        smoothed_metric_points[0] = metric_points[0]
+        smoothed_metric_points[..., 0] = metric_array[..., 0]
 
+    if cache is not None:
+        cache.put(cache_key, smoothed_metric_points)
     return smoothed_metric_points
 
+def _local_poly_fit(time_array, metric_array, deg, half_window):
+    """
+    Local polynomial regression of every time point of every cell. Each time point is fit with
+    the points from half_window before it up to (not including) half_window after it, same as
+    the original per point loop with Polynomial.fit.
+
+    Args:
+    @time_array(np.array): (1, n) time points shared by all cells or (cells, n) time points
+    @metric_array(np.array): (cells, n) metric points
+    @deg(int): degree of the polynomial to fit
+    @half_window(int): half of the window size
+
+    Returns:
+    @smoothed_array(np.array): (cells, n) fitted value at each time point
+    """
+    num_points = time_array.shape[-1]
+    point_idx = np.arange(num_points)
+    start_idx = np.maximum(point_idx-half_window, 0)
+    end_idx = np.minimum(point_idx+half_window, num_points)
+    window_width = np.max(end_idx-start_idx)
+
+    #(n, window) index of every point in each window. Padding rows past the end of a window are
+    #zeroed so they don't change the least squares solution.
+    window_idx = start_idx[:,None]+np.arange(window_width)[None,:]
+    in_window = window_idx<end_idx[:,None]
+    window_idx = np.minimum(window_idx, num_points-1)
+
+    #Map each window to [-1, 1] the same way Polynomial.fit does
+    time_window = time_array[:, window_idx]
+    window_min = np.where(in_window, time_window, np.inf).min(axis=-1)
+    window_max = np.where(in_window, time_window, -np.inf).max(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = (-window_max-window_min)/(window_max-window_min)
+        scale = 2/(window_max-window_min)
+    mapped_window = offset[...,None]+scale[...,None]*time_window
+    mapped_time = offset+scale*time_array
+
+    vander = np.where(in_window[...,None], mapped_window[...,None]**np.arange(deg+1), 0.0)
+    #All windows have a unique domain so this can't have nan unless a window has a single time
+    well_posed = np.isfinite(vander).all(axis=(-1,-2))
+    vander = np.where(well_posed[...,None,None], vander, 0.0)
+    q_array, r_array = np.linalg.qr(vander)
+
+    #Rank deficient windows (fewer unique times than deg+1) are done with Polynomial.fit below
+    r_diag = np.abs(np.diagonal(r_array, axis1=-2, axis2=-1))
+    well_posed &= (r_diag.min(axis=-1) > np.finfo(float).eps*window_width*r_diag.max(axis=-1))
+    r_array = np.where(well_posed[...,None,None], r_array, np.eye(deg+1))
+
+    metric_window = np.where(in_window, metric_array[:, window_idx], 0.0)
+    if time_array.shape[0] == 1:
+        #Shared time points so one factorization is used for all cells: (n, window, cells)
+        qt_metric = np.swapaxes(q_array[0], -1, -2) @ np.moveaxis(metric_window, 0, -1)
+        coef_array = np.linalg.solve(r_array[0], qt_metric)
+        powers = mapped_time[0][:,None]**np.arange(deg+1)
+        smoothed_array = np.einsum("nd,ndc->cn", powers, coef_array)
+    else:
+        qt_metric = np.swapaxes(q_array, -1, -2) @ metric_window[...,None]
+        coef_array = np.linalg.solve(r_array, qt_metric)[...,0]
+        powers = mapped_time[...,None]**np.arange(deg+1)
+        smoothed_array = np.sum(powers*coef_array, axis=-1)
+
+    for time_row, point in zip(*np.nonzero(~well_posed)):
+        window = slice(start_idx[point], end_idx[point])
+        time_window = time_array[time_row, window]
+        cells = range(len(metric_array)) if time_array.shape[0] == 1 else [time_row]
+        for cell in cells:
+            poly = Polynomial.fit(time_window, metric_array[cell, window], deg=deg)
+            smoothed_array[cell, point] = poly(time_array[time_row, point])
+
+    return smoothed_array
+
 def get_smoothed_cap_eol_time(time_points, cap_points, eol_cond=90, min_data_points_to_smooth = 10, nominal_window_size=14):
     """
-    Pass in raw capacity and time points will return the eol in whatever unit time_points is in
+    Pass in raw capacity and time points will return the eol in whatever unit time_points is in.
+    Results come from the process wide cache of Joule_result_cache when the same points and
+    settings were done before in the process, the same as local_reg_adjust_window. Raises if the
+    cell has not reached eol_cond, get_smoothed_cap_eol_times returns nan instead for many cells
+    and eol_conds at once.
     
     """
+    cache = get_result_cache()
+    if cache is not None:
+        cache_key = make_key("get_smoothed_cap_eol_time", np.asarray(time_points, dtype=float), np.asarray(cap_points, dtype=float),
+                             eol_cond, min_data_points_to_smooth, nominal_window_size)
+        cached_result = cache.get(cache_key)
+        if cached_result is not None:
+            return cached_result
     
     rel_cap_points = (cap_points/cap_points[0])*100
     rel_smoothed_cap_points = local_reg_adjust_window(np.array(time_points), np.array(rel_cap_points), min_data_points_to_smooth=min_data_points_to_smooth, 
                                                             throw_min_error=False, nominal_window_size=nominal_window_size, force_start_value=True)
+    from scipy.interpolate import interp1d
     time_fun = interp1d(rel_smoothed_cap_points, time_points)
     eol_time = time_fun(eol_cond)
+    if cache is not None:
+        cache.put(cache_key, (rel_smoothed_cap_points, eol_time))
     return rel_smoothed_cap_points, eol_time
 
-def get_mean_trend(sum_obj_list, sum_path, metric, normalize_before_mean):
+def get_time_to_threshold(time_points, metric_points, thresholds, decreasing=True):
+    """
+    Returns the time each curve first reaches each threshold for many curves and thresholds at
+    once. The first crossing is the first point at or below the threshold (at or above if
+    decreasing is False), linearly interpolated with the point before it. A curve that starts past
+    the threshold crosses it at its first time. Later crossings of non-monotonic curves, for example
+    a capacity that recovers above the threshold and drops again, are ignored. Curves that never
+    reach a threshold give nan instead of raising like interp1d does.
+
+    Args:
+    @time_points(np.array): 1-D times shared by all curves, or the same shape as metric_points
+    @metric_points(np.array): 1-D for a single curve or 2-D with a row per curve. Curves of
+        different lengths can be padded at the end with nan
+    @thresholds(float or list[float]): thresholds to find the time to reach, ex: [97.5, 95, 90, 80]
+    @decreasing(Boolean): True for metrics that fall with time like capacity, False for ones that
+        rise like resistance
+
+    Returns:
+    @time_to_threshold(np.array): times of shape (curve, threshold), or (threshold,) for a single curve.
+        nan where a curve does not reach the threshold
+    """
+    metric_array = np.asarray(metric_points, dtype=float)
+    time_array = np.broadcast_to(np.asarray(time_points, dtype=float), metric_array.shape)
+    threshold_array = np.atleast_1d(np.asarray(thresholds, dtype=float))
+    if not decreasing:
+        metric_array, threshold_array = -metric_array, -threshold_array
+
+    #(..., threshold, time) mask of the points past each threshold
+    past = metric_array[..., None, :]<=threshold_array[:, None]
+    reached = past.any(axis=-1)
+    cross_idx = np.argmax(past, axis=-1)
+    prev_idx = np.maximum(cross_idx-1, 0)
+
+    metric_at_cross = np.take_along_axis(metric_array, cross_idx, axis=-1)
+    metric_at_prev = np.take_along_axis(metric_array, prev_idx, axis=-1)
+    time_at_cross = np.take_along_axis(time_array, cross_idx, axis=-1)
+    time_at_prev = np.take_along_axis(time_array, prev_idx, axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(metric_at_prev==metric_at_cross, 1.0, (metric_at_prev-threshold_array)/(metric_at_prev-metric_at_cross))
+    crossing_time = np.where(cross_idx==0, time_at_cross, time_at_prev+fraction*(time_at_cross-time_at_prev))
+    return np.where(reached, crossing_time, np.nan)
+
+def get_smoothed_cap_eol_times(time_points_list, cap_points_list, eol_conds=[90], min_data_points_to_smooth=10,
+                               nominal_window_size=14):
+    """
+    Batched version of get_smoothed_cap_eol_time for many cells and eol conditions. Each cell is
+    normalized to 100% and smoothed the same way (smoothing results are cached) and then all
+    smoothed curves are inverted together with get_time_to_threshold, so cells that have not
+    reached an eol condition give nan instead of raising.
+
+    Args:
+    @time_points_list(list[np.array]): time points of each cell
+    @cap_points_list(list[np.array]): raw capacity points of each cell
+    @eol_conds(list[float]): eol capacities in %, ex: [97.5, 95, 92.5, 90, 80]
+    @min_data_points_to_smooth(int): see local_reg_adjust_window
+    @nominal_window_size(int): see local_reg_adjust_window
+
+    Returns:
+    @eol_time_array(np.array): eol times of shape (cell, eol_cond) in whatever unit time_points is in
+    """
+    num_points = max([len(x) for x in time_points_list], default=0)
+    time_array = np.full((len(time_points_list), num_points), np.nan)
+    smoothed_cap_array = np.full((len(time_points_list), num_points), np.nan)
+    for idx, (time_points, cap_points) in enumerate(zip(time_points_list, cap_points_list)):
+        time_points = np.asarray(time_points, dtype=float)
+        cap_points = np.asarray(cap_points, dtype=float)
+        rel_cap_points = (cap_points/cap_points[0])*100
+        time_array[idx, :len(time_points)] = time_points
+        smoothed_cap_array[idx, :len(time_points)] = local_reg_adjust_window(time_points, rel_cap_points,
+                                                            min_data_points_to_smooth=min_data_points_to_smooth,
+                                                            throw_min_error=False, nominal_window_size=nominal_window_size,
+                                                            force_start_value=True)
+    return get_time_to_threshold(time_array, smoothed_cap_array, eol_conds)
+
+def get_sum_obj_list(file_index, cell_type=None, soc=None, temperature=None):
+    """
+    Returns the summary data file names of all cells in the file index with the testing
+    conditions of interest. The file names are the form get_mean_trend expects with sum_path 
+    being the folder of the summary data, or with the same file_index passed to get_mean_trend,
+    load_t_x_fit_data or get_interp_metric_matrix to load them from the paths in the index.
+
+    Args:
+    @file_index(pd.DataFrame): File index from Joule_file_index.build_file_index or load_file_index
+    @cell_type(str or list): Cell_type(s) to use, ex: "Panasonic NCR18650B". None uses all.
+    @soc(int or list): SOC(s) to use. None uses all.
+    @temperature(int or list): Temperature(s) to use. None uses all.
+
+    Returns:
+    @sum_obj_list(list[str]): List of {cell_id}_sum.json filenames that exist
+    """
+    from Joule_file_index import filter_file_index
+    filtered_index = filter_file_index(file_index, cell_type=cell_type, soc=soc, temperature=temperature, has_sum=True)
+    sum_obj_list = [os.path.basename(x) for x in filtered_index["sum_file_path"]]
+    return sum_obj_list
+
+def get_sum_obj_path(sum_name, sum_path, file_index=None):
+    """
+    Returns the path of a summary file given by its filename ({cell_id}_sum.json) or cell_id. With
+    a file index the path is looked up with Joule_file_index.get_sum_file_path, otherwise it is
+    sum_path+sum_name.
+
+    Args:
+    @sum_name(str): {cell_id}_sum.json filename or cell_id
+    @sum_path(str): Path to the location of where the files are present
+    @file_index(pd.DataFrame): File index from Joule_file_index.build_file_index or load_file_index
+
+    Returns:
+    @file_path(str): path to the summary file
+    """
+    if file_index is None:
+        return sum_path+sum_name
+    from Joule_file_index import get_sum_file_path
+    return get_sum_file_path(_get_sum_name_cell_id(sum_name), sum_path, file_index)
+
+def iter_sum_columns(sum_obj_list, sum_path, columns, file_index=None, store_path=None):
+    """
+    Yields the summary data columns of every cell in sum_obj_list in order. The cells are either
+    loaded one file at a time with load_sum_obj, or, if store_path is given, read from the summary
+    data store (Joule_sum_store.build_sum_store) with one query_sum_store call, which only reads
+    the columns needed instead of parsing every {cell_id}_sum.json. Cells that are not in the store
+    get empty arrays, like a summary file without rows.
+
+    Args:
+    @sum_obj_list (list([str])): List of {cell_id}_sum.json filenames or cell_ids
+    @sum_path(str): Path to the location of where the files are present
+    @columns(list[str]): summary data columns to get
+    @file_index(pd.DataFrame): File index from Joule_file_index used to find the summary files,
+        see get_sum_obj_path. Not used with store_path
+    @store_path(str): Folder of the summary data store. If None the summary files are loaded
+
+    Returns:
+    @sum_name(str): filename from sum_obj_list
+    @column_dict(dict): column -> np.array of the cell's summary data
+    """
+    if store_path is None:
+        from Joule_sum_data_builder import load_sum_obj
+        for sum_name in sum_obj_list:
+            df = load_sum_obj(file_path=get_sum_obj_path(sum_name, sum_path, file_index)).summary_data
+            yield sum_name, {col: np.array(df[col]) for col in columns}
+        return
+
+    from Joule_sum_store import query_sum_store
+    cell_id_list = [_get_sum_name_cell_id(x) for x in sum_obj_list]
+    cell_data_dict = query_sum_store(store_path, list(columns), cell_id=cell_id_list) if len(cell_id_list)>0 else {}
+    for sum_name, cell_id in zip(sum_obj_list, cell_id_list):
+        if cell_id in cell_data_dict:
+            yield sum_name, {col: cell_data_dict[cell_id][col] for col in columns}
+        else:
+            yield sum_name, {col: np.array([], dtype=float) for col in columns}
+
+def _get_sum_name_cell_id(sum_name):
+    """
+    cell_id of a {cell_id}_sum.json filename, or sum_name if it is already a cell_id.
+    """
+    return sum_name[:-len("_sum.json")] if sum_name.endswith("_sum.json") else sum_name
+
+def get_interp_metric_matrix(sum_obj_list, sum_path, metric, normalize_before_mean, time_grid=None, file_index=None,
+                             store_path=None):
+    """
+    Loads, smooths and interpolates every cell to the same time points, giving the cell x time
+    matrix get_mean_trend takes the mean of. Cells with less than 4 time points are skipped.
+
+    Args:
+    @sum_obj_list (list([str])): List of filenames
+    @sum_path(str): Path to the location of where the files are present
+    @metric(str): metric to use, ex: "RPT0.2C_2_D_capacity" or "Res_SS_2_D"
+    @normalize_before_mean(Boolean): If True each cell is normalized to start at 100
+    @time_grid(np.array): Time points in weeks to interpolate to. If None all unique time points
+        in the files provided are used.
+    @file_index(pd.DataFrame): File index from Joule_file_index used to find the summary files,
+        see get_sum_obj_path. If None the files are in sum_path
+    @store_path(str): Folder of the summary data store to read the cells from instead of the
+        summary files, see iter_sum_columns
+
+    Returns:
+    @interp_metric_matrix(np.array): (cell, time) smoothed metric, nan outside each cell's test
+    @all_times(np.array): time points in weeks of the columns
+    @name_list(list[str]): filenames of the rows
+    """
+    time_points_list = []
+    metric_points_list = []
+    for _, column_dict in iter_sum_columns(sum_obj_list, sum_path, [metric, "Calendar_DateTime(days)"], file_index,
+                                           store_path):
+        metric_points_list.append(column_dict[metric])
+        time_points_list.append(column_dict["Calendar_DateTime(days)"]/7)
+
+    interp_cell_id_array_metric, all_times, used_idx_list = get_interp_metric_points(time_points_list, metric_points_list,
+                                                                                     normalize_before_mean, time_grid)
+    return interp_cell_id_array_metric, all_times, [sum_obj_list[idx] for idx in used_idx_list]
+
+def get_interp_metric_points(time_points_list, metric_points_list, normalize_before_mean, time_grid=None):
+    """
+    Smooths and interpolates the metric points of every cell to the same time points. This is
+    get_interp_metric_matrix for cells that are already in memory. Cells with less than 4 time
+    points are skipped.
+
+    Args:
+    @time_points_list(list[np.array]): time points in weeks of each cell
+    @metric_points_list(list[np.array]): metric points of each cell
+    @normalize_before_mean(Boolean): If True each cell is normalized to start at 100
+    @time_grid(np.array): Time points in weeks to interpolate to. If None all unique time points
+        of the cells are used.
+
+    Returns:
+    @interp_metric_matrix(np.array): (cell, time) smoothed metric, nan outside each cell's test
+    @all_times(np.array): time points in weeks of the columns
+    @used_idx_list(list[int]): index in time_points_list of each row
+    """
+    from scipy.interpolate import interp1d
+    #first get all unique time values that are tested
+    all_times = []
+    used_idx_list = []
+    for idx, time_points in enumerate(time_points_list):
+        #If time points are less than 4 we will just skip
+        if(len(time_points))<4:
+            continue
+
+        #Add any new times to this array. This will help account for issues where we have taken out a data point etc
+        all_times.extend(set(time_points) - set(all_times))
+        used_idx_list.append(idx)
+
+    #now for each cell get the array of values at every time
+    if time_grid is None:
+        all_times = np.array(sorted(all_times))
+    else:
+        all_times = np.asarray(time_grid, dtype=float)
+    interp_cell_id_array_metric = np.zeros((len(used_idx_list), len(all_times)))
+
+    for row, idx in enumerate(used_idx_list):
+        metric_points = np.asarray(metric_points_list[idx])
+        if normalize_before_mean:
+            metric_points = (metric_points/metric_points[0])*100
+        time_points = np.asarray(time_points_list[idx])
+
+        smoothed_metric_points = local_reg_adjust_window(time_points, metric_points, deg=2)
+        #interpolate so that we can get all time points standardized
+        smooth_metric_fun = interp1d(time_points, smoothed_metric_points, bounds_error=False, fill_value=np.nan)
+        interp_cell_id_array_metric[row,:] = smooth_metric_fun(all_times)
+
+    return interp_cell_id_array_metric, all_times, used_idx_list
+
+@profile_stage("get_mean_trend", rows_fun=lambda args, output: len(args["sum_obj_list"]))
+def get_mean_trend(sum_obj_list, sum_path, metric, normalize_before_mean, streaming=False, time_grid=None,
+                   file_index=None, store_path=None):
 
     """Will return the mean array of the metric vs time curve given a list
     of sum_obj filenames. The option of normalizing before taking the mean can
@@ -88,6 +433,13 @@ def get_mean_trend(sum_obj_list, sum_path, metric, normalize_before_mean):
     If a test ends the mean will still be taken based on all the continuing cells.
     To see if this has happened num_cell_array returned tells you how many cells 
     are used to get the mean at each timepoint.
+
+    With streaming=True the cells are loaded one at a time and only a running count, mean and 
+    sum of squared differences (Welford's algorithm) are kept at each timepoint, so memory does 
+    not grow with the number of cells. Without a time_grid the files are read twice in this mode,
+    once to get the unique time points and once to take the mean, since each cell has to be 
+    interpolated at the time points of every other cell. The output is the same as the default 
+    mode up to floating point round-off.
     
     Args:
     @sum_obj_list (list([str])): List of filenames to take the mean of
@@ -96,6 +448,13 @@ def get_mean_trend(sum_obj_list, sum_path, metric, normalize_before_mean):
     @normalize_before_mean(Boolean): If True it sets normalizes all the indiviual cell trend lines to start
         at 100 (0% variability at beginning). If False instead the mean of all the trend lines is what is 
         set to start at 100.
+    @streaming(Boolean): If True use the constant memory streaming mean described above
+    @time_grid(np.array): Time points in weeks to get the mean at. If None all unique time points
+        in the files provided are used.
+    @file_index(pd.DataFrame): File index from Joule_file_index used to find the summary files,
+        see get_sum_obj_path. If None the files are in sum_path
+    @store_path(str): Folder of the summary data store to read the cells from instead of the
+        summary files, see iter_sum_columns. The store is read once in streaming mode too
 
     Returns:
     @mean_metric_array(np.array): Mean for all unique timepoints for the files provided.
@@ -104,49 +463,107 @@ def get_mean_trend(sum_obj_list, sum_path, metric, normalize_before_mean):
         of weeks.
     @num_cells_array: The number of cells used in taking mean at each timepoint.
     """
-    temp_cell_id_dict = {}
+    if streaming:
+        return _get_mean_trend_streaming(sum_obj_list, sum_path, metric, normalize_before_mean, time_grid, file_index,
+                                         store_path)
 
+    interp_cell_id_array_metric, all_times, _ = get_interp_metric_matrix(sum_obj_list, sum_path, metric, 
+                                                                         normalize_before_mean, time_grid, file_index,
+                                                                         store_path)
+    return _get_mean_trend_from_matrix(interp_cell_id_array_metric, all_times)
 
-    #first get all unique time values that are tested
-    all_times = []
-    for idx, sum_name in enumerate(sum_obj_list):
-        #Load in the sum_obj and data
-        sum_obj=load_sum_obj(file_path=sum_path+sum_name)
-        df = sum_obj.summary_data
+def get_mean_trend_from_points(time_points_list, metric_points_list, normalize_before_mean, time_grid=None):
+    """
+    get_mean_trend for cells that are already in memory, ex: the arrays of cellLife_compact_sum_obj.
+    Gives the same output as get_mean_trend of the files the points came from.
 
-        metric_points = np.array(df[metric])
-        time_points =  np.array(df["Calendar_DateTime(days)"])/7
+    Args:
+    @time_points_list(list[np.array]): time points in weeks of each cell
+    @metric_points_list(list[np.array]): metric points of each cell
+    @normalize_before_mean(Boolean): see get_mean_trend
+    @time_grid(np.array): see get_mean_trend
 
-        #If time points are less than 4 we will just skip
-        if(len(time_points))<4:
-            continue
+    Returns:
+    @mean_metric_array(np.array): see get_mean_trend
+    @std_metric_array(np.array): see get_mean_trend
+    @all_times(np.array): see get_mean_trend
+    @num_cells_array: see get_mean_trend
+    """
+    interp_cell_id_array_metric, all_times, _ = get_interp_metric_points(time_points_list, metric_points_list,
+                                                                         normalize_before_mean, time_grid)
+    return _get_mean_trend_from_matrix(interp_cell_id_array_metric, all_times)
 
-        #Add any new times to this array. This will help account for issues where we have taken out a data point etc
-        all_times.extend(set(time_points) - set(all_times))
-        temp_cell_id_dict[sum_name] = {"metric_points":metric_points,"time_points":time_points}
+def _get_mean_trend_from_matrix(interp_cell_id_array_metric, all_times):
+    """
+    Mean, std and number of cells at each time of a (cell, time) matrix from get_interp_metric_points.
+    """
+    #now add the mean line to this as well as the std and the number of cells used at each calc
+    mean_metric_array = np.nanmean(interp_cell_id_array_metric, axis=0)
+    std_metric_array = np.nanstd(interp_cell_id_array_metric, axis=0)
+    nan_mask_array = np.isnan(interp_cell_id_array_metric)
+    num_cells_array = np.sum(~nan_mask_array, axis=0)
 
+    return mean_metric_array, std_metric_array, all_times, num_cells_array
 
-    #now for each cell get the array of values at every time
-    all_times = np.array(sorted(all_times))
-    interp_cell_id_array_metric = np.zeros((len(temp_cell_id_dict.keys()), len(all_times)))
+def _get_mean_trend_streaming(sum_obj_list, sum_path, metric, normalize_before_mean, time_grid=None, file_index=None,
+                              store_path=None):
+    """
+    Streaming version of get_mean_trend. Takes the same arguments and returns the same arrays.
+    """
+    from scipy.interpolate import interp1d
+    columns = [metric, "Calendar_DateTime(days)"]
+    if store_path is not None:
+        #The store is read with one query, so keep its columns instead of querying it for each pass
+        cell_column_list = list(iter_sum_columns(sum_obj_list, sum_path, columns, store_path=store_path))
+        get_cell_columns = lambda: cell_column_list
+    else:
+        get_cell_columns = lambda: iter_sum_columns(sum_obj_list, sum_path, columns, file_index)
+
+    #first pass only keeps the unique time values that are tested
+    if time_grid is None:
+        all_times = set()
+        for _, column_dict in get_cell_columns():
+            time_points = column_dict["Calendar_DateTime(days)"]/7
+            #If time points are less than 4 we will just skip
+            if(len(time_points))<4:
+                continue
+            all_times.update(time_points)
+        all_times = np.array(sorted(all_times))
+    else:
+        all_times = np.asarray(time_grid, dtype=float)
 
-    for idx, sum_name in enumerate(temp_cell_id_dict.keys()):
-        metric_points = temp_cell_id_dict[sum_name]["metric_points"]
+    #running count, mean and sum of squared differences from the mean at every time
+    num_cells_array = np.zeros(len(all_times), dtype=int)
+    mean_metric_array = np.zeros(len(all_times))
+    sum_sq_diff_array = np.zeros(len(all_times))
+
+    for _, column_dict in get_cell_columns():
+        metric_points = column_dict[metric]
+        time_points = column_dict["Calendar_DateTime(days)"]/7
+
+        #If time points are less than 4 we will just skip
+        if(len(time_points))<4:
+            continue
         if normalize_before_mean:
             metric_points = (metric_points/metric_points[0])*100
-        time_points = temp_cell_id_dict[sum_name]["time_points"]
 
         smoothed_metric_points = local_reg_adjust_window(time_points, metric_points, deg=2)
         #interpolate so that we can get all time points standardized
         smooth_metric_fun = interp1d(time_points, smoothed_metric_points, bounds_error=False, fill_value=np.nan)
-        interp_cell_id_array_metric[idx,:] = smooth_metric_fun(all_times)
+        interp_metric_points = smooth_metric_fun(all_times)
 
+        #Welford update at the times this cell was tested
+        valid = ~np.isnan(interp_metric_points)
+        num_cells_array[valid] += 1
+        delta = interp_metric_points[valid]-mean_metric_array[valid]
+        mean_metric_array[valid] += delta/num_cells_array[valid]
+        sum_sq_diff_array[valid] += delta*(interp_metric_points[valid]-mean_metric_array[valid])
 
-    #now add the mean line to this as well as the std and the number of cells used at each calc
-    mean_metric_array = np.nanmean(interp_cell_id_array_metric, axis=0)
-    std_metric_array = np.nanstd(interp_cell_id_array_metric, axis=0)
-    nan_mask_array = np.isnan(interp_cell_id_array_metric)
-    num_cells_array = np.sum(~nan_mask_array, axis=0)
+    #Same as nanmean and nanstd, times with no cells are nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std_metric_array = np.sqrt(sum_sq_diff_array/num_cells_array)
+    mean_metric_array[num_cells_array==0] = np.nan
+    std_metric_array[num_cells_array==0] = np.nan
 
     return mean_metric_array, std_metric_array, all_times, num_cells_array
 
@@ -171,7 +588,7 @@ def cap_objective_t_x(params, time_points_to_fit, cap_points_to_fit):
     """
     a, b = params
     cap_growth_pred = cap_t_x_function(time_points_to_fit, a, b)
-    mae = mean_absolute_error(cap_growth_pred, cap_points_to_fit)
+    mae = np.mean(np.abs(cap_growth_pred-cap_points_to_fit))
     return mae
 
 def res_t_x_function(time_points, a, b):
@@ -194,5 +611,496 @@ def res_objective_t_x(params, time_points_to_fit, res_points_to_fit):
     """
     a, b = params
     res_growth_pred = res_t_x_function(time_points_to_fit, a, b)
-    mae = mean_absolute_error(res_growth_pred, res_points_to_fit)
-    return mae
\ No newline at end of file
+    mae = np.mean(np.abs(res_growth_pred-res_points_to_fit))
+    return mae
+
+#Bounds used for a and b in the t^x fits. Defined for very large range here but + only.
+T_X_BOUNDS = [(0, 1000), (0, 10)]
+#Sign of the a*t^b term for each metric, Q(t) = 100-a*t^b and R(t) = 100+a*t^b
+T_X_SIGN = {"cap": -1, "res": 1}
+
+
+def cap_objective_t_x_vectorized(params, time_points_to_fit, cap_points_to_fit):
+    """
+    NumPy version of cap_objective_t_x that also takes a whole population of parameters at once.
+
+    params(np.array): (2,) array of a, b or (2, S) array of S parameter sets
+    
+    Returns the mae error, a float for a single parameter set or an (S,) array
+    """
+    return _t_x_objective_vectorized(params, time_points_to_fit, cap_points_to_fit, T_X_SIGN["cap"])
+
+def res_objective_t_x_vectorized(params, time_points_to_fit, res_points_to_fit):
+    """
+    NumPy version of res_objective_t_x that also takes a whole population of parameters at once.
+
+    params(np.array): (2,) array of a, b or (2, S) array of S parameter sets
+    
+    Returns the mae error, a float for a single parameter set or an (S,) array
+    """
+    return _t_x_objective_vectorized(params, time_points_to_fit, res_points_to_fit, T_X_SIGN["res"])
+
+def _t_x_objective_vectorized(params, time_points_to_fit, metric_points_to_fit, sign):
+    """
+    mae of 100+sign*a*t^b for every parameter set in params
+    """
+    params = np.asarray(params, dtype=float)
+    a = np.atleast_1d(params[0])[:,None]
+    b = np.atleast_1d(params[1])[:,None]
+    time_points_to_fit = np.asarray(time_points_to_fit, dtype=float)[None,:]
+    metric_pred = 100+sign*a*(time_points_to_fit**b)
+    mae = np.mean(np.abs(metric_pred-np.asarray(metric_points_to_fit, dtype=float)[None,:]), axis=1)
+    if params.ndim == 1:
+        return float(mae[0])
+    return mae
+
+def get_t_x_warm_start(time_points_to_fit, metric_points_to_fit, metric_type="cap", bounds=T_X_BOUNDS):
+    """
+    Cheap starting guess of a and b from a linear fit of log(|metric-100|) vs log(t), since
+    100+sign*a*t^b is a line in log-log space. Only points with t>0 that have moved in the
+    direction of the model are used.
+
+    Args:
+    @time_points_to_fit(np.array): time points
+    @metric_points_to_fit(np.array): metric in % of the starting value
+    @metric_type(str): "cap" for Q(t) = 100-a*t^b or "res" for R(t) = 100+a*t^b
+    @bounds(list[tuple]): bounds of a and b. The guess is clipped to these
+
+    Returns:
+    @x0(np.array): (a, b) starting guess, None if there are not 2 usable points
+    """
+    time_points_to_fit = np.asarray(time_points_to_fit, dtype=float)
+    growth = T_X_SIGN[metric_type]*(np.asarray(metric_points_to_fit, dtype=float)-100)
+    usable = (time_points_to_fit>0) & (growth>0)
+    if len(np.unique(time_points_to_fit[usable]))<2:
+        return None
+    b, log_a = np.polyfit(np.log(time_points_to_fit[usable]), np.log(growth[usable]), 1)
+    x0 = np.clip([np.exp(log_a), b], [x[0] for x in bounds], [x[1] for x in bounds])
+    return x0
+
+@profile_stage("fit_t_x", rows_fun=lambda args, output: len(args["time_points_to_fit"]))
+def fit_t_x(time_points_to_fit, metric_points_to_fit, metric_type="cap", bounds=T_X_BOUNDS, maxiter=10000, 
+            warm_start=True, seed=None):
+    """
+    Fits 100-a*t^b (capacity) or 100+a*t^b (resistance) by minimizing the mae with differential
+    evolution, the same as the notebooks do with cap_objective_t_x and res_objective_t_x. The whole
+    population is evaluated at once with the NumPy objective and the population is seeded with
+    the log-log warm start.
+
+    Args:
+    @time_points_to_fit(np.array): time points
+    @metric_points_to_fit(np.array): metric in % of the starting value
+    @metric_type(str): "cap" for Q(t) = 100-a*t^b or "res" for R(t) = 100+a*t^b
+    @bounds(list[tuple]): bounds of a and b
+    @maxiter(int): maximum generations of differential evolution
+    @warm_start(Boolean): If True start from get_t_x_warm_start
+    @seed(int): random seed passed to differential_evolution
+
+    Returns:
+    @a(float): preexponent parameter
+    @b(float): exponent parameter
+    @mae(float): mae of the fit
+    """
+    from scipy.optimize import differential_evolution
+    time_points_to_fit = np.asarray(time_points_to_fit, dtype=float)
+    metric_points_to_fit = np.asarray(metric_points_to_fit, dtype=float)
+    sign = T_X_SIGN[metric_type]
+    x0 = None
+    if warm_start:
+        x0 = get_t_x_warm_start(time_points_to_fit, metric_points_to_fit, metric_type, bounds)
+
+    result = differential_evolution(_t_x_objective_vectorized, bounds, args=(time_points_to_fit, metric_points_to_fit, sign),
+                                    maxiter=maxiter, x0=x0, seed=seed, vectorized=True, updating="deferred")
+    a, b = result.x
+    mae = _t_x_objective_vectorized(result.x, time_points_to_fit, metric_points_to_fit, sign)
+    return a, b, mae
+
+def get_t_x_fit_points(time_points, cap_points, res_points=None, eol_cond=90):
+    """
+    Gets the points used for the t^x fits the same way as figure3-6_txFittingResults. The metric
+    is normalized to % of its first value and if the smoothed capacity reached eol_cond everything
+    after it is dropped (no interpolation of the eol point).
+
+    Args:
+    @time_points(np.array): time points in weeks
+    @cap_points(np.array): raw capacity points
+    @res_points(np.array): raw resistance points. If given the resistance points to fit are
+        returned instead of the capacity points
+    @eol_cond(float): eol capacity in %
+
+    Returns:
+    @time_points_to_fit(np.array): time points to fit, None if there is too little data to fit
+    @metric_points_to_fit(np.array): metric in % to fit, None if there is too little data to fit
+    """
+    time_points = np.asarray(time_points, dtype=float)
+    cap_points = np.asarray(cap_points, dtype=float)
+    #if total data is too small to be relevant
+    if len(time_points)<4:
+        return None, None
+
+    rel_metric_points = (cap_points/cap_points[0])*100
+    rel_smoothed_metric_points = local_reg_adjust_window(time_points, rel_metric_points, deg=2)
+    if res_points is None:
+        metric_points = cap_points
+    else:
+        metric_points = np.asarray(res_points, dtype=float)
+
+    #If EOL was reached, drop everything after eol
+    if rel_smoothed_metric_points[-1]<eol_cond:
+        metric_points_to_fit = metric_points[rel_smoothed_metric_points>eol_cond]
+        time_points_to_fit = time_points[rel_smoothed_metric_points>eol_cond]
+    #otherwise just use the data as is
+    else:
+        metric_points_to_fit = metric_points
+        time_points_to_fit = time_points
+
+    #If the time points to fit are 2 or less there is no point in fitting a t^x type equation
+    if len(time_points_to_fit)<=2:
+        return None, None
+
+    #capacity is normalized after truncating, resistance before like the notebook
+    if res_points is None:
+        metric_points_to_fit = (metric_points_to_fit/metric_points_to_fit[0])*100
+    else:
+        metric_points_to_fit = (metric_points_to_fit/metric_points[0])*100
+    return time_points_to_fit, metric_points_to_fit
+
+def load_t_x_fit_data(sum_obj_list, sum_path, metric_type="cap", cap_metric="RPT0.2C_2_D_capacity", 
+                      res_metric="Res_SS_2_D", eol_cond=90, file_index=None, store_path=None):
+    """
+    Loads the summary objects and gets the points to fit for fit_t_x_batch with get_t_x_fit_points.
+    Cells with too little data are left out.
+
+    Args:
+    @sum_obj_list (list([str])): List of summary filenames
+    @sum_path(str): Path to the location of where the files are present
+    @metric_type(str): "cap" or "res"
+    @cap_metric(str): capacity metric used to find eol (and fit if metric_type is "cap")
+    @res_metric(str): resistance metric fit if metric_type is "res"
+    @eol_cond(float): eol capacity in %
+    @file_index(pd.DataFrame): File index from Joule_file_index used to find the summary files,
+        see get_sum_obj_path. If None the files are in sum_path
+    @store_path(str): Folder of the summary data store to read the cells from instead of the
+        summary files, see iter_sum_columns
+
+    Returns:
+    @name_list(list[str]): filenames of the cells that can be fit
+    @time_points_list(list[np.array]): time points to fit in weeks for each cell
+    @metric_points_list(list[np.array]): metric points to fit in % for each cell
+    """
+    name_list = []
+    time_points_list = []
+    metric_points_list = []
+    columns = ["Calendar_DateTime(days)", cap_metric]+([res_metric] if metric_type=="res" else [])
+    for sum_name, column_dict in iter_sum_columns(sum_obj_list, sum_path, columns, file_index, store_path):
+        time_points = column_dict["Calendar_DateTime(days)"]/7
+        res_points = column_dict[res_metric] if metric_type=="res" else None
+        time_points_to_fit, metric_points_to_fit = get_t_x_fit_points(time_points, column_dict[cap_metric],
+                                                                      res_points=res_points, eol_cond=eol_cond)
+        if time_points_to_fit is None:
+            continue
+        name_list.append(sum_name)
+        time_points_list.append(time_points_to_fit)
+        metric_points_list.append(metric_points_to_fit)
+    return name_list, time_points_list, metric_points_list
+
+@profile_stage("fit_t_x_batch", rows_fun=lambda args, fit_df: len(fit_df))
+def fit_t_x_batch(name_list, time_points_list, metric_points_list, metric_type="cap", joule_cell_id_df=None,
+                  num_workers=1, chunksize=8, bounds=T_X_BOUNDS, maxiter=10000, warm_start=True, seed=None):
+    """
+    Fits the t^x model of many cells with fit_t_x and returns the results in the same layout as
+    saved_fitting_results/tx_cap_fitting_*.csv and tx_res_fitting_*.csv. With num_workers>1 the
+    cells are fit in parallel by a process pool.
+
+    The mae column is the mae of the model that was fit. The saved resistance csv has the mae of 
+    the capacity model (cap_objective_t_x) on the resistance points, so its mae values differ.
+
+    Args:
+    @name_list(list[str]): filename of each cell, ex: "C00001_sum.json"
+    @time_points_list(list[np.array]): time points to fit for each cell
+    @metric_points_list(list[np.array]): metric points in % to fit for each cell
+    @metric_type(str): "cap" for Q(t) = 100-a*t^b or "res" for R(t) = 100+a*t^b
+    @joule_cell_id_df(pd.DataFrame): Joule_cell_id.csv dataframe. If given the Temperature, SOC,
+        Cell_type and Chemistry columns are added
+    @num_workers(int): Number of worker processes. 1 fits the cells in this process
+    @chunksize(int): Number of cells sent to a worker process at a time
+    @bounds(list[tuple]): bounds of a and b
+    @maxiter(int): maximum generations of differential evolution
+    @warm_start(Boolean): If True start each fit from get_t_x_warm_start
+    @seed(int): random seed passed to differential_evolution
+
+    Returns:
+    @tx_fitting_df(pd.DataFrame): Dataframe with filename, a, b and mae (and cell information) columns
+    """
+    import pandas as pd
+    fit_args = [(time_points, metric_points, metric_type, bounds, maxiter, warm_start, seed) 
+                for time_points, metric_points in zip(time_points_list, metric_points_list)]
+    if num_workers<=1:
+        fit_results = [_fit_t_x_star(x) for x in fit_args]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            fit_results = list(executor.map(_fit_t_x_star, fit_args, chunksize=chunksize))
+
+    tx_fitting_df = pd.DataFrame({"filename": list(name_list), "a": [x[0] for x in fit_results], 
+                                  "b": [x[1] for x in fit_results], "mae": [x[2] for x in fit_results]})
+    if joule_cell_id_df is not None:
+        tx_fitting_df = add_cell_info_to_fit_df(tx_fitting_df, joule_cell_id_df)
+    return tx_fitting_df
+
+def _fit_t_x_star(fit_args):
+    """
+    Unpacks the arguments of fit_t_x so it can be used with executor.map
+    """
+    return fit_t_x(*fit_args)
+
+def add_cell_info_to_fit_df(fit_df, joule_cell_id_df):
+    """
+    Adds the Temperature, SOC, Cell_type and Chemistry of each cell to a fitting dataframe with a
+    filename column of the form {cell_id}_sum.json.
+
+    Args:
+    @fit_df(pd.DataFrame): fitting dataframe with a filename column
+    @joule_cell_id_df(pd.DataFrame): Joule_cell_id.csv dataframe
+
+    Returns:
+    @fit_df(pd.DataFrame): copy of fit_df with the cell information columns added
+    """
+    fit_df = fit_df.copy()
+    cell_info_df = joule_cell_id_df.assign(Cell_id=joule_cell_id_df["Cell_id"].astype(str))
+    cell_info_df = cell_info_df.drop_duplicates("Cell_id").set_index("Cell_id")
+    cell_id_series = fit_df["filename"].str.split("_").str[0]
+    for col, info_col in [("Temperature", "Temperature"), ("SOC", "SOC"), ("Cell_type", "Cell_type"), 
+                          ("Chemistry", "Cell_chemistry")]:
+        fit_df[col] = cell_id_series.map(cell_info_df[info_col]).to_numpy()
+    return fit_df
+
+#Fields of the eol error sweep structured array. One row per cell and data cutoff.
+EOL_SWEEP_DTYPE = np.dtype([("cell_id", "U16"), ("cutoff_year", "f8"), ("eol_error", "f8"), ("eol_time", "f8"), 
+                            ("a", "f8"), ("b", "f8")])
+WEEKS_TO_YEARS = 52.1429
+
+
+def get_tx_extrapolated_eol_time(a, b, eol_cap):
+    """
+    Because we know the formula of the semi-empirical model. We can just invert it
+    Q[%] = 100-a*(time_points**b)
+    eol_time = ((100-eol_cap(%))/a)^(1/b)
+    """
+    return ((100-eol_cap)/a)**(1/b)
+
+@profile_stage("get_eol_error_sweep", rows_fun=lambda args, sweep: len(args["time_points"]))
+def get_eol_error_sweep(time_points, cap_points, eol_cond=90, min_data_points=4, bounds=T_X_BOUNDS, maxiter=10000, seed=None):
+    """
+    This will get the eol error of the extrapolated t^x capacity fit using all points up to each
+    time point before the EOL time determined from the smoothed data. This is the sweep done in 
+    figure8_tx_eol_prediction, but only the first cutoff is fit with differential evolution. Every
+    later cutoff only adds one point so it is refit with a local Nelder-Mead search started from
+    the previous cutoff's (a, b) and from the log-log warm start, keeping the better of the two.
+
+    Args:
+    @time_points(np.array): time points in weeks
+    @cap_points(np.array): Raw capacity data
+    @eol_cond(float): eol capacity in %
+    @min_data_points(int): Controls the minimum number of data points needed to perform
+                            extrapolation
+    @bounds(list[tuple]): bounds of a and b
+    @maxiter(int): maximum generations of the first differential evolution fit
+    @seed(int): random seed passed to differential_evolution
+
+    Returns:
+    @cutoff_year_array(np.array): The length of data used for each fit in years
+    @eol_error_array(np.array): Error in years of the predicted eol using the data up to
+        cutoff_year_array. nan if there were too few data points
+    @eol_time(float): The eol time of this cell in years gotten from the smoothed data. nan and
+        empty arrays if the cell has not reached eol
+    @a_array(np.array): a_Q values of each fit
+    @b_array(np.array): b_Q values of each fit
+    """
+    from scipy.optimize import minimize
+    time_points = np.asarray(time_points, dtype=float)
+    cap_points = np.asarray(cap_points, dtype=float)
+
+    #first get eol time from smoothed values, nan if the cell has not reached eol so nothing is fit
+    eol_time = get_smoothed_cap_eol_times([time_points], [cap_points], [eol_cond])[0, 0]
+
+    #Use non-smoothed capacity points to fit
+    normalized_cap_points = (cap_points/cap_points[0])*100
+
+    #only use time points before eol
+    time_points_before_eol = time_points[time_points<eol_time]
+    eol_error_array = np.ones(len(time_points_before_eol))*np.nan
+    a_array = np.ones(len(time_points_before_eol))*np.nan
+    b_array = np.ones(len(time_points_before_eol))*np.nan
+
+    sign = T_X_SIGN["cap"]
+    prev_params = None
+    for time_idx in range(min_data_points-1, len(time_points_before_eol)):
+        time_points_truncated = time_points_before_eol[:time_idx+1]
+        cap_points_truncated = normalized_cap_points[:time_idx+1]
+
+        if prev_params is None:
+            a, b, _ = fit_t_x(time_points_truncated, cap_points_truncated, "cap", bounds=bounds, maxiter=maxiter, seed=seed)
+        else:
+            start_list = [prev_params]
+            warm_start = get_t_x_warm_start(time_points_truncated, cap_points_truncated, "cap", bounds)
+            if warm_start is not None:
+                start_list.append(warm_start)
+            result_list = [minimize(_t_x_objective_vectorized, x0, args=(time_points_truncated, cap_points_truncated, sign),
+                                    method="Nelder-Mead", bounds=bounds) for x0 in start_list]
+            a, b = min(result_list, key=lambda x: x.fun).x
+        prev_params = np.array([a, b])
+
+        pred_eol_time = get_tx_extrapolated_eol_time(a, b, eol_cond)
+        eol_error_array[time_idx] = pred_eol_time-eol_time
+        a_array[time_idx] = a
+        b_array[time_idx] = b
+
+    return time_points_before_eol/WEEKS_TO_YEARS, eol_error_array/WEEKS_TO_YEARS, float(eol_time)/WEEKS_TO_YEARS, a_array, b_array
+
+def get_eol_error_sweep_batch(cell_id_list, sum_path, cap_metric="RPT0.2C_2_D_capacity", eol_cond=90, min_data_points=4,
+                              num_workers=1, seed=None, file_index=None):
+    """
+    Runs get_eol_error_sweep for many cells, in parallel with a process pool if num_workers>1.
+    The results are returned as one structured array (see EOL_SWEEP_DTYPE) that can be saved
+    with save_eol_error_sweep.
+
+    Args:
+    @cell_id_list(list[str]): cell ids to run, their summary data is {cell_id}_sum.json in sum_path
+        or the file in file_index
+    @sum_path(str): Path to the location of where the summary files are present
+    @cap_metric(str): capacity metric to fit
+    @eol_cond(float): eol capacity in %
+    @min_data_points(int): minimum number of data points needed to perform extrapolation
+    @num_workers(int): Number of worker processes. 1 runs the cells in this process
+    @seed(int): random seed passed to differential_evolution
+    @file_index(pd.DataFrame): File index from Joule_file_index used to find the summary files
+        instead of sum_path
+
+    Returns:
+    @sweep_array(np.array): structured array with a row per cell and cutoff
+    @failed_cells(list[tuple(str, str)]): (cell_id, error) of cells that failed to load or fit.
+        Cells that have not reached eol are not failures, they just have no rows
+    """
+    from Joule_file_index import get_sum_file_path
+    #Paths are looked up here so the file index is not sent to every worker
+    sweep_args = []
+    for cell_id in cell_id_list:
+        try:
+            file_path = get_sum_file_path(str(cell_id), sum_path, file_index)
+        except Exception as e:
+            file_path = e
+        sweep_args.append((str(cell_id), file_path, cap_metric, eol_cond, min_data_points, seed))
+    if num_workers<=1:
+        sweep_results = [_get_eol_error_sweep_cell_id(*x) for x in sweep_args]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            sweep_results = list(executor.map(_get_eol_error_sweep_cell_id, *zip(*sweep_args)))
+
+    failed_cells = [(str(cell_id), x) for cell_id, x in zip(cell_id_list, sweep_results) if isinstance(x, str)]
+    sweep_array_list = [x for x in sweep_results if not isinstance(x, str)]
+    if len(sweep_array_list)==0:
+        return np.zeros(0, dtype=EOL_SWEEP_DTYPE), failed_cells
+    return np.concatenate(sweep_array_list), failed_cells
+
+def _get_eol_error_sweep_cell_id(cell_id, file_path, cap_metric, eol_cond, min_data_points, seed):
+    """
+    Worker function of get_eol_error_sweep_batch. Returns the structured array of the cell or the
+    error as a string. file_path is the exception if the summary file could not be found.
+    """
+    from Joule_sum_data_builder import load_sum_obj
+    try:
+        if isinstance(file_path, Exception):
+            raise file_path
+        df = load_sum_obj(file_path=file_path).summary_data
+        time_points = np.array(df["Calendar_DateTime(days)"])/7
+        cap_points = np.array(df[cap_metric])
+        cutoff_year_array, eol_error_array, eol_time, a_array, b_array = get_eol_error_sweep(time_points, cap_points,
+                                                                            eol_cond=eol_cond, min_data_points=min_data_points, seed=seed)
+    except Exception as e:
+        return "{}: {}".format(type(e).__name__, e)
+
+    sweep_array = np.zeros(len(cutoff_year_array), dtype=EOL_SWEEP_DTYPE)
+    sweep_array["cell_id"] = cell_id
+    sweep_array["cutoff_year"] = cutoff_year_array
+    sweep_array["eol_error"] = eol_error_array
+    sweep_array["eol_time"] = eol_time
+    sweep_array["a"] = a_array
+    sweep_array["b"] = b_array
+    return sweep_array
+
+def save_eol_error_sweep(sweep_array, file_path):
+    """
+    Saves the eol error sweep structured array. Files ending in .parquet are saved as a parquet
+    table, otherwise as a .npy file. An existing file is replaced in one rename (see
+    Joule_file_io.atomic_write).
+    """
+    from Joule_file_io import atomic_write
+    if file_path.endswith(".parquet"):
+        import pandas as pd
+        with atomic_write(file_path, mode="wb", overwrite=True) as outfile:
+            pd.DataFrame(sweep_array).to_parquet(outfile, index=False)
+    else:
+        #np.save adds .npy to paths without it
+        if not file_path.endswith(".npy"):
+            file_path = file_path+".npy"
+        with atomic_write(file_path, mode="wb", overwrite=True) as outfile:
+            np.save(outfile, sweep_array)
+
+def load_eol_error_sweep(file_path):
+    """
+    Loads an eol error sweep saved with save_eol_error_sweep back to a structured array.
+    """
+    if file_path.endswith(".parquet"):
+        import pandas as pd
+        df = pd.read_parquet(file_path)
+        sweep_array = np.zeros(len(df), dtype=EOL_SWEEP_DTYPE)
+        for field in EOL_SWEEP_DTYPE.names:
+            sweep_array[field] = df[field].to_numpy()
+        return sweep_array
+    return np.load(file_path)
+
+def eol_error_sweep_to_dict(sweep_array):
+    """
+    Converts the eol error sweep structured array to the dictionary layout of the saved
+    eol_error_dictionary_all_tpoints_*.pkl so the figure 8 plotting code can use it.
+
+    Returns:
+    @eol_error_save_dict(dict): cell_id -> {"a_array", "b_array", "cutoff_year_array", 
+        "eol_error_array", "eol_time"}
+    """
+    eol_error_save_dict = {}
+    cell_id_array = sweep_array["cell_id"]
+    #cells are stored in contiguous blocks so split at each new cell_id
+    change_idx = np.flatnonzero(cell_id_array[1:]!=cell_id_array[:-1])+1
+    block_bounds = np.concatenate([[0], change_idx, [len(sweep_array)]])
+    for start, end in zip(block_bounds[:-1], block_bounds[1:]):
+        if start==end:
+            continue
+        cell_rows = sweep_array[start:end]
+        eol_error_save_dict[str(cell_rows["cell_id"][0])] = {"a_array": cell_rows["a"], "b_array": cell_rows["b"],
+                                             "cutoff_year_array": cell_rows["cutoff_year"], 
+                                             "eol_error_array": cell_rows["eol_error"], 
+                                             "eol_time": float(cell_rows["eol_time"][0])}
+    return eol_error_save_dict
+
+def eol_error_dict_to_sweep(eol_error_save_dict):
+    """
+    Converts a dictionary in the layout of the saved eol_error_dictionary_all_tpoints_*.pkl back to
+    the eol error sweep structured array, the reverse of eol_error_sweep_to_dict.
+
+    Returns:
+    @sweep_array(np.array): structured array with a row per cell and cutoff, see EOL_SWEEP_DTYPE
+    """
+    sweep_array_list = []
+    for cell_id, cell_dict in eol_error_save_dict.items():
+        cell_rows = np.zeros(len(cell_dict["cutoff_year_array"]), dtype=EOL_SWEEP_DTYPE)
+        cell_rows["cell_id"] = cell_id
+        cell_rows["cutoff_year"] = cell_dict["cutoff_year_array"]
+        cell_rows["eol_error"] = cell_dict["eol_error_array"]
+        cell_rows["eol_time"] = cell_dict["eol_time"]
+        cell_rows["a"] = cell_dict["a_array"]
+        cell_rows["b"] = cell_dict["b_array"]
+        sweep_array_list.append(cell_rows)
+    if len(sweep_array_list)==0:
+        return np.zeros(0, dtype=EOL_SWEEP_DTYPE)
+    return np.concatenate(sweep_array_list)
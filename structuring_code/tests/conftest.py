@@ -0,0 +1,5 @@
+import os
+import sys
+
+#structuring_code is a folder of modules, not a package, so the tests import them the same way the notebooks do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
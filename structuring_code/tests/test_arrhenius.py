@@ -0,0 +1,39 @@
+import shutil
+import numpy as np
+import pandas as pd
+from Joule_arrhenius import get_arrhenius_prediction, ARRHENIUS_THRESHOLDS
+from Joule_file_index import build_file_index
+from Joule_synthetic_data import write_synthetic_dataset
+from plotting_and_fitting_helpers import get_mean_trend, get_time_to_threshold
+
+GROUP = ("Panasonic NCR18650B", 50)
+
+
+def test_prediction_uses_file_index_paths(tmp_path):
+    save_path = str(tmp_path)+"/"
+    write_synthetic_dataset(save_path, num_cells=4, num_diags=8, points_per_step=20, seed=6)
+    #Two cells at each fit temperature in one (cell_type, SOC) group
+    cell_id_df = pd.read_csv(save_path+"Joule_cell_id.csv")
+    cell_id_df["Temperature"] = [45, 60, 45, 60]
+    cell_id_df["SOC"] = 50
+    cell_id_df.to_csv(save_path+"Joule_cell_id.csv", index=False)
+    #Only the file index knows where the summary files are
+    shutil.move(save_path+"sum_data", save_path+"moved_sum_data")
+    file_index = build_file_index(save_path, sum_path=save_path+"moved_sum_data/")
+
+    time_grid = np.linspace(1, 400, 200)
+    _, predicted_cap_dict, threshold_df = get_arrhenius_prediction(file_index, time_grid=time_grid)
+    assert list(predicted_cap_dict)==[GROUP]
+    assert np.isfinite(predicted_cap_dict[GROUP]).any()
+
+    #The 45C times to threshold are the ones of the mean trend of the 45C cells
+    mean_45 = get_mean_trend(["S00001_sum.json", "S00003_sum.json"], save_path+"moved_sum_data/",
+                             "RPT0.2C_2_D_capacity", True, time_grid=time_grid)[0]
+    expected_time = get_time_to_threshold(time_grid, mean_45[None, :], np.array(ARRHENIUS_THRESHOLDS))[0]
+    assert np.isfinite(expected_time).any()
+    np.testing.assert_array_equal(threshold_df["time_45C(weeks)"].to_numpy(), expected_time)
+
+    #A sum_path that is passed is not used to find the files
+    _, wrong_path_dict, wrong_path_df = get_arrhenius_prediction(file_index, save_path+"sum_data/", time_grid=time_grid)
+    np.testing.assert_array_equal(wrong_path_dict[GROUP], predicted_cap_dict[GROUP])
+    pd.testing.assert_frame_equal(wrong_path_df, threshold_df)
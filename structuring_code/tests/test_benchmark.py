@@ -0,0 +1,29 @@
+import numpy as np
+from Joule_benchmark import benchmark_stage
+from Joule_result_cache import get_result_cache
+from plotting_and_fitting_helpers import local_reg_adjust_window
+
+
+def test_benchmark_stage_does_not_use_result_cache():
+    time_points = np.arange(30, dtype=float)
+    args_list = [(time_points, 100-0.1*time_points**0.5)]
+    cache = get_result_cache()
+    #Smooth once so the process wide cache already has the result
+    local_reg_adjust_window(*args_list[0])
+    hits, misses = cache.hits, cache.misses
+
+    calls = []
+    def smooth(time_points, metric_points):
+        calls.append(get_result_cache())
+        return local_reg_adjust_window(time_points, metric_points)
+
+    stage_dict = benchmark_stage("local_reg_adjust_window", smooth, args_list, rows_fun=len)
+    assert calls==[None, None]
+    assert (cache.hits, cache.misses)==(hits, misses)
+    assert get_result_cache() is cache
+    assert stage_dict["rows"]==30
+
+    #With use_result_cache each run starts from its own empty cache
+    benchmark_stage("local_reg_adjust_window", smooth, args_list, use_result_cache=True)
+    assert calls[2] is not cache and calls[3] is not cache and calls[2] is not calls[3]
+    assert (cache.hits, cache.misses)==(hits, misses)
@@ -0,0 +1,40 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from Joule_compact_sum import load_compact_sum_obj, compact_sum_obj, parse_sum_dates
+from Joule_sum_data_builder import load_sum_obj
+from Joule_synthetic_data import write_synthetic_dataset
+
+
+@pytest.fixture(scope="module")
+def sum_file(tmp_path_factory):
+    save_path = tmp_path_factory.mktemp("compact")
+    write_synthetic_dataset(str(save_path), num_cells=1, num_diags=5, points_per_step=30, seed=5)
+    return str(save_path/"sum_data"/"S00001_sum.json")
+
+def test_round_trip_float64(sum_file):
+    sum_obj = load_sum_obj(sum_file)
+    compact_obj = compact_sum_obj(sum_obj, dtype=np.float64, keep_meta_data=True)
+    pd.testing.assert_frame_equal(compact_obj.to_dataframe(), sum_obj.summary_data, check_exact=True)
+    round_trip_obj = compact_obj.to_sum_obj()
+    assert round_trip_obj.meta_data==sum_obj.meta_data and round_trip_obj.comment==sum_obj.comment
+
+    #The json loader only differs from pandas' float parser in the last bits
+    pd.testing.assert_frame_equal(load_compact_sum_obj(sum_file, dtype=np.float64).to_dataframe(), sum_obj.summary_data,
+                                  check_exact=False, rtol=1e-15)
+
+def test_float32_columns(sum_file):
+    sum_obj = load_sum_obj(sum_file)
+    compact_obj = load_compact_sum_obj(sum_file)
+    assert compact_obj.values.dtype==np.float32 and compact_obj.meta_data is None
+    assert len(compact_obj)==len(sum_obj.summary_data)
+    np.testing.assert_allclose(compact_obj["RPT0.2C_2_D_capacity"], sum_obj.summary_data["RPT0.2C_2_D_capacity"], rtol=1e-7)
+    np.testing.assert_allclose(compact_obj.get_time_points(), np.array(sum_obj.summary_data["Calendar_DateTime(days)"])/7)
+    assert np.shares_memory(compact_obj["diag_num"], compact_obj.values)
+
+def test_parse_sum_dates_matches_strptime():
+    date_strings = ["2014-01-01", "2014-7-2", "2015-12-31"]
+    expected = [np.datetime64(datetime.strptime(x, "%Y-%m-%d").date()) for x in date_strings]
+    np.testing.assert_array_equal(parse_sum_dates(date_strings), np.array(expected, dtype="datetime64[D]"))
+    np.testing.assert_array_equal(parse_sum_dates(date_strings[::2]), np.array(expected[::2], dtype="datetime64[D]"))
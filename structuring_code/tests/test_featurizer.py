@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from Joule_raw_data_builder import load_raw_obj, build_segment_index
+from Joule_sum_data_builder import generate_featurized_df, generate_featurized_df_by_diag
+from Joule_synthetic_data import make_synthetic_raw_data, write_synthetic_dataset
+
+CELL_TYPE = "Panasonic NCR18650B"
+
+
+def _load_synthetic_cell(save_path, corrupt_fraction, coerce_types):
+    """
+    Writes a one cell synthetic dataset and loads its raw object back, so the raw data has the
+    types of a real {cell_id}_raw.json file.
+    """
+    write_synthetic_dataset(str(save_path), num_cells=1, num_diags=6, points_per_step=30,
+                            corrupt_fraction=corrupt_fraction, write_sum=False, seed=1)
+    return load_raw_obj(os.path.join(str(save_path), "raw_data", "S00001_raw.json"), coerce_types=coerce_types)
+
+@pytest.mark.parametrize("corrupt_fraction,coerce_types", [(0.0, True), (0.02, True), (0.02, False)])
+def test_vectorized_matches_by_diag(tmp_path, corrupt_fraction, coerce_types):
+    raw_obj = _load_synthetic_cell(tmp_path, corrupt_fraction, coerce_types)
+    #Corrupted energies are strings without coerce_types and nan with it
+    num_corrupted = (pd.to_numeric(raw_obj.raw_data["Energy (Wh)"], errors="coerce").isna()).sum()
+    assert (num_corrupted>0)==(corrupt_fraction>0)
+
+    df_vectorized = generate_featurized_df(raw_obj.raw_data, CELL_TYPE, segment_index=raw_obj.segment_index)
+    df_by_diag = generate_featurized_df_by_diag(raw_obj.raw_data, CELL_TYPE)
+    pd.testing.assert_frame_equal(df_vectorized, df_by_diag, check_exact=True)
+    #Building the segment index inside generate_featurized_df gives the same output
+    pd.testing.assert_frame_equal(generate_featurized_df(raw_obj.raw_data, CELL_TYPE), df_by_diag, check_exact=True)
+
+def test_failed_diagnostic_is_skipped():
+    raw_data = make_synthetic_raw_data(num_diags=4, points_per_step=30, seed=2)
+    #Drop the last cycles of diagnostic 1 so it does not complete 7 cycles
+    diag_cycles = sorted(set(raw_data.loc[raw_data["diag_num"]==1, "Cycle"]))
+    raw_data = raw_data[~((raw_data["diag_num"]==1) & raw_data["Cycle"].isin(diag_cycles[5:]))].reset_index(drop=True)
+
+    df_vectorized = generate_featurized_df(raw_data, CELL_TYPE)
+    pd.testing.assert_frame_equal(df_vectorized, generate_featurized_df_by_diag(raw_data, CELL_TYPE), check_exact=True)
+    assert list(df_vectorized["diag_num"])==[0, 2, 3]
+
+def test_charge_without_cc_rows_raises():
+    raw_data = make_synthetic_raw_data(num_diags=3, points_per_step=30, seed=3)
+    #Without currents no row of the charge counts as CC, so there is no CC charge capacity to take
+    cycle = sorted(set(raw_data.loc[raw_data["diag_num"]==1, "Cycle"]))[2]
+    charge_rows = (raw_data["Cycle"]==cycle) & (raw_data["MD"]=="C")
+    raw_data.loc[charge_rows, "Current (A)"] = np.nan
+
+    segment_index = build_segment_index(raw_data)
+    charge_segment = segment_index[(segment_index["Cycle"]==cycle) & (segment_index["MD"]=="C")]
+    assert (charge_segment["cc_end"]==charge_segment["start"]).all()
+
+    with pytest.raises(IndexError):
+        generate_featurized_df_by_diag(raw_data, CELL_TYPE)
+    with pytest.raises(IndexError):
+        generate_featurized_df(raw_data, CELL_TYPE, segment_index=segment_index)
@@ -0,0 +1,57 @@
+import os
+import io
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import Joule_file_io
+from Joule_file_io import atomic_write, write_json_dict, write_json_objects
+from Joule_raw_data_builder import cellLife_raw_obj, load_raw_obj
+
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    file_path = str(tmp_path/"data.json")
+    with atomic_write(file_path) as outfile:
+        outfile.write("old")
+    with pytest.raises(Exception, match="File already exists"):
+        with atomic_write(file_path) as outfile:
+            outfile.write("new")
+    with pytest.raises(ZeroDivisionError):
+        with atomic_write(file_path, overwrite=True) as outfile:
+            outfile.write("partly written")
+            1/0
+    with open(file_path, "r") as openfile:
+        assert openfile.read()=="old"
+    #No temporary files are left behind
+    assert os.listdir(str(tmp_path))==["data.json"]
+
+    with atomic_write(file_path, overwrite=True) as outfile:
+        outfile.write("new")
+    with open(file_path, "r") as openfile:
+        assert openfile.read()=="new"
+
+def test_write_json_dict_matches_json_dump(tmp_path, monkeypatch):
+    #Small chunks so every column is written in several pieces
+    monkeypatch.setattr(Joule_file_io, "JSON_WRITE_CHUNK_ROWS", 2)
+    df = pd.DataFrame({"Voltage (V)": [3.1, np.nan, 3.3], "Note": ['a "quoted", value', "back\\slash", "é\n"],
+                       "Capacity/Ah": [1, 2, 3], "Date": pd.to_datetime(["2014-01-01", "2014-07-02", "2015-01-01"])},
+                      index=[4, 0, 9])
+    dict_to_save = {"meta_data": {"key": [1, 2]}, "raw_data": df, "comment": "N/A"}
+    with atomic_write(str(tmp_path/"data.json")) as outfile:
+        write_json_dict(outfile, dict_to_save, dataframe_keys=["raw_data"])
+    with open(str(tmp_path/"data.json"), "r") as openfile:
+        written = openfile.read()
+    assert written==json.dumps(dict(dict_to_save, raw_data=df.to_json()))
+
+    #Frames df.to_json() can't write raise the same error instead of writing duplicate keys
+    with pytest.raises(ValueError, match="columns must be unique"):
+        write_json_dict(io.StringIO(), {"raw_data": pd.DataFrame([[1, 2]], columns=["a", "a"])}, ["raw_data"])
+
+def test_write_json_objects_reports_failures(tmp_path):
+    raw_data = pd.DataFrame({"Voltage (V)": [3.1, 3.2]})
+    obj_list = [cellLife_raw_obj(meta_data={}, raw_data=raw_data, comment=str(x)) for x in range(2)]
+    file_path_list = [str(tmp_path/"A_raw.json"), str(tmp_path/"missing"/"B_raw.json")]
+    files_failed = write_json_objects(obj_list, file_path_list)
+    assert [x[0] for x in files_failed]==[file_path_list[1]]
+    assert files_failed[0][1].startswith("FileNotFoundError: ")
+    assert load_raw_obj(file_path_list[0]).comment=="0"
@@ -0,0 +1,55 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from Joule_file_index import build_file_index
+from Joule_synthetic_data import write_synthetic_dataset
+from plotting_and_fitting_helpers import (get_sum_obj_list, get_mean_trend, load_t_x_fit_data,
+                                          get_eol_error_sweep_batch)
+
+CAP_METRIC = "RPT0.2C_2_D_capacity"
+
+
+@pytest.fixture(scope="module")
+def moved_dataset(tmp_path_factory):
+    """
+    Synthetic dataset whose summary files were moved after indexing, so only the file index
+    knows where they are.
+    """
+    save_path = str(tmp_path_factory.mktemp("dataset"))+"/"
+    write_synthetic_dataset(save_path, num_cells=3, num_diags=12, points_per_step=20)
+    shutil.move(save_path+"sum_data", save_path+"moved_sum_data")
+    file_index = build_file_index(save_path, sum_path=save_path+"moved_sum_data/")
+    return save_path, file_index
+
+def test_helpers_resolve_files_through_index(moved_dataset):
+    save_path, file_index = moved_dataset
+    sum_obj_list = get_sum_obj_list(file_index)
+    moved_sum_path = save_path+"moved_sum_data/"
+
+    #The old sum_path does not exist anymore, the index is used to find the files
+    for streaming in [False, True]:
+        mean_trend = get_mean_trend(sum_obj_list, save_path+"sum_data/", CAP_METRIC, True, streaming=streaming,
+                                    file_index=file_index)
+        expected = get_mean_trend(sum_obj_list, moved_sum_path, CAP_METRIC, True, streaming=streaming)
+        for value, expected_value in zip(mean_trend, expected):
+            np.testing.assert_array_equal(value, expected_value)
+
+    fit_data = load_t_x_fit_data(sum_obj_list, save_path+"sum_data/", file_index=file_index)
+    expected = load_t_x_fit_data(sum_obj_list, moved_sum_path)
+    assert fit_data[0]==expected[0]
+    for value, expected_value in zip(fit_data[1]+fit_data[2], expected[1]+expected[2]):
+        np.testing.assert_array_equal(value, expected_value)
+
+def test_eol_sweep_resolves_files_through_index(moved_dataset):
+    save_path, file_index = moved_dataset
+    #A high eol_cond so the synthetic cells reach it
+    sweep_array, failed_cells = get_eol_error_sweep_batch(["S00001", "S00009"], save_path+"sum_data/", eol_cond=99,
+                                                          seed=0, file_index=file_index)
+    expected_array, _ = get_eol_error_sweep_batch(["S00001"], save_path+"moved_sum_data/", eol_cond=99, seed=0)
+    assert len(sweep_array)>0
+    for name in sweep_array.dtype.names:
+        np.testing.assert_array_equal(sweep_array[name], expected_array[name])
+    #Cells that are not in the index fail instead of stopping the sweep
+    assert [cell_id for cell_id, _ in failed_cells]==["S00009"]
+    assert not os.path.exists(save_path+"sum_data")
@@ -0,0 +1,21 @@
+import os
+from Joule_pipeline import main
+from Joule_synthetic_data import write_synthetic_dataset
+
+
+def test_build_command(tmp_path, capsys):
+    write_synthetic_dataset(str(tmp_path), num_cells=2, num_diags=3, points_per_step=30, write_sum=False)
+    sum_path = str(tmp_path/"sum_data")
+    assert main(["build", "--code-path", str(tmp_path), "--raw-path", str(tmp_path/"raw_data"),
+                 "--sum-path", sum_path])==0
+    assert sorted(os.listdir(sum_path))==["S00001_sum.json", "S00002_sum.json"]
+    assert capsys.readouterr().err.count("cells failed")==0
+
+def test_empty_cell_selection_exits_with_error(tmp_path, capsys):
+    write_synthetic_dataset(str(tmp_path), num_cells=1, num_diags=3, points_per_step=30, write_sum=False)
+    capsys.readouterr()
+    assert main(["build", "--code-path", str(tmp_path), "--raw-path", str(tmp_path/"raw_data"),
+                 "--sum-path", str(tmp_path/"sum_data"), "--cell-id", "S99999"])==1
+    err = capsys.readouterr().err
+    assert err.startswith("Error: No cells in Joule_cell_id.csv match")
+    assert "Traceback" not in err
@@ -0,0 +1,43 @@
+import os
+import asyncio
+import numpy as np
+from Joule_query_service import sum_query_service
+from Joule_sum_data_builder import load_sum_obj
+from Joule_synthetic_data import write_synthetic_dataset
+from plotting_and_fitting_helpers import get_mean_trend
+
+CAP_METRIC = "RPT0.2C_2_D_capacity"
+
+
+def test_mean_trend_uses_cells_in_memory(tmp_path):
+    save_path = str(tmp_path)+"/"
+    sum_path = save_path+"sum_data/"
+    write_synthetic_dataset(save_path, num_cells=3, num_diags=12, points_per_step=20)
+    sum_obj_list = sorted(os.listdir(sum_path))
+    expected = get_mean_trend(sum_obj_list, sum_path, CAP_METRIC, True)
+
+    async def run_requests():
+        service = sum_query_service(sum_path, save_path, num_workers=1, reload_interval=None)
+        await service.start()
+        try:
+            first = await service.handle_request("mean_trend", {"metric": CAP_METRIC})
+            #Files changed or removed since the last reload are not read, the cells in memory are used
+            sum_obj = load_sum_obj(sum_path+sum_obj_list[0])
+            sum_obj.summary_data[CAP_METRIC] *= 0.5
+            sum_obj.to_json_file(sum_path+sum_obj_list[0], overwrite=True)
+            os.remove(sum_path+sum_obj_list[1])
+            second = await service.handle_request("mean_trend", {"metric": CAP_METRIC, "normalize": "false"})
+            await service.reload()
+            third = await service.handle_request("mean_trend", {"metric": CAP_METRIC, "normalize": "false"})
+            return first, second, third, service.cache_misses
+        finally:
+            await service.stop()
+
+    first, second, third, cache_misses = asyncio.run(run_requests())
+    np.testing.assert_allclose(np.array(first["mean"], dtype=float), expected[0], rtol=1e-12)
+    np.testing.assert_allclose(np.array(first["time(weeks)"]), expected[2])
+    assert first["num_cells"]==list(expected[3])
+    assert len(second["cells"])==3 and max(second["num_cells"])==3
+    #After the reload the removed cell is gone and the changed one is used
+    assert len(third["cells"])==2 and third["mean"]!=second["mean"]
+    assert cache_misses==3
@@ -0,0 +1,26 @@
+import os
+import numpy as np
+from Joule_raw_curve_cache import convert_raw_to_curve_cache, load_raw_curve_cache
+from Joule_raw_data_builder import load_raw_obj
+from Joule_synthetic_data import write_synthetic_dataset
+
+
+def test_convert_raw_to_curve_cache_records_errors(tmp_path):
+    write_synthetic_dataset(str(tmp_path), num_cells=1, num_diags=3, points_per_step=30, write_sum=False)
+    raw_path = str(tmp_path/"raw_data")+"/"
+    cache_path = str(tmp_path/"cache")+"/"
+    os.makedirs(cache_path)
+    with open(raw_path+"S00002_raw.json", "w") as outfile:
+        outfile.write("{not json")
+
+    files_failed, errors_list = convert_raw_to_curve_cache(raw_path, cache_path, return_errors=True)
+    assert files_failed==["S00002_raw.json"]
+    assert errors_list[0][0]=="S00002_raw.json" and errors_list[0][1].startswith("JSONDecodeError: ")
+
+    raw_data = load_raw_obj(raw_path+"S00001_raw.json").raw_data
+    curve_cache = load_raw_curve_cache(cache_path+"S00001")
+    np.testing.assert_array_equal(curve_cache.get_segment(1)["Voltage (V)"],
+                                  raw_data.loc[raw_data["diag_num"]==1, "Voltage (V)"].to_numpy())
+    #Without overwrite the existing cache is reported instead of replaced
+    errors_list = convert_raw_to_curve_cache(raw_path, cache_path, return_errors=True)[1]
+    assert errors_list[0]==("S00001_raw.json", "Exception: File already exists")
@@ -0,0 +1,62 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from Joule_raw_data_builder import load_raw_obj, build_segment_index, convert_raw_json_to_parquet
+from Joule_sum_data_builder import generate_sum_data_cell_id
+from Joule_synthetic_data import write_synthetic_dataset
+
+
+def test_corrupted_rows_only_recorded_when_found(tmp_path):
+    write_synthetic_dataset(str(tmp_path/"clean"), num_cells=1, num_diags=3, points_per_step=30, write_sum=False)
+    write_synthetic_dataset(str(tmp_path/"corrupt"), num_cells=1, num_diags=3, points_per_step=30,
+                            corrupt_fraction=0.02, write_sum=False)
+    clean_raw_path = str(tmp_path/"clean"/"raw_data")+"/"
+    corrupt_raw_path = str(tmp_path/"corrupt"/"raw_data")+"/"
+
+    #Clean raw data keeps the meta_data it was saved with, in the raw and the summary object
+    with open(clean_raw_path+"S00001_raw.json", "r") as openfile:
+        saved_meta_data = json.load(openfile)["meta_data"]
+    assert load_raw_obj(clean_raw_path+"S00001_raw.json").meta_data==saved_meta_data
+    assert generate_sum_data_cell_id("S00001", clean_raw_path, "Panasonic NCR18650B").meta_data==saved_meta_data
+
+    raw_obj = load_raw_obj(corrupt_raw_path+"S00001_raw.json")
+    corrupted_rows = raw_obj.meta_data["corrupted_rows"]
+    assert sum(x["Energy (Wh)"] for x in corrupted_rows.values())==raw_obj.raw_data["Energy (Wh)"].isna().sum()
+    assert raw_obj.raw_data["Energy (Wh)"].dtype==np.float64
+    assert "corrupted_rows" not in load_raw_obj(corrupt_raw_path+"S00001_raw.json", coerce_types=False).meta_data
+
+def test_segment_index_built_on_first_use(tmp_path):
+    write_synthetic_dataset(str(tmp_path), num_cells=1, num_diags=3, points_per_step=30, write_sum=False)
+    raw_file = str(tmp_path/"raw_data"/"S00001_raw.json")
+    #Raw objects are saved without a segment index until something featurizes them
+    with open(raw_file, "r") as openfile:
+        assert json.load(openfile)["segment_index"] is None
+    raw_obj = load_raw_obj(raw_file)
+    assert raw_obj._segment_index is None
+
+    segment_index = raw_obj.segment_index
+    assert raw_obj.segment_index is segment_index
+    pd.testing.assert_frame_equal(segment_index, build_segment_index(raw_obj.raw_data))
+    pd.testing.assert_frame_equal(raw_obj.get_segment_rows(1), raw_obj.raw_data[raw_obj.raw_data["diag_num"]==1])
+
+    #Once built it is saved with the object and loaded back instead of rebuilt
+    raw_obj.to_json_file(raw_file, overwrite=True)
+    loaded_obj = load_raw_obj(raw_file)
+    assert loaded_obj._segment_index is not None
+    pd.testing.assert_frame_equal(loaded_obj.segment_index, segment_index, check_dtype=False)
+
+def test_convert_raw_json_to_parquet_records_errors(tmp_path):
+    write_synthetic_dataset(str(tmp_path), num_cells=1, num_diags=3, points_per_step=30, write_sum=False)
+    raw_path = str(tmp_path/"raw_data")+"/"
+    save_path = str(tmp_path/"parquet")+"/"
+    os.makedirs(save_path)
+    with open(raw_path+"S00002_raw.json", "w") as outfile:
+        outfile.write("{not json")
+
+    files_failed, errors_list = convert_raw_json_to_parquet(raw_path, save_path, return_errors=True)
+    assert files_failed==["S00002_raw.json"]
+    assert errors_list[0][0]=="S00002_raw.json" and errors_list[0][1].startswith("JSONDecodeError: ")
+    assert os.listdir(save_path)==["S00001_raw.parquet"]
+    #Without overwrite the existing parquet file is reported instead of replaced
+    assert convert_raw_json_to_parquet(raw_path, save_path)==["S00001_raw.json", "S00002_raw.json"]
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from Joule_raw_data_builder import cellLife_raw_obj, load_raw_obj
+from Joule_raw_stream import stream_raw_obj
+from Joule_synthetic_data import make_synthetic_raw_data
+
+#Strings that need escaping in the json and that look like the json around them once escaped
+ESCAPED_STRINGS = ['say "hi"', 'a,"b', 'ends with,', '}{', 'back\\slash', '\\"', 'tab\tnew\nline', 'café ✓', '",":{']
+
+
+def _make_raw_data(seed):
+    raw_data = make_synthetic_raw_data(num_diags=4, points_per_step=20, corrupt_fraction=0.02, seed=seed)
+    rng = np.random.default_rng(seed)
+    raw_data["Note"] = rng.choice(ESCAPED_STRINGS, size=len(raw_data))
+    #Corrupted entries that need escaping as well
+    energy = raw_data["Energy (Wh)"].astype(object)
+    energy.iloc[rng.choice(len(raw_data), size=5, replace=False)] = rng.choice(ESCAPED_STRINGS, size=5)
+    raw_data["Energy (Wh)"] = energy
+    return raw_data
+
+def _assert_stream_matches_load(file_path, **stream_kwargs):
+    raw_obj = load_raw_obj(file_path)
+    raw_stream = stream_raw_obj(file_path, **stream_kwargs)
+    streamed_list = list(raw_stream)
+
+    expected_list = list(raw_obj.raw_data.groupby("diag_num"))
+    assert [diag_num for diag_num, _ in streamed_list]==[diag_num for diag_num, _ in expected_list]
+    for (_, df_diag), (_, expected_df) in zip(streamed_list, expected_list):
+        pd.testing.assert_frame_equal(df_diag, expected_df, check_exact=True)
+    assert raw_stream.meta_data==raw_obj.meta_data
+    assert raw_stream.comment==raw_obj.comment
+
+@pytest.mark.parametrize("chunk_size", [251, 4099, 2**18])
+def test_json_stream_matches_load(tmp_path, chunk_size):
+    raw_obj = cellLife_raw_obj(meta_data={"test": 'meta "data"'}, raw_data=_make_raw_data(0), comment='a "comment",')
+    raw_obj.to_json_file(str(tmp_path/"S00001_raw.json"))
+    _assert_stream_matches_load(str(tmp_path/"S00001_raw.json"), chunk_size=chunk_size, temp_path=str(tmp_path))
+
+def test_stream_yields_sorted_diag_nums(tmp_path):
+    #Diagnostics out of order and split in two runs are yielded once each, in increasing diag_num order
+    raw_data = _make_raw_data(1)
+    diag_order = [2, 0, 3, 1, 2]
+    blocks = [raw_data[raw_data["diag_num"]==diag_num] for diag_num in diag_order]
+    blocks[0], blocks[-1] = blocks[0].iloc[:len(blocks[0])//2], blocks[-1].iloc[len(blocks[-1])//2:]
+    raw_obj = cellLife_raw_obj(meta_data={}, raw_data=pd.concat(blocks), comment="unsorted")
+    raw_obj.to_json_file(str(tmp_path/"S00001_raw.json"))
+    raw_obj.to_parquet_file(str(tmp_path/"S00001_raw.parquet"))
+    _assert_stream_matches_load(str(tmp_path/"S00001_raw.json"), chunk_size=1000)
+
+    parquet_list = list(stream_raw_obj(str(tmp_path/"S00001_raw.parquet")))
+    assert [diag_num for diag_num, _ in parquet_list]==[0, 1, 2, 3]
+    assert list(parquet_list[2][1].index)==list(raw_obj.raw_data.index[raw_obj.raw_data["diag_num"]==2])
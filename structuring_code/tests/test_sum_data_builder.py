@@ -0,0 +1,41 @@
+import os
+import pytest
+import Joule_sum_data_builder
+from Joule_sum_data_builder import generate_sum_data
+from Joule_synthetic_data import write_synthetic_dataset
+
+CELL_TYPE = "Panasonic NCR18650B"
+
+
+def _crash_chunk(*args, **kwargs):
+    #Kills the worker process the same way an out of memory kill would
+    os._exit(1)
+
+@pytest.fixture
+def dataset_path(tmp_path):
+    save_path = str(tmp_path)+"/"
+    write_synthetic_dataset(save_path, num_cells=4, num_diags=3, points_per_step=20, write_sum=False)
+    #A raw file that can't be loaded
+    with open(save_path+"raw_data/S00003_raw.json", "w") as outfile:
+        outfile.write("{")
+    os.makedirs(save_path+"sum_data")
+    return save_path
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_files_failed_is_cell_ids(dataset_path, num_workers):
+    files_failed = generate_sum_data(CELL_TYPE, dataset_path+"raw_data/", dataset_path+"sum_data/", dataset_path,
+                                     num_workers=num_workers)
+    assert files_failed==["S00003"]
+    assert sorted(os.listdir(dataset_path+"sum_data"))==["S00001_sum.json", "S00002_sum.json", "S00004_sum.json"]
+
+    files_failed, errors_list = generate_sum_data(CELL_TYPE, dataset_path+"raw_data/", dataset_path+"sum_data/",
+                                                  dataset_path, num_workers=num_workers, return_errors=True)
+    assert files_failed==["S00003"]
+    assert errors_list[0][0]=="S00003" and errors_list[0][1].startswith("JSONDecodeError")
+
+def test_crashed_worker_fails_its_cells(dataset_path, monkeypatch):
+    monkeypatch.setattr(Joule_sum_data_builder, "_generate_and_save_sum_data_chunk", _crash_chunk)
+    files_failed, errors_list = generate_sum_data(CELL_TYPE, dataset_path+"raw_data/", dataset_path+"sum_data/",
+                                                  dataset_path, num_workers=2, return_errors=True)
+    assert files_failed==["S00001", "S00002", "S00003", "S00004"]
+    assert all(error.startswith("BrokenProcessPool") for _, error in errors_list)
@@ -0,0 +1,63 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from Joule_sum_store import build_sum_store, query_sum_store
+from Joule_synthetic_data import write_synthetic_dataset
+from plotting_and_fitting_helpers import get_mean_trend, get_interp_metric_matrix, load_t_x_fit_data
+
+CAP_METRIC = "RPT0.2C_2_D_capacity"
+
+
+def test_rebuilt_store_drops_removed_cells(tmp_path):
+    write_synthetic_dataset(str(tmp_path), num_cells=4, num_diags=3, points_per_step=30, seed=4)
+    code_path = str(tmp_path)+"/"
+    sum_path = str(tmp_path/"sum_data")+"/"
+    store_path = str(tmp_path/"store")
+    assert build_sum_store(sum_path, code_path, store_path)==[]
+    assert sorted(query_sum_store(store_path, "RPT0.2C_2_D_capacity"))==["S00001", "S00002", "S00003", "S00004"]
+
+    #Only keep the cells in one partition so every other partition folder has to be deleted
+    cell_id_df = pd.read_csv(code_path+"Joule_cell_id.csv")
+    kept_row = cell_id_df.iloc[0]
+    kept_df = cell_id_df[(cell_id_df["SOC"]==kept_row["SOC"]) & (cell_id_df["Temperature"]==kept_row["Temperature"])]
+    for cell_id in set(cell_id_df["Cell_id"])-set(kept_df["Cell_id"]):
+        os.remove(sum_path+"{}_sum.json".format(cell_id))
+    assert len(kept_df)<len(cell_id_df)
+
+    build_sum_store(sum_path, code_path, store_path)
+    assert sorted(query_sum_store(store_path, "RPT0.2C_2_D_capacity"))==sorted(kept_df["Cell_id"])
+
+def test_no_summary_data_raises(tmp_path):
+    write_synthetic_dataset(str(tmp_path), num_cells=2, num_diags=3, points_per_step=30, seed=4)
+    shutil.rmtree(str(tmp_path/"sum_data"))
+    os.makedirs(str(tmp_path/"sum_data"))
+    with pytest.raises(Exception, match="No summary data found"):
+        build_sum_store(str(tmp_path/"sum_data")+"/", str(tmp_path)+"/", str(tmp_path/"store"))
+
+def test_helpers_read_from_store(tmp_path):
+    write_synthetic_dataset(str(tmp_path), num_cells=3, num_diags=12, points_per_step=20, seed=7)
+    code_path = str(tmp_path)+"/"
+    sum_path = str(tmp_path/"sum_data")+"/"
+    store_path = str(tmp_path/"store")
+    build_sum_store(sum_path, code_path, store_path)
+    #S00009 has no summary data, it is left out like a file without enough rows
+    sum_obj_list = ["S00002_sum.json", "S00001_sum.json", "S00009_sum.json", "S00003_sum.json"]
+
+    for streaming in [False, True]:
+        store_trend = get_mean_trend(sum_obj_list, None, CAP_METRIC, True, streaming=streaming, store_path=store_path)
+        file_trend = get_mean_trend([x for x in sum_obj_list if x!="S00009_sum.json"], sum_path, CAP_METRIC, True,
+                                    streaming=streaming)
+        for store_value, file_value in zip(store_trend, file_trend):
+            np.testing.assert_array_equal(store_value, file_value)
+
+    store_matrix = get_interp_metric_matrix(sum_obj_list, None, CAP_METRIC, False, store_path=store_path)
+    assert store_matrix[2]==["S00002_sum.json", "S00001_sum.json", "S00003_sum.json"]
+
+    for metric_type in ["cap", "res"]:
+        store_fit_data = load_t_x_fit_data(sum_obj_list[:2], None, metric_type=metric_type, store_path=store_path)
+        file_fit_data = load_t_x_fit_data(sum_obj_list[:2], sum_path, metric_type=metric_type)
+        assert store_fit_data[0]==file_fit_data[0]
+        for store_points, file_points in zip(store_fit_data[1]+store_fit_data[2], file_fit_data[1]+file_fit_data[2]):
+            np.testing.assert_array_equal(store_points, file_points)